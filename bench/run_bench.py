@@ -0,0 +1,217 @@
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+from Indicator import apply_technical_indicators, apply_technical_indicators_incremental, apply_technical_indicators_panel, calculate_obv  # noqa: E402
+from bar_resample import resample_bars  # noqa: E402
+from bing_new import parse_bing_results  # noqa: E402
+from news_extractors import extract_article  # noqa: E402
+from news_pipeline import parse_news_date  # noqa: E402
+from output_io import OUTPUT_FORMATS, write_frame  # noqa: E402
+from synthetic import SHAPES, load_corpus, make_ohlcv, make_universe  # noqa: E402
+
+# --------------------------------------------------
+# 離線微基準測試
+#    - 技術指標（逐檔與 panel）、OBV、K 棒合成：合成資料，大小比照實際輸出（1y 日線、7d 1m、60d 5m），股票數可調
+#    - 新聞：Bing 日期與搜尋結果解析、各站內文擷取（corpus/ 內的 HTML）
+#    - 輸出：write_frame 各格式
+#    - 每個項目量測耗時（中位數 / 最小值）與 tracemalloc 記憶體峰值，並與 baseline.json 比較
+#      （tracemalloc 只追蹤 Python 端配置，lxml 等 C 擴充的記憶體不計入）
+#    - 任一項目超過門檻即以結束碼 1 結束
+# 用法：
+#    python bench/run_bench.py                      # 執行並與 baseline 比較
+#    python bench/run_bench.py --save-baseline      # 以本次結果更新 baseline
+#    python bench/run_bench.py --filter extract --tickers 1
+# --------------------------------------------------
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_TICKERS = (1, 50, 500)
+# 與 baseline 的差距小於此秒數 / KB 時不視為退步（避免極短項目的量測雜訊）
+_MIN_TIME_DELTA = 0.0005
+_MIN_MEM_DELTA_KB = 64
+
+_BING_DATES = ["3 小時前", "45 分鐘前", "2 天前", "2026年10月15日", "Oct 10, 2026"] * 200
+
+
+def build_cases(tickers, tmp_dir: Path) -> dict:
+    """
+    :return: {項目名稱: setup()}；setup() 建立輸入資料並回傳受測的無參數函式
+    """
+    cases = {}
+    for shape in SHAPES:
+        for n in tickers:
+            def _indicators(shape=shape, n=n):
+                frames = make_universe(shape, n)
+                return lambda: [apply_technical_indicators(df) for df in frames]
+
+            def _panel(shape=shape, n=n):
+                frames = dict(enumerate(make_universe(shape, n)))
+                return lambda: apply_technical_indicators_panel(frames)
+
+            def _obv(shape=shape, n=n):
+                frames = make_universe(shape, n)
+                return lambda: [calculate_obv(df) for df in frames]
+
+            cases[f"indicators.{shape}[{n}]"] = _indicators
+            cases[f"indicators_panel.{shape}[{n}]"] = _panel
+            cases[f"obv.{shape}[{n}]"] = _obv
+
+    for n in tickers:
+        def _resample(n=n):
+            frames = make_universe("5m_60d", n)
+            return lambda: [resample_bars(df, iv) for df in frames for iv in ("15m", "30m", "60m")]
+
+        cases[f"resample.5m_60d[{n}]"] = _resample
+
+    def _incremental():
+        # 日線已有狀態，新增最後一根
+        df = make_ohlcv("daily_1y")
+        _, state = apply_technical_indicators_incremental(df.iloc[:-1])
+        return lambda: apply_technical_indicators_incremental(df.iloc[-1:], state)
+
+    cases["indicators_incremental.daily_1y[1]"] = _incremental
+    cases["parse_bing_date[1000]"] = lambda: (lambda: [parse_news_date(s) for s in _BING_DATES])
+
+    corpus = load_corpus()
+    for name, (url, html) in corpus.items():
+        if name == "bing_search":
+            cases["parse_bing_results"] = lambda html=html: (lambda: parse_bing_results(html))
+        else:
+            cases[f"extract_article.{name}"] = lambda url=url, html=html: (lambda: extract_article(url, html))
+
+    for fmt in OUTPUT_FORMATS:
+        def _write(fmt=fmt):
+            df = apply_technical_indicators(make_ohlcv("5m_60d"))
+            return lambda: write_frame(df, str(tmp_dir), f"bench_{fmt}", fmt=fmt)
+
+        cases[f"write_frame.{fmt}.5m_60d[1]"] = _write
+    return cases
+
+
+def measure(fn, min_time: float = 1.0, min_repeat: int = 3, max_repeat: int = 50) -> dict:
+    """
+    重複執行至少 min_repeat 次、累計 min_time 秒（至多 max_repeat 次），另以 tracemalloc 量測一次記憶體峰值
+    """
+    fn()  # 預熱：載入模組、建立快取
+    times = []
+    while len(times) < min_repeat or (sum(times) < min_time and len(times) < max_repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "median": round(statistics.median(times), 7),
+        "min": round(min(times), 7),
+        "repeat": len(times),
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, time_threshold: float, mem_threshold: float) -> list[str]:
+    """
+    :return: 退步項目的說明；baseline 中沒有的項目不比較
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        if r["median"] - b["median"] > _MIN_TIME_DELTA and r["median"] > b["median"] * (1 + time_threshold):
+            regressions.append(f"{name} 耗時 {b['median'] * 1000:.2f} → {r['median'] * 1000:.2f} ms（+{(r['median'] / b['median'] - 1) * 100:.0f}%）")
+        if r["peak_kb"] - b["peak_kb"] > _MIN_MEM_DELTA_KB and r["peak_kb"] > b["peak_kb"] * (1 + mem_threshold):
+            regressions.append(f"{name} 記憶體峰值 {b['peak_kb']:.0f} → {r['peak_kb']:.0f} KB")
+    return regressions
+
+
+def _environment() -> dict:
+    import numpy
+    import pandas
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+    }
+
+
+def _format_row(name, r, b):
+    diff = f"{(r['median'] / b['median'] - 1) * 100:+.0f}%" if b else "-"
+    return f"{name:<42} {r['median'] * 1000:>10.2f} {r['min'] * 1000:>10.2f} {r['peak_kb']:>11.0f} {diff:>8}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="離線微基準測試（技術指標、新聞解析、檔案輸出）")
+    parser.add_argument("--tickers", type=str, default=",".join(map(str, DEFAULT_TICKERS)), help="合成資料的股票數，以逗號分隔")
+    parser.add_argument("--filter", type=str, default=None, help="只執行名稱包含此字串的項目")
+    parser.add_argument("--baseline", type=str, default=str(DEFAULT_BASELINE), help="baseline JSON 路徑")
+    parser.add_argument("--save-baseline", action="store_true", help="以本次結果覆寫 baseline（保留未執行項目的舊值）")
+    parser.add_argument("--threshold", type=float, default=0.25, help="耗時退步門檻（相對 baseline 的比例）")
+    parser.add_argument("--mem-threshold", type=float, default=0.25, help="記憶體峰值退步門檻（相對 baseline 的比例）")
+    parser.add_argument("--min-time", type=float, default=1.0, help="每個項目至少累計量測的秒數")
+    parser.add_argument("--output", type=str, default=None, help="另將本次結果寫入 JSON")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    tickers = [int(x) for x in args.tickers.split(",") if x.strip()]
+    baseline_path = Path(args.baseline)
+    stored = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {"results": {}}
+    baseline = stored.get("results", {})
+    env = _environment()
+    if baseline and stored.get("environment", {}).get("platform") != env["platform"]:
+        logging.warning("baseline 來自不同環境，耗時比較僅供參考；可用 --save-baseline 在本機重建")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = build_cases(tickers, Path(tmp))
+        selected = {k: v for k, v in cases.items() if not args.filter or args.filter in k}
+        logging.info(f"{'項目':<40} {'中位數 ms':>10} {'最小 ms':>10} {'峰值 KB':>10} {'vs 基準':>8}")
+        for name, setup in selected.items():
+            fn = setup()
+            results[name] = measure(fn, min_time=args.min_time)
+            del fn
+            logging.info(_format_row(name, results[name], baseline.get(name)))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps({"environment": env, "results": results}, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        merged = dict(baseline, **results)
+        baseline_path.write_text(json.dumps({"environment": env, "results": dict(sorted(merged.items()))},
+                                            ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        logging.info(f"已更新 baseline：{baseline_path}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold, args.mem_threshold)
+    missing = [name for name in results if name not in baseline]
+    if missing:
+        logging.info(f"{len(missing)} 個項目不在 baseline 中，未比較")
+    if regressions:
+        logging.error("效能退步：")
+        for line in regressions:
+            logging.error(f"  {line}")
+        return 1
+    logging.info("未發現超過門檻的退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
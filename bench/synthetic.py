@@ -0,0 +1,70 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------
+# 基準測試用的離線資料
+#    - 合成 OHLCV：交易時段（09:00–13:30，台北時間）與 yfinance 輸出相同的欄位與時區
+#    - 大小比照實際輸出：日線 1 年、1m 7 日、5m 60 日
+#    - 新聞 HTML 語料：corpus/index.json 列出各站檔案與其網址（決定使用的擷取器）
+# --------------------------------------------------
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+_TZ = "Asia/Taipei"
+_SESSION_MINUTES = 270
+
+# 名稱 -> (interval 分鐘數，0 為日線；涵蓋的日曆天數)
+SHAPES = {
+    "daily_1y": (0, 365),
+    "1m_7d": (1, 7),
+    "5m_60d": (5, 60),
+}
+
+
+def _bar_index(minutes: int, days: int, end: str = "2026-10-16") -> pd.DatetimeIndex:
+    sessions = pd.bdate_range(end=end, periods=max(1, days * 5 // 7))
+    if minutes == 0:
+        return sessions.tz_localize(_TZ)
+    offsets = pd.to_timedelta(np.arange(0, _SESSION_MINUTES, minutes), unit="m")
+    opens = sessions + pd.Timedelta(hours=9)
+    stamps = (opens.values[:, None] + offsets.values[None, :]).ravel()
+    return pd.DatetimeIndex(stamps).tz_localize(_TZ)
+
+
+def make_ohlcv(shape: str, seed: int = 0) -> pd.DataFrame:
+    """
+    產生單檔股票的合成 K 棒，欄位與 Ticker.history(auto_adjust=True) 相同
+    :param shape: SHAPES 的鍵
+    :param seed: 亂數種子，相同種子產生相同資料
+    """
+    minutes, days = SHAPES[shape]
+    index = _bar_index(minutes, days)
+    rng = np.random.default_rng(seed)
+    n = len(index)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = close * np.exp(rng.normal(0, 0.003, n))
+    spread = np.abs(rng.normal(0, 0.005, n))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.integers(1_000, 5_000_000, n)
+    return pd.DataFrame({
+        "Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume,
+        "Dividends": 0.0, "Stock Splits": 0.0,
+    }, index=index)
+
+
+def make_universe(shape: str, tickers: int) -> list[pd.DataFrame]:
+    """
+    產生多檔股票的合成 K 棒（每檔種子不同）
+    """
+    return [make_ohlcv(shape, seed=i) for i in range(tickers)]
+
+
+def load_corpus() -> dict[str, tuple[str, str]]:
+    """
+    :return: {名稱: (網址, HTML)}
+    """
+    index = json.loads((CORPUS_DIR / "index.json").read_text(encoding="utf-8"))
+    return {name: (entry["url"], (CORPUS_DIR / entry["file"]).read_text(encoding="utf-8"))
+            for name, entry in index.items()}
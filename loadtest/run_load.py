@@ -0,0 +1,205 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+from pathlib import Path
+from urllib.parse import urlparse
+
+LOADTEST_DIR = Path(__file__).resolve().parent
+SRC_DIR = LOADTEST_DIR.parent / "src"
+sys.path.insert(0, str(LOADTEST_DIR))
+
+from servers import start_stand_ins  # noqa: E402
+
+# --------------------------------------------------
+# 端對端壓測
+#    - 啟動 FinMind / Bing / 新聞網站 / Yahoo chart 的本機替身伺服器（servers.py）
+#    - 以環境變數 FINMIND_API_URL、BING_NEWS_URL 讓 src 改指向替身，在獨立行程執行完整的 run_pipeline
+#    - yfinance 的網址寫死在套件內：子行程中改寫其 curl_cffi session 的 *.yahoo.com 網址，yf.download / Ticker.history 照常執行
+#    - 依情境注入延遲、429、5xx、逾時與格式錯誤，回報吞吐量、每檔股票與各階段的 p50 / p99，並與第一個情境比較退化幅度
+# 用法：
+#    python loadtest/run_load.py --stocks 20 --workers 4 --scenarios clean,degraded
+#    python loadtest/run_load.py --scenarios hostile --set bing.p429=0.3 --stage-budget 30
+# --------------------------------------------------
+UPSTREAMS = ("finmind", "bing", "yahoo", "article")
+# 情境：{上游或 "*": Faults 參數}
+SCENARIOS = {
+    "clean": {"*": dict(latency_ms=20, latency_sigma=0.3)},
+    "slow": {"*": dict(latency_ms=150, latency_sigma=0.8)},
+    "degraded": {"*": dict(latency_ms=60, latency_sigma=0.6, p429=0.05, p5xx=0.02, pmalformed=0.02, ptimeout=0.01)},
+    "hostile": {"*": dict(latency_ms=120, latency_sigma=1.0, p429=0.15, p5xx=0.05, pmalformed=0.05, ptimeout=0.03)},
+}
+
+
+def synthetic_stocks(n: int) -> list[str]:
+    return [f"{9000 + i}_壓測{i}" for i in range(n)]
+
+
+def parse_overrides(items) -> dict:
+    """
+    解析 --set 參數，例如 bing.p429=0.3、*.latency_ms=50
+    :return: {上游: {參數: 值}}
+    """
+    out: dict[str, dict] = {}
+    for item in items or []:
+        key, _, value = item.partition("=")
+        upstream, _, param = key.partition(".")
+        if not value or not param or (upstream != "*" and upstream not in UPSTREAMS):
+            raise ValueError(f"無法解析 --set {item}（格式：<{'|'.join(UPSTREAMS)}|*>.<參數>=<值>）")
+        out.setdefault(upstream, {})[param] = float(value)
+    return out
+
+
+def apply_faults(stand_ins, scenario: dict, overrides: dict, hang_sec: float):
+    servers = {"finmind": [stand_ins.finmind], "bing": [stand_ins.bing], "yahoo": [stand_ins.yahoo], "article": stand_ins.articles}
+    for upstream, group in servers.items():
+        params = {"hang_sec": hang_sec, **scenario.get("*", {}), **scenario.get(upstream, {}),
+                  **overrides.get("*", {}), **overrides.get(upstream, {})}
+        for server in group:
+            server.faults = type(server.faults)()
+            server.faults.update(**params)
+
+
+def redirect_yfinance(base_url: str, cache_dir: str):
+    """
+    將 yfinance 對 *.yahoo.com 的請求（含 cookie / crumb）改送到替身伺服器；時區快取改存到 cache_dir
+    yf.download 每次呼叫都會換上新的 curl_cffi session，因此直接改寫 Session.request（僅限壓測子行程）
+    """
+    import yfinance as yf
+    from curl_cffi.requests import Session
+
+    target = urlparse(base_url)
+    original = Session.request
+
+    def _request(self, method, url, *args, **kwargs):
+        parts = urlparse(url)
+        if (parts.hostname or "").endswith("yahoo.com"):
+            url = parts._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+        return original(self, method, url, *args, **kwargs)
+
+    Session.request = _request
+    yf.set_tz_cache_location(cache_dir)
+
+
+def _pipeline_child(env: dict, yahoo_url: str, kwargs: dict, result_path: str, verbose: bool):
+    # 子行程：先設定環境變數再匯入 src，使各模組的上游網址指向替身伺服器
+    os.environ.update(env)
+    sys.path.insert(0, str(SRC_DIR))
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING, format="[%(levelname)s] %(message)s")
+    redirect_yfinance(yahoo_url, str(Path(kwargs["data_dir"]).parent / "yf_cache"))
+    from main import run_pipeline
+    from metrics import get_metrics
+
+    kwargs = dict(kwargs, data_dir=Path(kwargs["data_dir"]))
+    run_pipeline(**kwargs)
+    data_dir = kwargs["data_dir"]
+    summary = get_metrics().summary()
+    summary["partial_markers"] = len(list(data_dir.glob("*/_PARTIAL_*.json")))
+    summary["archives"] = len(list(data_dir.glob("*.zip")))
+    Path(result_path).write_text(json.dumps(summary, ensure_ascii=False), encoding="utf-8")
+
+
+def run_scenario(name: str, stand_ins, args, overrides: dict) -> dict:
+    apply_faults(stand_ins, SCENARIOS[name], overrides, args.hang_sec)
+    stand_ins.reset_stats()
+    stocks = synthetic_stocks(args.stocks)
+    with tempfile.TemporaryDirectory(prefix=f"loadtest_{name}_") as tmp:
+        kwargs = dict(
+            stocks=stocks, data_dir=str(Path(tmp) / "data"), finmind_token="loadtest", max_pages=args.max_pages, sleep_sec=0,
+            zip_output=True, workers=args.workers, parse_workers=args.parse_workers, host_delay=args.host_delay,
+            host_limit=args.host_concurrency, finmind_requests_per_hour=args.finmind_rph, news_sources=("bing",),
+            stock_budget=args.stock_budget, stage_budget=args.stage_budget, hedge=args.hedge,
+        )
+        result_path = Path(tmp) / "summary.json"
+        proc = multiprocessing.get_context("spawn").Process(
+            target=_pipeline_child, args=(stand_ins.env(), stand_ins.yahoo.base_url, kwargs, str(result_path), args.verbose))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0 or not result_path.exists():
+            raise RuntimeError(f"情境 {name} 執行失敗（結束碼 {proc.exitcode}）")
+        summary = json.loads(result_path.read_text(encoding="utf-8"))
+    summary["scenario"] = name
+    summary["stocks"] = len(stocks)
+    summary["throughput"] = len(stocks) / summary["wall_seconds"] if summary["wall_seconds"] else 0.0
+    summary["injected"] = stand_ins.stats()
+    return summary
+
+
+def report(summary: dict):
+    stock = summary["stages"].get("stock", {})
+    logging.info(f"== 情境 {summary['scenario']}：{summary['stocks']} 檔，{summary['wall_seconds']:.1f} 秒，"
+                 f"{summary['throughput']:.2f} 檔/秒；每檔 p50 {stock.get('p50', 0):.2f} 秒、p99 {stock.get('p99', 0):.2f} 秒；"
+                 f"部分輸出 {summary['partial_markers']}，壓縮檔 {summary['archives']}")
+    logging.info(f"   {'階段':<18}{'次數':>6}{'p50 秒':>10}{'p99 秒':>10}{'最長 秒':>10}{'失敗':>6}")
+    for name, st in sorted(summary["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+        logging.info(f"   {name:<20}{st['count']:>6}{st['p50']:>10.3f}{st['p99']:>10.3f}{st['max_seconds']:>10.3f}{st['errors']:>6}")
+    logging.info(f"   {'上游':<18}{'請求':>6}{'錯誤':>6}{'重試':>6}{'p50 秒':>10}{'p99 秒':>10}  注入（429/5xx/逾時/格式錯誤）")
+    for name, st in sorted(summary["requests"].items()):
+        inj = summary["injected"].get(name, {})
+        injected = f"{inj.get('throttled', 0)}/{inj.get('errors', 0)}/{inj.get('timeouts', 0)}/{inj.get('malformed', 0)}" if inj else "-"
+        logging.info(f"   {name:<20}{st['count']:>6}{st['errors']:>6}{st['retries']:>6}{st['p50']:>10.3f}{st['p99']:>10.3f}  {injected}")
+
+
+def report_degradation(summaries: list[dict]):
+    """
+    以第一個情境為基準，列出其餘情境的吞吐量與各階段 p99 倍數
+    """
+    base = summaries[0]
+    for s in summaries[1:]:
+        ratio = s["throughput"] / base["throughput"] if base["throughput"] else 0.0
+        logging.info(f"== {s['scenario']} 相對 {base['scenario']}：吞吐量 {ratio:.2f} 倍")
+        for name, st in sorted(s["stages"].items()):
+            b = base["stages"].get(name)
+            if b and b["p99"] > 0:
+                logging.info(f"   {name:<20} p99 {b['p99']:.3f} → {st['p99']:.3f} 秒（{st['p99'] / b['p99']:.1f} 倍），"
+                             f"失敗 {b['errors']} → {st['errors']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="以本機替身伺服器對 run_pipeline 做端對端壓測")
+    parser.add_argument("--stocks", type=int, default=20, help="合成股票數")
+    parser.add_argument("--scenarios", type=str, default="clean,degraded", help=f"依序執行的情境（可用：{','.join(SCENARIOS)}），第一個為比較基準")
+    parser.add_argument("--set", dest="overrides", action="append", help="覆寫故障參數，例如 bing.p429=0.3、*.latency_ms=50，可重複指定")
+    parser.add_argument("--hang-sec", type=float, default=30, help="注入逾時時伺服器停住的秒數")
+    parser.add_argument("--article-hosts", type=int, default=3, help="新聞網站替身數（各自為獨立 host）")
+    parser.add_argument("--workers", type=int, default=4, help="run_pipeline 的 --workers")
+    parser.add_argument("--parse-workers", type=int, default=2, help="run_pipeline 的 --parse-workers")
+    parser.add_argument("--max-pages", type=int, default=1, help="每檔股票的 Bing 搜尋頁數")
+    parser.add_argument("--host-delay", type=float, default=0.05, help="各網站起始請求間隔秒數")
+    parser.add_argument("--host-concurrency", type=int, default=None, help="同一網站同時請求上限")
+    parser.add_argument("--finmind-rph", type=int, default=1_000_000, help="FinMind 每小時請求上限（替身不限額度，預設不讓權杖桶成為瓶頸）")
+    parser.add_argument("--stock-budget", type=float, default=None, help="每檔股票的時間預算（秒）")
+    parser.add_argument("--stage-budget", type=float, default=None, help="每個階段的時間預算（秒）")
+    parser.add_argument("--hedge", action="store_true", help="啟用對沖請求")
+    parser.add_argument("--output", type=str, default=None, help="將各情境結果寫入 JSON")
+    parser.add_argument("--verbose", action="store_true", help="顯示 run_pipeline 的 INFO 記錄")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的情境: {', '.join(unknown)}")
+    overrides = parse_overrides(args.overrides)
+
+    stand_ins = start_stand_ins([s.split("_", 1)[0] for s in synthetic_stocks(args.stocks)], article_hosts=args.article_hosts)
+    summaries = []
+    try:
+        for name in names:
+            logging.info(f"執行情境 {name} ...")
+            summaries.append(run_scenario(name, stand_ins, args, overrides))
+            report(summaries[-1])
+    finally:
+        stand_ins.stop()
+    if len(summaries) > 1:
+        report_degradation(summaries)
+    if args.output:
+        Path(args.output).write_text(json.dumps(summaries, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------
+# 壓測用本機替身伺服器
+#    - FinMind v4 /api/v4/data、Bing 新聞搜尋頁、新聞網站、Yahoo v8 chart API（含 yfinance 取 cookie / crumb 的端點）
+#    - 每個伺服器依 Faults 注入延遲（對數常態分布）、429、5xx、逾時（長時間不回應）與格式錯誤的回應
+#    - 回應內容以請求參數為種子產生，同一請求每次得到相同資料
+# --------------------------------------------------
+_TZ = "Asia/Taipei"
+
+
+@dataclass
+class Faults:
+    latency_ms: float = 20.0      # 延遲中位數
+    latency_sigma: float = 0.3    # 對數常態分布的 sigma，越大尾端越長
+    p429: float = 0.0             # 回 429（附 Retry-After）的機率
+    p5xx: float = 0.0             # 回 503 的機率
+    ptimeout: float = 0.0         # 不回應（停住 hang_sec 秒）的機率
+    pmalformed: float = 0.0       # 回 200 但內容截斷 / 格式錯誤的機率
+    hang_sec: float = 30.0
+    retry_after: float = 1.0
+
+    def update(self, **kwargs):
+        for key, value in kwargs.items():
+            if not hasattr(self, key):
+                raise ValueError(f"未知的故障參數: {key}")
+            setattr(self, key, type(getattr(self, key))(value))
+
+
+@dataclass
+class ServerStats:
+    requests: int = 0
+    ok: int = 0
+    throttled: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    malformed: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, key: str):
+        with self.lock:
+            setattr(self, key, getattr(self, key) + 1)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {k: getattr(self, k) for k in ("requests", "ok", "throttled", "errors", "timeouts", "malformed")}
+
+    def reset(self):
+        with self.lock:
+            self.requests = self.ok = self.throttled = self.errors = self.timeouts = self.malformed = 0
+
+
+def _seed(*parts) -> int:
+    return int.from_bytes(hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=8).digest(), "big")
+
+
+class StandInServer(ABC):
+    """
+    單一替身伺服器：於背景執行緒服務，render(path, query) 由子類別實作
+    """
+    name = ""
+
+    def __init__(self, faults: Faults | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or Faults()
+        self.stats = ServerStats()
+        self._rng = random.Random()
+        self._rng_lock = threading.Lock()
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self)
+
+            def do_HEAD(self):
+                server._handle(self, head=True)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f"standin-{self.name}", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self):
+        f = self.faults
+        with self._rng_lock:
+            delay = f.latency_ms / 1000.0 * math.exp(f.latency_sigma * self._rng.gauss(0, 1))
+            roll = self._rng.random()
+        for kind, p in (("timeout", f.ptimeout), ("429", f.p429), ("5xx", f.p5xx), ("malformed", f.pmalformed)):
+            if roll < p:
+                return delay, kind
+            roll -= p
+        return delay, None
+
+    def _handle(self, handler: BaseHTTPRequestHandler, head: bool = False):
+        self.stats.add("requests")
+        delay, fault = self._draw()
+        time.sleep(delay)
+        if fault == "timeout":
+            self.stats.add("timeouts")
+            time.sleep(self.faults.hang_sec)
+            handler.close_connection = True
+            return
+        if fault == "429":
+            self.stats.add("throttled")
+            self._send(handler, 429, b"Too Many Requests", "text/plain", {"Retry-After": f"{self.faults.retry_after:g}"}, head)
+            return
+        if fault == "5xx":
+            self.stats.add("errors")
+            self._send(handler, 503, b"Service Unavailable", "text/plain", head=head)
+            return
+        parts = urlparse(handler.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        try:
+            status, body, content_type = self.render(parts.path, query)
+        except Exception as e:
+            self.stats.add("errors")
+            self._send(handler, 500, str(e).encode(), "text/plain", head=head)
+            return
+        if fault == "malformed":
+            self.stats.add("malformed")
+            body = body[: max(1, len(body) // 3)]
+        elif status < 400:
+            self.stats.add("ok")
+        self._send(handler, status, body, content_type, head=head)
+
+    @staticmethod
+    def _send(handler, status, body: bytes, content_type: str, headers: dict | None = None, head: bool = False):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        if not head:
+            handler.wfile.write(body)
+
+    @abstractmethod
+    def render(self, path: str, query: dict) -> tuple[int, bytes, str]:
+        """
+        :return: (狀態碼, 回應內容, Content-Type)
+        """
+
+
+# --------------------------------------------------
+# FinMind /api/v4/data
+# --------------------------------------------------
+def _finmind_rows(dataset: str, data_id: str, start: pd.Timestamp, end: pd.Timestamp) -> list[dict]:
+    rng = np.random.default_rng(_seed(dataset, data_id))
+    days = pd.bdate_range(start, end)
+    if dataset == "TaiwanStockMonthRevenue":
+        months = pd.date_range(start, end, freq="MS") + pd.Timedelta(days=9)
+        return [{"date": d.strftime("%Y-%m-%d"), "stock_id": data_id, "country": "Taiwan",
+                 "revenue": int(rng.integers(1e9, 3e11)), "revenue_month": (d - pd.DateOffset(months=1)).month,
+                 "revenue_year": (d - pd.DateOffset(months=1)).year} for d in months if d <= end]
+    if dataset == "TaiwanStockFinancialStatements":
+        quarters = pd.date_range(start, end, freq="QE")
+        return [{"date": q.strftime("%Y-%m-%d"), "stock_id": data_id, "type": t, "value": float(rng.normal(1e10, 1e9)),
+                 "origin_name": t} for q in quarters for t in ("Revenue", "GrossProfit", "OperatingIncome", "EPS")]
+    if dataset == "TaiwanStockInstitutionalInvestorsBuySell":
+        names = ("Foreign_Investor", "Investment_Trust", "Dealer_self", "Dealer_Hedging", "Foreign_Dealer_Self")
+        return [{"date": d.strftime("%Y-%m-%d"), "stock_id": data_id, "buy": int(rng.integers(0, 5e7)),
+                 "name": n, "sell": int(rng.integers(0, 5e7))} for d in days for n in names]
+    if dataset == "TaiwanStockMarginPurchaseShortSale":
+        return [{"date": d.strftime("%Y-%m-%d"), "stock_id": data_id, "MarginPurchaseBuy": int(rng.integers(0, 5000)),
+                 "MarginPurchaseSell": int(rng.integers(0, 5000)), "MarginPurchaseTodayBalance": int(rng.integers(1e4, 5e4)),
+                 "ShortSaleBuy": int(rng.integers(0, 500)), "ShortSaleSell": int(rng.integers(0, 500)),
+                 "ShortSaleTodayBalance": int(rng.integers(0, 5000))} for d in days]
+    if dataset == "TaiwanStockPER":
+        return [{"date": d.strftime("%Y-%m-%d"), "stock_id": data_id, "dividend_yield": round(float(rng.uniform(1, 5)), 2),
+                 "PER": round(float(rng.uniform(8, 30)), 2), "PBR": round(float(rng.uniform(1, 6)), 2)} for d in days]
+    # TaiwanStockTotalReturnIndex 與其他日資料
+    price = 20000 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+    return [{"date": d.strftime("%Y-%m-%d"), "stock_id": data_id, "price": round(float(p), 2)} for d, p in zip(days, price)]
+
+
+class FinMindServer(StandInServer):
+    name = "finmind"
+
+    def __init__(self, *args, universe: list[str] | None = None, **kwargs):
+        """
+        :param universe: 不指定 data_id（全市場）時回傳的股票代號
+        """
+        super().__init__(*args, **kwargs)
+        self.universe = universe or []
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/api/v4/data"
+
+    def render(self, path, query):
+        if path != "/api/v4/data":
+            return 404, b'{"msg": "not found", "status": 404}', "application/json"
+        dataset = query.get("dataset", "")
+        end = pd.Timestamp(query["end_date"]) if "end_date" in query else pd.Timestamp.today().normalize()
+        start = pd.Timestamp(query.get("start_date", end - pd.Timedelta(days=365)))
+        ids = [query["data_id"]] if "data_id" in query else self.universe
+        rows = [row for data_id in ids for row in _finmind_rows(dataset, data_id, start, end)]
+        body = json.dumps({"msg": "success", "status": 200, "data": rows}, ensure_ascii=False).encode()
+        return 200, body, "application/json"
+
+
+# --------------------------------------------------
+# Bing 新聞搜尋頁與新聞網站
+# --------------------------------------------------
+_SENTENCES = [
+    "外資連續買超，法人看好後市表現，成交量同步放大。",
+    "公司公告上月營收年增逾三成，創下歷年同期新高。",
+    "分析師指出伺服器訂單持續湧入，下半年產能利用率可望維持高檔。",
+    "市場關注利率決策，科技股評價恐面臨修正壓力。",
+    "董事會通過配發現金股利，除息日訂於下個月中旬。",
+    "供應鏈業者表示先進封裝產能仍供不應求，設備交期延長。",
+]
+
+
+class ArticleServer(StandInServer):
+    name = "article"
+
+    def render(self, path, query):
+        if not path.startswith("/news/"):
+            return 404, b"not found", "text/html; charset=utf-8"
+        rng = random.Random(_seed(path))
+        paragraphs = "".join(f"<p>{''.join(rng.choice(_SENTENCES) for _ in range(rng.randint(2, 4)))}</p>" for _ in range(rng.randint(8, 20)))
+        noise = "".join(f'<li><a href="/news/{rng.randint(1, 10**7)}.html">{rng.choice(_SENTENCES)}</a></li>' for _ in range(40))
+        html = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{path}</title>'
+                f'<script>var data={json.dumps(list(range(200)))};</script></head>'
+                f'<body><nav><ul>{noise}</ul></nav><article><h1>{rng.choice(_SENTENCES)}</h1>{paragraphs}</article>'
+                f'<footer>{rng.choice(_SENTENCES)}</footer></body></html>')
+        return 200, html.encode(), "text/html; charset=utf-8"
+
+
+class BingServer(StandInServer):
+    name = "bing"
+
+    def __init__(self, *args, article_bases: list[str] | None = None, per_page: int = 10, **kwargs):
+        """
+        :param article_bases: 搜尋結果連結指向的新聞網站（依序輪流）
+        """
+        super().__init__(*args, **kwargs)
+        self.article_bases = article_bases or []
+        self.per_page = per_page
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.base_url}/news/search"
+
+    def render(self, path, query):
+        if path != "/news/search":
+            return 404, b"not found", "text/html; charset=utf-8"
+        keyword = query.get("q", "")
+        first = int(query.get("first", "1"))
+        rng = random.Random(_seed(keyword, first))
+        cards = []
+        for i in range(self.per_page):
+            article_id = _seed(keyword, first + i) % 10**9
+            base = self.article_bases[(first + i) % len(self.article_bases)] if self.article_bases else self.base_url
+            age = f"{rng.randint(1, 23)} 小時前"
+            cards.append(f'<div class="news-card"><div class="caption"><a class="title" href="{base}/news/{article_id}.html">'
+                         f'{rng.choice(_SENTENCES)}</a><div class="source"><span aria-label="{age}">{age}</span></div></div></div>')
+        html = f'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body><div id="algocore">{"".join(cards)}</div></body></html>'
+        return 200, html.encode(), "text/html; charset=utf-8"
+
+
+# --------------------------------------------------
+# Yahoo v8 chart API
+# --------------------------------------------------
+_RANGE_DAYS = {"1d": 1, "5d": 5, "7d": 7, "1mo": 30, "60d": 60, "3mo": 90, "6mo": 180, "1y": 365, "2y": 730}
+_VALID_RANGES = ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"]
+_INTERVAL_MINUTES = {"1m": 1, "2m": 2, "5m": 5, "15m": 15, "30m": 30, "60m": 60, "90m": 90, "1h": 60}
+
+
+def _chart_index(interval: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DatetimeIndex:
+    sessions = pd.bdate_range(start.tz_convert(_TZ).normalize().tz_localize(None), end.tz_convert(_TZ).normalize().tz_localize(None))
+    if interval == "1d":
+        index = sessions.tz_localize(_TZ)
+    else:
+        step = _INTERVAL_MINUTES[interval]
+        offsets = pd.to_timedelta(np.arange(0, 270, step), unit="m")
+        stamps = ((sessions + pd.Timedelta(hours=9)).values[:, None] + offsets.values[None, :]).ravel()
+        index = pd.DatetimeIndex(stamps).tz_localize(_TZ)
+    return index[(index >= start) & (index <= end)]
+
+
+class YahooChartServer(StandInServer):
+    name = "yahoo"
+
+    def render(self, path, query):
+        # yfinance 先取 cookie（fc.yahoo.com 首頁）與 crumb，替身不檢查兩者
+        if path in ("", "/"):
+            return 200, b"", "text/html"
+        if path == "/v1/test/getcrumb":
+            return 200, b"loadtest-crumb", "text/plain"
+        prefix = "/v8/finance/chart/"
+        if not path.startswith(prefix):
+            return 404, b'{"chart": {"result": null, "error": {"code": "Not Found"}}}', "application/json"
+        symbol = path[len(prefix):]
+        interval = query.get("interval", "1d")
+        end = pd.Timestamp.now(tz="UTC")
+        if "period1" in query:
+            start = pd.Timestamp(int(query["period1"]), unit="s", tz="UTC")
+            end = pd.Timestamp(int(query.get("period2", end.timestamp())), unit="s", tz="UTC")
+        else:
+            start = end - pd.Timedelta(days=_RANGE_DAYS.get(query.get("range", "1y"), 365))
+        index = _chart_index(interval, start, end)
+        # 價格只由時間戳決定，增量請求與完整請求重疊的 K 棒相同
+        ts = index.asi8 // 10**9
+        phase = _seed(symbol) % 1000
+        u1 = ((ts * 2654435761 + phase) % 2**32) / 2**32
+        u2 = ((ts * 40503 + phase * 7) % 2**16) / 2**16
+        close = 100 * (1 + 0.2 * np.sin(ts / 86400 / 20 + phase)) * (1 + 0.01 * (u1 - 0.5))
+        open_ = close * (1 + 0.004 * (u2 - 0.5))
+        spread = 0.002 + 0.004 * u2
+        quote = {
+            "open": open_.round(2).tolist(),
+            "high": (np.maximum(open_, close) * (1 + spread)).round(2).tolist(),
+            "low": (np.minimum(open_, close) * (1 - spread)).round(2).tolist(),
+            "close": close.round(2).tolist(),
+            "volume": (1_000 + (ts * 69069 + phase) % 5_000_000).tolist(),
+        }
+        indicators = {"quote": [quote]}
+        if interval == "1d":
+            indicators["adjclose"] = [{"adjclose": quote["close"]}]
+        payload = {"chart": {"result": [{
+            # yfinance 會讀取的 meta 欄位
+            "meta": {"symbol": symbol, "currency": "TWD", "instrumentType": "EQUITY", "exchangeTimezoneName": _TZ,
+                     "gmtoffset": 28800, "priceHint": 2, "dataGranularity": interval, "validRanges": _VALID_RANGES,
+                     "regularMarketPrice": quote["close"][-1] if quote["close"] else None},
+            "timestamp": [int(ts.timestamp()) for ts in index],
+            "indicators": indicators,
+        }], "error": None}}
+        return 200, json.dumps(payload).encode(), "application/json"
+
+
+@dataclass
+class StandIns:
+    finmind: FinMindServer
+    bing: BingServer
+    yahoo: YahooChartServer
+    articles: list[ArticleServer]
+
+    def all(self) -> list[StandInServer]:
+        return [self.finmind, self.bing, self.yahoo, *self.articles]
+
+    def env(self) -> dict[str, str]:
+        """
+        讓 src 模組改指向替身伺服器的環境變數（須在匯入 src 模組前設定）；Yahoo 由 run_load 改寫 yfinance 的 session
+        """
+        return {"FINMIND_API_URL": self.finmind.api_url, "BING_NEWS_URL": self.bing.search_url}
+
+    def stats(self) -> dict:
+        out = {s.name: s.stats.snapshot() for s in (self.finmind, self.bing, self.yahoo)}
+        article = [s.stats.snapshot() for s in self.articles]
+        out["article"] = {k: sum(a[k] for a in article) for k in article[0]} if article else {}
+        return out
+
+    def reset_stats(self):
+        for s in self.all():
+            s.stats.reset()
+
+    def stop(self):
+        for s in self.all():
+            s.stop()
+
+
+def start_stand_ins(universe: list[str], article_hosts: int = 3) -> StandIns:
+    """
+    啟動全部替身伺服器（隨機埠）
+    :param universe: 股票代號，供 FinMind 全市場查詢
+    :param article_hosts: 新聞網站數，各自獨立的 host，用來觀察每站併發限制
+    """
+    articles = [ArticleServer().start() for _ in range(max(1, article_hosts))]
+    return StandIns(
+        finmind=FinMindServer(universe=universe).start(),
+        bing=BingServer(article_bases=[a.base_url for a in articles]).start(),
+        yahoo=YahooChartServer().start(),
+        articles=articles,
+    )
@@ -4,7 +4,180 @@ import pandas as pd  # 資料處理套件
 # --------------------------------------------------
 # 三、技術指標計算函式
 #    - MA, RSI, MACD, HV, BB, ATR, OBV, VWAP, Divergence
+#    - IndicatorEngine 先解析欄位並快取共用中間量（價差、對數報酬、
+#      滾動均值/標準差、OBV），各指標共用，避免重複計算
 # --------------------------------------------------
+def resolve_columns(df):
+    """
+    解析價格/量欄位，兼容 yfinance (Close/High/Low/Volume) 與 FinMind (close/max/min/Trading_Volume)
+    :param df: 價格 DataFrame
+    :return: (price, high, low, volume)，缺少的欄位為 None
+    """
+    price = df.get('close', df.get('Close'))
+    high = df.get('max', df.get('High'))
+    low = df.get('min', df.get('Low'))
+    vol = df.get('Trading_Volume', df.get('Volume'))
+    return price, high, low, vol
+
+
+def _obv_values(price, vol):
+    # 向量化 OBV：依收盤漲跌決定量的正負號後累加；與逐筆迴圈的加總順序相同，結果逐位元一致
+    p = np.asarray(price, dtype=float)
+    v = np.asarray(vol)
+    step = np.zeros_like(v)
+    if len(p) > 1:
+        up = p[1:] > p[:-1]
+        down = p[1:] < p[:-1]
+        step[1:] = np.where(up, v[1:], np.where(down, -v[1:], 0))
+    return np.cumsum(step, axis=0)
+
+
+class IndicatorEngine:
+    """
+    技術指標計算引擎：中間量只計算一次並在各指標間共用
+    price/high/low/volume 可為 Series，亦可為 (時間 × 股票) 的 DataFrame
+    """
+
+    def __init__(self, price, high=None, low=None, volume=None):
+        self.price = price
+        self.high = high
+        self.low = low
+        self.volume = volume
+        self._cache = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(*resolve_columns(df))
+
+    def _cached(self, key, fn):
+        if key not in self._cache:
+            self._cache[key] = fn()
+        return self._cache[key]
+
+    def _wrap(self, values):
+        # 將 NumPy 結果包回與輸入相同的 pandas 物件
+        if isinstance(self.price, pd.DataFrame):
+            return pd.DataFrame(values, index=self.price.index, columns=self.price.columns)
+        return pd.Series(values, index=self.price.index)
+
+    # ---------- 共用中間量 ----------
+    def delta(self):
+        return self._cached('delta', lambda: self.price.diff())
+
+    def log_return(self):
+        return self._cached('log_ret', lambda: np.log(self.price / self.price.shift(1)))
+
+    def rolling_mean(self, window):
+        return self._cached(('mean', window), lambda: self.price.rolling(window).mean())
+
+    def rolling_std(self, window):
+        return self._cached(('std', window), lambda: self.price.rolling(window).std())
+
+    def true_range(self):
+        def _tr():
+            prev_close = self.price.shift(1).to_numpy()
+            high = self.high.to_numpy()
+            low = self.low.to_numpy()
+            # fmax 忽略 NaN，與 DataFrame.max(axis=1) 的 skipna 行為一致
+            tr = np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+            return self._wrap(tr)
+        return self._cached('tr', _tr)
+
+    def obv(self):
+        return self._cached('obv', lambda: self._wrap(_obv_values(self.price, self.volume)))
+
+    def gain_loss(self):
+        def _gl():
+            d = self.delta().to_numpy()
+            gain = self._wrap(np.where(d > 0, d, 0.0))  # 上漲部分
+            loss = self._wrap(np.where(d < 0, -d, 0.0))  # 下跌部分
+            return gain, loss
+        return self._cached('gain_loss', _gl)
+
+    def wilder_averages(self, period=14):
+        def _avg():
+            gain, loss = self.gain_loss()
+            # 使用 Wilder's EMA 平滑
+            avg_gain = gain.ewm(alpha=1/period, adjust=False).mean()
+            avg_loss = loss.ewm(alpha=1/period, adjust=False).mean()
+            return avg_gain, avg_loss
+        return self._cached(('wilder', period), _avg)
+
+    def ema(self, span):
+        return self._cached(('ema', span), lambda: self.price.ewm(span=span, adjust=False).mean())
+
+    # ---------- 指標 ----------
+    def rsi(self, period=14):
+        def _rsi():
+            avg_gain, avg_loss = self.wilder_averages(period)
+            rs = avg_gain / avg_loss
+            return 100 - (100 / (1 + rs))
+        return self._cached(('rsi', period), _rsi)
+
+    def macd(self, fast=12, slow=26, signal=9):
+        def _macd():
+            macd_line = self.ema(fast) - self.ema(slow)  # 快線減慢線
+            signal_line = macd_line.ewm(span=signal, adjust=False).mean()
+            return macd_line, signal_line, macd_line - signal_line
+        return self._cached(('macd', fast, slow, signal), _macd)
+
+    def hv(self, window=20, trading_days=252):
+        # 標準差 * 根號年交易天數
+        return self._cached(('hv', window, trading_days),
+                            lambda: self.log_return().rolling(window).std() * np.sqrt(trading_days))
+
+    def bollinger(self, window=20, num_std=2):
+        def _bb():
+            ma = self.rolling_mean(window)
+            std = self.rolling_std(window)
+            return ma, ma + num_std * std, ma - num_std * std
+        return self._cached(('bb', window, num_std), _bb)
+
+    def atr(self, period=14):
+        return self._cached(('atr', period), lambda: self.true_range().rolling(period).mean())
+
+    def vwap(self):
+        def _vwap():
+            cum_vp = (self.price * self.volume).cumsum()  # 價量累積
+            cum_v = self.volume.cumsum()  # 量累積
+            return cum_vp / cum_v
+        return self._cached('vwap', _vwap)
+
+    def divergence(self, window=20):
+        def _div():
+            obv = self.obv()
+            ph = self.price.rolling(window).max().shift(1)
+            oh = obv.rolling(window).max().shift(1)
+            # 價格突破前高且 OBV 未突破 = 背離
+            return (self.price > ph) & (obv < oh)
+        return self._cached(('div', window), _div)
+
+    def compute_all(self):
+        """
+        計算 apply_technical_indicators 的全部欄位
+        :return: dict，欄位名稱 -> Series/DataFrame，順序與輸出欄位一致
+        """
+        macd_line, sig_line, hist = self.macd()
+        bb_mid, bb_up, bb_down = self.bollinger()
+        return {
+            'MA_5': self.rolling_mean(5),     # 5 日移動平均
+            'MA_20': self.rolling_mean(20),   # 20 日移動平均
+            'MA_60': self.rolling_mean(60),   # 60 日移動平均
+            'RSI_14': self.rsi(),
+            'MACD_Line': macd_line,
+            'MACD_Signal': sig_line,
+            'MACD_Hist': hist,
+            'HV_20': self.hv(),               # 歷史波動率
+            'BB_MID': bb_mid,                 # 布林通道
+            'BB_UP': bb_up,
+            'BB_DOWN': bb_down,
+            'ATR_14': self.atr(),
+            'OBV': self.obv(),
+            'VWAP': self.vwap(),
+            'Divergence_20': self.divergence(),  # 背離偵測
+        }
+
+
 def calculate_rsi(series, period=14):
     """
     計算 RSI（相對強弱指標）
@@ -12,15 +185,7 @@ def calculate_rsi(series, period=14):
     :param period: 週期
     :return: RSI 值 (0-100)
     """
-    delta = series.diff()  # 計算價差
-    gain = delta.where(delta > 0, 0.0)  # 上漲部分
-    loss = -delta.where(delta < 0, 0.0)  # 下跌部分
-    # 使用 Wilder’s EMA 平滑
-    avg_gain = gain.ewm(alpha=1/period, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1/period, adjust=False).mean()
-    rs = avg_gain / avg_loss
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
+    return IndicatorEngine(series).rsi(period)
 
 def calculate_macd(series, fast=12, slow=26, signal=9):
     """
@@ -31,12 +196,7 @@ def calculate_macd(series, fast=12, slow=26, signal=9):
     :param signal: 訊號線 EMA 週期
     :return: (macd_line, signal_line, hist)
     """
-    ema_fast = series.ewm(span=fast, adjust=False).mean()
-    ema_slow = series.ewm(span=slow, adjust=False).mean()
-    macd_line = ema_fast - ema_slow  # 快線減慢線
-    signal_line = macd_line.ewm(span=signal, adjust=False).mean()
-    hist = macd_line - signal_line  # 柱狀圖
-    return macd_line, signal_line, hist
+    return IndicatorEngine(series).macd(fast, slow, signal)
 
 def calculate_hv(series, window=20, trading_days=252):
     """
@@ -46,9 +206,7 @@ def calculate_hv(series, window=20, trading_days=252):
     :param trading_days: 年化交易天數
     :return: 波動率序列
     """
-    log_ret = np.log(series / series.shift(1))  # 日對數報酬
-    # 標準差 * 根號年交易天數
-    return log_ret.rolling(window).std() * np.sqrt(trading_days)
+    return IndicatorEngine(series).hv(window, trading_days)
 
 def calculate_bollinger(series, window=20, num_std=2):
     """
@@ -58,11 +216,7 @@ def calculate_bollinger(series, window=20, num_std=2):
     :param num_std: 標準差倍數
     :return: (中軌, 上軌, 下軌)
     """
-    ma = series.rolling(window).mean()
-    std = series.rolling(window).std()
-    upper = ma + num_std * std
-    lower = ma - num_std * std
-    return ma, upper, lower
+    return IndicatorEngine(series).bollinger(window, num_std)
 
 def calculate_atr(df, period=14):
     """
@@ -71,15 +225,7 @@ def calculate_atr(df, period=14):
     :param period: 視窗
     :return: ATR 序列
     """
-    high = df.get('max', df.get('High'))  # 兼容欄位名稱
-    low = df.get('min', df.get('Low'))
-    prev_close = df.get('close', df.get('Close')).shift(1)
-    tr1 = high - low
-    tr2 = (high - prev_close).abs()
-    tr3 = (low - prev_close).abs()
-    tr = pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
-    atr = tr.rolling(period).mean()
-    return atr
+    return IndicatorEngine.from_frame(df).atr(period)
 
 def calculate_obv(df):
     """
@@ -87,17 +233,7 @@ def calculate_obv(df):
     :param df: DataFrame，需含 Volume/Close
     :return: OBV 序列
     """
-    vol = df.get('Trading_Volume', df.get('Volume'))
-    price = df.get('close', df.get('Close'))
-    obv = [0]
-    for i in range(1, len(df)):
-        if price.iat[i] > price.iat[i-1]:
-            obv.append(obv[-1] + vol.iat[i])
-        elif price.iat[i] < price.iat[i-1]:
-            obv.append(obv[-1] - vol.iat[i])
-        else:
-            obv.append(obv[-1])
-    return pd.Series(obv, index=df.index)
+    return IndicatorEngine.from_frame(df).obv()
 
 def calculate_vwap(df):
     """
@@ -105,11 +241,7 @@ def calculate_vwap(df):
     :param df: DataFrame, 需含 Volume/Close
     :return: VWAP 序列
     """
-    vol = df.get('Trading_Volume', df.get('Volume'))
-    price = df.get('close', df.get('Close'))
-    cum_vp = (price * vol).cumsum()  # 價量累積
-    cum_v = vol.cumsum()  # 量累積
-    return cum_vp / cum_v
+    return IndicatorEngine.from_frame(df).vwap()
 
 def detect_divergence(df, window=20):
     """
@@ -118,12 +250,7 @@ def detect_divergence(df, window=20):
     :param window: 視窗
     :return: 背離訊號 (Boolean)
     """
-    price = df.get('close', df.get('Close'))
-    obv = calculate_obv(df)
-    ph = price.rolling(window).max().shift(1)
-    oh = obv.rolling(window).max().shift(1)
-    # 價格突破前高且 OBV 未突破 = 背離
-    return (price > ph) & (obv < oh)
+    return IndicatorEngine.from_frame(df).divergence(window)
 
 def apply_technical_indicators(df):
     """
@@ -131,31 +258,289 @@ def apply_technical_indicators(df):
     :param df: 原始價格 DataFrame
     :return: 含指標欄位的 DataFrame
     """
-    df = df.copy()
-    price = df.get('close', df.get('Close'))
-    # 移動平均
-    df['MA_5'] = price.rolling(5).mean()    # 5 日移動平均
-    df['MA_20'] = price.rolling(20).mean()  # 20 日移動平均
-    df['MA_60'] = price.rolling(60).mean()  # 60 日移動平均
-    # RSI
-    df['RSI_14'] = calculate_rsi(price)
-    # MACD
-    macd_line, sig_line, hist = calculate_macd(price)
-    df['MACD_Line'] = macd_line
-    df['MACD_Signal'] = sig_line
-    df['MACD_Hist'] = hist
-    # 歷史波動率
-    df['HV_20'] = calculate_hv(price)
-    # 布林通道
-    bb_mid, bb_up, bb_down = calculate_bollinger(price)
-    df['BB_MID'] = bb_mid
-    df['BB_UP'] = bb_up
-    df['BB_DOWN'] = bb_down
-    # ATR
-    df['ATR_14'] = calculate_atr(df)
-    # OBV & VWAP
-    df['OBV'] = calculate_obv(df)
-    df['VWAP'] = calculate_vwap(df)
-    # 背離偵測
-    df['Divergence_20'] = detect_divergence(df)
-    return df
\ No newline at end of file
+    engine = IndicatorEngine.from_frame(df)
+    return df.assign(**engine.compute_all())
+
+
+# --------------------------------------------------
+# 多檔股票一次計算（panel）
+#    - 各股票的價/量依「第幾根 K 棒」靠左對齊成 (K 棒序號 × 股票) 的 2 維陣列，較短者尾端補 NaN
+#    - 所有指標皆只往前看（滾動、EMA、累積和），尾端補值不影響有效區段，結果與逐檔計算逐位元相同
+#    - 不以時間對齊：各股票停牌、上市日不同時，時間對齊會在視窗中插入 NaN 而改變結果
+#    - 每次最多處理 _PANEL_CHUNK 檔，控制中間量的記憶體
+# --------------------------------------------------
+_PANEL_CHUNK = 256
+
+
+def _panel_matrix(series_list, length):
+    out = np.full((length, len(series_list)), np.nan)
+    for j, s in enumerate(series_list):
+        out[:len(s), j] = s.to_numpy(dtype=float)
+    return pd.DataFrame(out)
+
+
+def apply_technical_indicators_panel(frames):
+    """
+    對多個價格 DataFrame 一次套用所有技術指標，結果與逐一呼叫 apply_technical_indicators 相同
+    :param frames: {鍵: 價格 DataFrame}，例如 {股票代號: 日線}
+    :return: {鍵: 含指標欄位的 DataFrame}
+    """
+    result = {}
+    panel = []
+    for key, df in frames.items():
+        price, high, low, vol = resolve_columns(df)
+        if df.empty or price is None or high is None or low is None or vol is None:
+            # 欄位不齊的交給逐檔計算，缺欄時的行為與原本一致
+            result[key] = apply_technical_indicators(df)
+        else:
+            panel.append((key, df, (price, high, low, vol)))
+
+    for i in range(0, len(panel), _PANEL_CHUNK):
+        chunk = panel[i:i + _PANEL_CHUNK]
+        length = max(len(df) for _, df, _ in chunk)
+        engine = IndicatorEngine(*[_panel_matrix([cols[k] for _, _, cols in chunk], length) for k in range(4)])
+        columns = {name: values.to_numpy() for name, values in engine.compute_all().items()}
+        for j, (key, df, cols) in enumerate(chunk):
+            n = len(df)
+            out = {name: values[:n, j] for name, values in columns.items()}
+            vol_dtype = cols[3].dtype
+            if np.issubdtype(vol_dtype, np.integer):
+                # 逐檔計算時整數成交量的 OBV 為整數
+                out['OBV'] = out['OBV'].astype(vol_dtype)
+            if df.columns.intersection(list(out)).empty:
+                # 一次併入所有指標欄位，避免 assign 逐欄插入的開銷
+                result[key] = pd.concat([df, pd.DataFrame(out, index=df.index)], axis=1)
+            else:
+                result[key] = df.assign(**out)
+    return {key: result[key] for key in frames}
+
+
+# --------------------------------------------------
+# 四、增量更新
+#    - state 保存各指標的遞迴狀態（EMA 值、滾動視窗尾端、累積和）
+#    - 新 K 棒只需 O(新筆數) 即可延續計算，結果與完整重算一致
+#      （EMA/OBV/VWAP/背離逐位元相同；滾動均值/標準差為浮點誤差範圍內）
+# --------------------------------------------------
+_TAIL = 60           # 最長滾動視窗（MA_60）
+_RSI_PERIOD = 14
+_MACD_SPANS = {'fast': 12, 'slow': 26, 'signal': 9}
+
+
+def _ewm_alpha(span=None, alpha=None):
+    # 與 pandas 相同：先換算 center of mass 再求 alpha，確保浮點值一致
+    com = (span - 1) / 2 if span is not None else (1 - alpha) / alpha
+    return 1.0 / (1.0 + float(com))
+
+
+def _ewm_continue(values, weighted, old_wt, alpha):
+    """
+    延續 ewm(adjust=False).mean() 的遞迴，公式與 pandas 內部實作相同
+    :param values: 新輸入值
+    :param weighted: 上一筆 EMA（尚無觀測值時為 NaN）
+    :param old_wt: 上一筆之後的舊權重（遇到 NaN 輸入時會持續衰減）
+    :return: (輸出陣列, weighted, old_wt)
+    """
+    factor = 1.0 - alpha
+    out = np.empty(len(values))
+    for i, cur in enumerate(values):
+        if weighted == weighted:
+            if cur == cur:
+                old_wt *= factor
+                if weighted != cur:
+                    weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+            else:
+                old_wt *= factor
+        elif cur == cur:
+            weighted = cur
+            old_wt = 1.0
+        out[i] = weighted
+    return out, weighted, old_wt
+
+
+def _ewm_state(inputs, outputs, k, alpha):
+    # 由完整計算結果取出第 k 筆之後的 (weighted, old_wt)
+    weighted = float(outputs[k])
+    old_wt = 1.0
+    if weighted == weighted:
+        j = k
+        while j >= 0 and inputs[j] != inputs[j]:
+            old_wt *= 1.0 - alpha
+            j -= 1
+    return [weighted, old_wt]
+
+
+def _scalar(x):
+    # 轉成 JSON 可序列化的 Python 數值
+    return x.item() if hasattr(x, 'item') else x
+
+
+def _build_state(index, price, logret, tr, obv, cum_vp, cum_v, ema_io, k):
+    """
+    取出第 k 筆（含）為止的指標狀態
+    :param ema_io: {名稱: (輸入陣列, 輸出陣列, alpha)}
+    """
+    def tail(arr, n):
+        return [_scalar(x) for x in arr[max(0, k + 1 - n):k + 1]]
+    return {
+        'last_index': index[k].isoformat(),
+        'count': int(k + 1),
+        'price_tail': tail(price, _TAIL),
+        'logret_tail': tail(logret, 20),
+        'tr_tail': tail(tr, _RSI_PERIOD),
+        'obv_tail': tail(obv, 20),
+        'cum_vp': _scalar(cum_vp),
+        'cum_v': _scalar(cum_v),
+        'ema': {name: _ewm_state(inp, out, k, alpha) for name, (inp, out, alpha) in ema_io.items()},
+    }
+
+
+def _running_cumsum(values, start):
+    # 與 pandas cumsum(skipna=True) 相同：NaN 位置輸出 NaN，但不中斷累加
+    vals = np.asarray(values)
+    mask = np.isnan(vals) if vals.dtype.kind == 'f' else np.zeros(len(vals), dtype=bool)
+    filled = np.where(mask, 0, vals)
+    running = np.cumsum(np.concatenate([[start], filled]))[1:]
+    out = running.astype(float) if mask.any() else running
+    if mask.any():
+        out[mask] = np.nan
+    return out, running[-1] if len(running) else start
+
+
+def _full_with_state(df, hold_back):
+    # 完整計算並取出狀態
+    engine = IndicatorEngine.from_frame(df)
+    out = df.assign(**engine.compute_all())
+    n = len(df)
+    k = n - 1 - hold_back
+    if k < 0:
+        return out, None
+    price = engine.price.to_numpy(dtype=float)
+    vol = engine.volume.to_numpy()
+    gain, loss = engine.gain_loss()
+    avg_gain, avg_loss = engine.wilder_averages(_RSI_PERIOD)
+    macd_line, sig_line, _ = engine.macd()
+    _, cum_vp = _running_cumsum(price[:k + 1] * vol[:k + 1], 0.0)
+    _, cum_v = _running_cumsum(vol[:k + 1], 0)
+    rsi_alpha = _ewm_alpha(alpha=1/_RSI_PERIOD)
+    ema_io = {
+        'gain': (gain.to_numpy(), avg_gain.to_numpy(), rsi_alpha),
+        'loss': (loss.to_numpy(), avg_loss.to_numpy(), rsi_alpha),
+        'fast': (price, engine.ema(_MACD_SPANS['fast']).to_numpy(), _ewm_alpha(span=_MACD_SPANS['fast'])),
+        'slow': (price, engine.ema(_MACD_SPANS['slow']).to_numpy(), _ewm_alpha(span=_MACD_SPANS['slow'])),
+        'signal': (macd_line.to_numpy(), sig_line.to_numpy(), _ewm_alpha(span=_MACD_SPANS['signal'])),
+    }
+    state = _build_state(df.index, price, engine.log_return().to_numpy(), engine.true_range().to_numpy(),
+                         engine.obv().to_numpy(), cum_vp, cum_v, ema_io, k)
+    return out, state
+
+
+def _rolling_tail(tail, new, window, how, shift=0):
+    # 在「前段尾端 + 新資料」上做滾動計算，只取新資料對應的部分
+    ext = pd.Series(np.concatenate([np.asarray(tail, dtype=float), np.asarray(new, dtype=float)]))
+    res = getattr(ext.rolling(window), how)()
+    if shift:
+        res = res.shift(shift)
+    return res.to_numpy()[len(tail):]
+
+
+def _tail_list(prev_tail, new, n):
+    return [_scalar(x) for x in np.concatenate([np.asarray(prev_tail), np.asarray(new)])[-n:]]
+
+
+def _incremental(df, state, hold_back):
+    price_s, high_s, low_s, vol_s = resolve_columns(df)
+    p = price_s.to_numpy(dtype=float)
+    h = high_s.to_numpy(dtype=float)
+    lo = low_s.to_numpy(dtype=float)
+    v = vol_s.to_numpy()
+    m = len(df)
+    price_tail = np.asarray(state['price_tail'], dtype=float)
+    prev = np.concatenate([price_tail[-1:] if len(price_tail) else [np.nan], p[:-1]])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # RSI
+        d = p - prev
+        gain = np.where(d > 0, d, 0.0)
+        loss = np.where(d < 0, -d, 0.0)
+        ema = state['ema']
+        rsi_alpha = _ewm_alpha(alpha=1/_RSI_PERIOD)
+        avg_gain, _, _ = _ewm_continue(gain, *ema['gain'], rsi_alpha)
+        avg_loss, _, _ = _ewm_continue(loss, *ema['loss'], rsi_alpha)
+        rsi = 100 - (100 / (1 + avg_gain / avg_loss))
+        # MACD
+        fa, sa, ga = (_ewm_alpha(span=_MACD_SPANS[k]) for k in ('fast', 'slow', 'signal'))
+        ema_fast, _, _ = _ewm_continue(p, *ema['fast'], fa)
+        ema_slow, _, _ = _ewm_continue(p, *ema['slow'], sa)
+        macd_line = ema_fast - ema_slow
+        sig_line, _, _ = _ewm_continue(macd_line, *ema['signal'], ga)
+        # HV / ATR
+        logret = np.log(p / prev)
+        tr = np.fmax(np.fmax(h - lo, np.abs(h - prev)), np.abs(lo - prev))
+    hv = _rolling_tail(state['logret_tail'], logret, 20, 'std') * np.sqrt(252)
+    atr = _rolling_tail(state['tr_tail'], tr, _RSI_PERIOD, 'mean')
+    # MA / BB
+    ma5 = _rolling_tail(price_tail, p, 5, 'mean')
+    ma20 = _rolling_tail(price_tail, p, 20, 'mean')
+    ma60 = _rolling_tail(price_tail, p, 60, 'mean')
+    std20 = _rolling_tail(price_tail, p, 20, 'std')
+    # OBV
+    obv_tail = state['obv_tail']
+    step = np.where(p > prev, v, np.where(p < prev, -v, 0))
+    obv = np.cumsum(np.concatenate([[obv_tail[-1]], step]))[1:]
+    # VWAP
+    vp, _ = _running_cumsum(p * v, state['cum_vp'])
+    cv, _ = _running_cumsum(v, state['cum_v'])
+    vwap = vp / cv
+    # 背離：前 20 根的最高價 / 最高 OBV
+    ph = _rolling_tail(price_tail[-20:], p, 20, 'max', shift=1)
+    oh = _rolling_tail(obv_tail[-20:], obv, 20, 'max', shift=1)
+    divergence = (p > ph) & (obv < oh)
+
+    out = df.assign(
+        MA_5=ma5, MA_20=ma20, MA_60=ma60, RSI_14=rsi,
+        MACD_Line=macd_line, MACD_Signal=sig_line, MACD_Hist=macd_line - sig_line,
+        HV_20=hv, BB_MID=ma20, BB_UP=ma20 + 2 * std20, BB_DOWN=ma20 - 2 * std20,
+        ATR_14=atr, OBV=pd.Series(obv, index=df.index), VWAP=vwap, Divergence_20=divergence,
+    )
+
+    k = len(df) - 1 - hold_back
+    if k < 0:
+        return out, state
+    # 新狀態：由前次狀態延續計算至第 k 筆
+    n = k + 1
+    _, cum_vp = _running_cumsum(p[:n] * v[:n], state['cum_vp'])
+    _, cum_v = _running_cumsum(v[:n], state['cum_v'])
+    new_state = {
+        'last_index': df.index[k].isoformat(),
+        'count': int(state['count'] + n),
+        'price_tail': _tail_list(price_tail, p[:n], _TAIL),
+        'logret_tail': _tail_list(np.asarray(state['logret_tail'], dtype=float), logret[:n], 20),
+        'tr_tail': _tail_list(np.asarray(state['tr_tail'], dtype=float), tr[:n], _RSI_PERIOD),
+        'obv_tail': _tail_list(obv_tail, obv[:n], 20),
+        'cum_vp': _scalar(cum_vp),
+        'cum_v': _scalar(cum_v),
+        'ema': {
+            'gain': list(_ewm_continue(gain[:n], *ema['gain'], rsi_alpha)[1:]),
+            'loss': list(_ewm_continue(loss[:n], *ema['loss'], rsi_alpha)[1:]),
+            'fast': list(_ewm_continue(p[:n], *ema['fast'], fa)[1:]),
+            'slow': list(_ewm_continue(p[:n], *ema['slow'], sa)[1:]),
+            'signal': list(_ewm_continue(macd_line[:n], *ema['signal'], ga)[1:]),
+        },
+    }
+    return out, new_state
+
+
+def apply_technical_indicators_incremental(df, state=None, hold_back=1):
+    """
+    增量版 apply_technical_indicators
+    :param df: state 為 None 時為完整歷史；否則為 state['last_index'] 之後的新 K 棒
+    :param state: 上次回傳的狀態（可 JSON 序列化的 dict）
+    :param hold_back: 最後幾根不納入狀態（例如尚未收盤的 K 棒），下次會連同新資料重算
+    :return: (含指標欄位的 df, 新狀態)
+    """
+    if state is None:
+        return _full_with_state(df, hold_back)
+    if df.empty:
+        return apply_technical_indicators(df), state
+    return _incremental(df, state, hold_back)
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import tarfile
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+
+from metrics import get_metrics
+
+# --------------------------------------------------
+# 輸出資料夾壓縮
+#    - 於背景執行緒池壓縮，不佔用股票處理的執行緒（zlib / zstd 壓縮時會釋放 GIL）
+#    - 每個壓縮檔另存索引（檔名 → 大小、mtime、sha256）；大小與 mtime 未變的檔案沿用舊雜湊不重讀
+#    - 所有檔案內容與壓縮格式皆與上次相同、且壓縮檔仍在時略過壓縮
+#    - 檔案以固定大小分塊讀入壓縮檔，先寫暫存檔再 rename
+# 壓縮格式：
+#    - deflate: 一般 zip（預設，與既有流程相容）
+#    - store: zip 不壓縮，最快，適合內部再處理的用途
+#    - zstd: .tar.zst，壓縮與解壓皆比 deflate 快，需安裝 zstandard
+# --------------------------------------------------
+ARCHIVE_CODECS = ("deflate", "store", "zstd")
+_EXTENSIONS = {"deflate": ".zip", "store": ".zip", "zstd": ".tar.zst"}
+_CHUNK = 1024 * 1024
+
+
+def check_archive_codec(codec: str):
+    """
+    檢查壓縮格式是否可用；zstd 缺少 zstandard 時提早報錯
+    """
+    if codec not in ARCHIVE_CODECS:
+        raise ValueError(f"不支援的壓縮格式: {codec}（可用：{', '.join(ARCHIVE_CODECS)}）")
+    if codec == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("壓縮格式 zstd 需要安裝 zstandard") from e
+
+
+def archive_file_name(stem: str, codec: str = "deflate") -> str:
+    return f"{stem}{_EXTENSIONS[codec]}"
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _list_files(src_dir: Path) -> list[Path]:
+    # 寫到一半的暫存檔不納入
+    return sorted(p for p in src_dir.rglob("*") if p.is_file() and not p.name.endswith(".tmp"))
+
+
+def _write_zip(dest: Path, src_dir: Path, files: list[Path], codec: str):
+    compression = zipfile.ZIP_STORED if codec == "store" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(dest, "w", compression=compression) as zf:
+        for path in files:
+            info = zipfile.ZipInfo.from_file(path, path.relative_to(src_dir).as_posix())
+            info.compress_type = compression
+            with path.open("rb") as src, zf.open(info, "w") as out:
+                for chunk in iter(lambda: src.read(_CHUNK), b""):
+                    out.write(chunk)
+
+
+def _write_tar_zst(dest: Path, src_dir: Path, files: list[Path]):
+    import zstandard
+
+    with dest.open("wb") as raw, zstandard.ZstdCompressor(threads=-1).stream_writer(raw) as zst, \
+            tarfile.open(fileobj=zst, mode="w|") as tar:
+        for path in files:
+            tar.add(path, arcname=path.relative_to(src_dir).as_posix(), recursive=False)
+
+
+class Archiver:
+    def __init__(self, index_dir, codec: str = "deflate", workers: int = 2):
+        """
+        :param index_dir: 各壓縮檔雜湊索引的存放資料夾
+        :param codec: 壓縮格式，見 ARCHIVE_CODECS
+        :param workers: 背景壓縮執行緒數
+        """
+        check_archive_codec(codec)
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = codec
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="archive")
+
+    def submit(self, src_dir, dest_dir, stem: str) -> Future:
+        """
+        於背景壓縮 src_dir 為 dest_dir/<stem>.<副檔名>
+        :return: Future，結果為 (壓縮檔路徑, 是否實際重新壓縮)
+        """
+        return self._pool.submit(self.archive, Path(src_dir), Path(dest_dir), stem)
+
+    def archive(self, src_dir: Path, dest_dir: Path, stem: str) -> tuple[Path, bool]:
+        dest = dest_dir / archive_file_name(stem, self.codec)
+        index_path = self.index_dir / f"{stem}.json"
+        old = self._load_index(index_path)
+        old_files = old.get("files", {}) if old.get("codec") == self.codec else {}
+
+        files = _list_files(src_dir)
+        entries = {}
+        for path in files:
+            rel = path.relative_to(src_dir).as_posix()
+            st = path.stat()
+            prev = old_files.get(rel)
+            if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns:
+                digest = prev["sha256"]
+            else:
+                digest = _sha256(path)
+            entries[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": digest}
+
+        metrics = get_metrics()
+        unchanged = dest.exists() and old_files.keys() == entries.keys() and \
+            all(old_files[rel]["sha256"] == e["sha256"] for rel, e in entries.items())
+        if unchanged:
+            metrics.add("archives_skipped")
+            logging.info(f"[Info] 內容未變更，略過壓縮：{dest}")
+        else:
+            tmp = dest.with_name(f".{dest.name}.tmp")
+            with metrics.stage("zip"):
+                try:
+                    if self.codec == "zstd":
+                        _write_tar_zst(tmp, src_dir, files)
+                    else:
+                        _write_zip(tmp, src_dir, files, self.codec)
+                    os.replace(tmp, dest)
+                except BaseException:
+                    if tmp.exists():
+                        tmp.unlink()
+                    raise
+            metrics.add("archives_written")
+            logging.info(f"[Info] 完成壓縮：{dest}")
+        # 內容未變但 mtime 變了（例如重新寫出相同資料）時也更新索引，下次可直接比對 mtime
+        if not unchanged or entries != old_files:
+            self._save_index(index_path, {"codec": self.codec, "archive": dest.name, "files": entries})
+        return dest, not unchanged
+
+    @staticmethod
+    def _load_index(path: Path) -> dict:
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logging.warning(f"壓縮索引讀取失敗，將重新壓縮 {path.name}: {e}")
+            return {}
+
+    @staticmethod
+    def _save_index(path: Path, index: dict):
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(index, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def shutdown(self):
+        """
+        等待所有已送出的壓縮完成
+        """
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# --------------------------------------------------
+# 新聞內文快取
+#    - 以正規化 URL 的雜湊為鍵，保存擷取後的文字與下載資訊
+#    - TTL 到期自動失效；超過容量時依最後存取時間（LRU）淘汰
+#    - SQLite 單檔儲存，多執行緒共用同一個實例
+#    - 總大小與筆數於記憶體中累計，寫入時不重新加總；命中時的 last_access 累積後批次寫回
+# --------------------------------------------------
+# 累積多少筆 last_access 更新後寫回
+_ACCESS_FLUSH = 256
+# 容量已滿時，兩次清除過期項目的最短間隔秒數
+_PURGE_INTERVAL = 60
+# LRU 淘汰至容量上限的此比例，避免之後每次寫入都再觸發淘汰
+_LOW_WATER = 0.9
+# 每次自資料庫取出的淘汰候選筆數
+_EVICT_BATCH = 64
+
+# 不影響文章內容的追蹤參數
+_TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ocid", "cvid", "ei", "ref", "ref_src", "from", "spm", "guccounter",
+}
+_TRACKING_PREFIXES = ("utm_",)
+
+
+def normalize_url(url: str) -> str:
+    """
+    正規化 URL：小寫 scheme/host、去除預設埠與 fragment、移除追蹤參數、查詢參數排序
+    :param url: 原始連結
+    :return: 正規化後的連結
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme == "http" and parts.port == 80) or (scheme == "https" and parts.port == 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/")
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in _TRACKING_PARAMS and not k.lower().startswith(_TRACKING_PREFIXES)
+    ]
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+# 將目標網址放在查詢參數中的搜尋引擎轉址連結：(網域, 路徑開頭, 參數名稱)
+_WRAPPED_REDIRECTS = (
+    ("bing.com", "/news/apiclick", "url"),
+    ("google.com", "/url", "url"),
+    ("google.com", "/url", "q"),
+)
+
+
+def host_matches(host: str, domain: str) -> bool:
+    return host == domain or host.endswith("." + domain)
+
+
+def unwrap_link(link: str) -> str:
+    """
+    解開目標網址在查詢參數中的轉址連結（不發出請求），無法解開時回傳原連結
+    """
+    parts = urlsplit(link)
+    host = (parts.hostname or "").lower()
+    for domain, path, param in _WRAPPED_REDIRECTS:
+        if host_matches(host, domain) and parts.path.startswith(path):
+            target = dict(parse_qsl(parts.query)).get(param)
+            if target and target.startswith("http"):
+                return target
+    return link
+
+
+def link_key(link: str) -> str:
+    """
+    新聞連結的比對鍵：解開轉址後正規化；搜尋結果、去重與增量狀態皆以此比對
+    """
+    return normalize_url(unwrap_link(link))
+
+
+def url_key(url: str) -> str:
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+class ArticleCache:
+    def __init__(self, path, ttl_days: float = 30, max_bytes: int = 512 * 1024 * 1024, max_entries: int | None = None):
+        """
+        :param path: SQLite 檔案路徑
+        :param ttl_days: 快取有效天數
+        :param max_bytes: 內文總大小上限（位元組）
+        :param max_entries: 筆數上限，None 表示不限
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl_days * 86400
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS articles (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                final_url TEXT,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                http_status INTEGER,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_articles_access ON articles(last_access)")
+        self._conn.commit()
+        # 尚未寫回的 last_access：{key: 時間}
+        self._accessed: dict[str, float] = {}
+        self._last_purge = 0.0
+        with self._lock:
+            self._purge_expired()
+            self._total, self._count = self._conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM articles").fetchone()
+            self._conn.commit()
+
+    def get(self, url: str) -> dict | None:
+        """
+        查詢快取，過期或不存在回傳 None
+        :return: dict，含 content/url/final_url/http_status/fetched_at
+        """
+        key = url_key(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url, final_url, content, http_status, fetched_at, size FROM articles WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if now - row[4] > self.ttl:
+                self._conn.execute("DELETE FROM articles WHERE key = ?", (key,))
+                self._conn.commit()
+                self._accessed.pop(key, None)
+                self._total -= row[5]
+                self._count -= 1
+                self.misses += 1
+                return None
+            self._accessed[key] = now
+            if len(self._accessed) >= _ACCESS_FLUSH:
+                self._flush_access()
+                self._conn.commit()
+            self.hits += 1
+        return {"url": row[0], "final_url": row[1], "content": row[2], "http_status": row[3], "fetched_at": row[4]}
+
+    def put(self, url: str, content: str, final_url: str | None = None, http_status: int | None = None):
+        """
+        寫入快取並視需要淘汰最久未使用的項目；空內文不快取，下次會重新嘗試
+        """
+        if not content:
+            return
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        key = url_key(url)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM articles WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO articles (key, url, final_url, content, size, http_status, fetched_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, normalize_url(url), final_url, content, size, http_status, now, now),
+            )
+            self._accessed.pop(key, None)
+            self._total += size - (old[0] if old else 0)
+            self._count += 0 if old else 1
+            if not self._within_limits():
+                self._evict()
+            self._conn.commit()
+
+    def _within_limits(self, ratio: float = 1.0) -> bool:
+        return self._total <= self.max_bytes * ratio and (self.max_entries is None or self._count <= self.max_entries * ratio)
+
+    def _flush_access(self):
+        if self._accessed:
+            self._conn.executemany("UPDATE articles SET last_access = ? WHERE key = ?",
+                                   [(ts, key) for key, ts in self._accessed.items()])
+            self._accessed.clear()
+
+    def _purge_expired(self) -> bool:
+        # 清除過期項目；有刪除時回傳 True
+        now = time.time()
+        self._last_purge = now
+        return self._conn.execute("DELETE FROM articles WHERE fetched_at < ?", (now - self.ttl,)).rowcount > 0
+
+    def _evict(self):
+        # 超過容量時：先清除過期項目，仍超過再依 LRU 分批淘汰至低水位（_LOW_WATER）
+        if time.time() - self._last_purge >= _PURGE_INTERVAL and self._purge_expired():
+            self._total, self._count = self._conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM articles").fetchone()
+            if self._within_limits(_LOW_WATER):
+                return
+        # 寫回累積的存取時間，LRU 順序才正確
+        self._flush_access()
+        removed = 0
+        while not self._within_limits(_LOW_WATER):
+            # 每批只取最舊的少數幾筆（走 last_access 索引），不掃描整個資料表
+            batch = self._conn.execute(
+                "SELECT key, size FROM articles ORDER BY last_access ASC LIMIT ?", (_EVICT_BATCH,)
+            ).fetchall()
+            if not batch:
+                break
+            victims = []
+            for key, size in batch:
+                if self._within_limits(_LOW_WATER):
+                    break
+                victims.append((key,))
+                self._total -= size
+                self._count -= 1
+            self._conn.executemany("DELETE FROM articles WHERE key = ?", victims)
+            removed += len(victims)
+        if removed:
+            logging.info(f"新聞快取淘汰 {removed} 筆（剩餘 {self._count} 筆，{self._total / 1024 / 1024:.1f} MB）")
+
+    def close(self):
+        with self._lock:
+            self._flush_access()
+            self._conn.commit()
+            self._conn.close()
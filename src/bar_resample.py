@@ -0,0 +1,98 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# --------------------------------------------------
+# 由細頻率 K 棒合成粗頻率 K 棒
+#    - 對齊台股盤中時段 09:00–13:30（Asia/Taipei）
+#    - 13:30 收盤撮合的 K 棒併入最後一根
+# --------------------------------------------------
+SESSION_TZ = "Asia/Taipei"
+SESSION_OPEN = pd.Timedelta(hours=9)
+SESSION_MINUTES = 270  # 09:00 ~ 13:30
+
+_AGG = {
+    "Open": "first",
+    "High": "max",
+    "Low": "min",
+    "Close": "last",
+    "Volume": "sum",
+    "Dividends": "sum",
+    "Stock Splits": "max",
+}
+
+
+def interval_minutes(interval: str) -> int:
+    """
+    :param interval: 例如 5m / 15m / 60m / 1h
+    :return: 分鐘數
+    """
+    if interval.endswith("m"):
+        return int(interval[:-1])
+    if interval.endswith("h"):
+        return int(interval[:-1]) * 60
+    raise ValueError(f"不支援的 interval: {interval}")
+
+
+def resample_bars(df, interval):
+    """
+    將分鐘 K 棒合成較粗的 interval
+    :param df: 細頻率 K 棒（DatetimeIndex，需含 Open/High/Low/Close/Volume）
+    :param interval: 目標 interval，例如 15m / 30m / 60m
+    :return: 合成後的 DataFrame，索引為各 K 棒開始時間
+    """
+    if df.empty:
+        return df.copy()
+    minutes = interval_minutes(interval)
+    idx = df.index
+    local = idx.tz_convert(SESSION_TZ) if idx.tz is not None else idx
+    day_open = local.normalize() + SESSION_OPEN
+    offset = np.asarray((local - day_open) // pd.Timedelta(minutes=1))
+    # 最後一根涵蓋至 13:30（含收盤撮合）
+    last_bucket = (SESSION_MINUTES - 1) // minutes
+    bucket = np.clip(offset // minutes, 0, last_bucket)
+    labels = day_open + pd.to_timedelta(bucket * minutes, unit="m")
+    if idx.tz is not None:
+        labels = labels.tz_convert(idx.tz)
+
+    agg = {col: how for col, how in _AGG.items() if col in df.columns}
+    out = df.groupby(labels, sort=True).agg(agg)
+    out.index.name = df.index.name
+    return out[[c for c in df.columns if c in agg]]
+
+
+def compare_bars(derived, reference, rtol=1e-6):
+    """
+    比對合成 K 棒與 Yahoo 原生 K 棒
+    :param derived: resample_bars 的結果
+    :param reference: Yahoo 直接下載的同 interval K 棒
+    :param rtol: 相對誤差容許值
+    :return: dict，含共同 K 棒數、各欄位不一致數、僅出現在單邊的 K 棒數
+    """
+    common = derived.index.intersection(reference.index)
+    report = {
+        "common": len(common),
+        "only_derived": len(derived.index.difference(reference.index)),
+        "only_reference": len(reference.index.difference(derived.index)),
+        "mismatch": {},
+    }
+    for col in ["Open", "High", "Low", "Close", "Volume"]:
+        if col not in derived.columns or col not in reference.columns:
+            continue
+        a = derived.loc[common, col].to_numpy(dtype=float)
+        b = reference.loc[common, col].to_numpy(dtype=float)
+        bad = ~np.isclose(a, b, rtol=rtol, atol=0, equal_nan=True)
+        report["mismatch"][col] = int(bad.sum())
+    return report
+
+
+def log_comparison(label, interval, report):
+    mism = {k: v for k, v in report["mismatch"].items() if v}
+    if mism or report["only_derived"] or report["only_reference"]:
+        logging.warning(
+            f"{label} {interval} 合成 K 棒與 Yahoo 不一致：共同 {report['common']} 根，"
+            f"欄位差異 {mism}，僅合成 {report['only_derived']} 根，僅 Yahoo {report['only_reference']} 根"
+        )
+    else:
+        logging.info(f"{label} {interval} 合成 K 棒與 Yahoo 一致（{report['common']} 根）")
@@ -3,10 +3,18 @@ import os
 import time
 from urllib.parse import urlparse
 
-import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from newspaper import Article
+
+from article_cache import ArticleCache
+from concurrency import request_slot
+from deadline import DeadlineExceeded, request_timeout
+from hedge import get_hedger
+from metrics import get_metrics
+from news_extractors import ExtractionStats, extract_article
+from news_pipeline import is_known_page, parse_news_date
+from news_state import NewsCrawlState
+from rate_limit import THROTTLE_STATUS, get_limiter
 
 DEFAULT_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
@@ -15,11 +23,9 @@ DEFAULT_HEADERS = {
     "Cache-Control": "no-cache",
 }
 
-def _sleep_backoff(attempt: int, base: float = 1.0, factor: float = 1.6, jitter: float = 0.2):
-    delay = base * (factor ** max(0, attempt - 1))
-    time.sleep(delay + jitter)
-
 FALLBACK_REFERER = "https://www.bing.com/news/"
+# 可用環境變數 BING_NEWS_URL 改指向其他位址（例如 loadtest 的本機替身伺服器）
+BING_NEWS_URL = os.environ.get("BING_NEWS_URL", "https://www.bing.com/news/search")
 
 def _sanitize_header_value(val: str) -> str:
     try:
@@ -28,158 +34,138 @@ def _sanitize_header_value(val: str) -> str:
     except Exception:
         return FALLBACK_REFERER
 
-def _fetch_with_retry(session: requests.Session, url: str, max_retries: int = 3, timeout: int = 15, referer: str | None = None):
+def _fetch_with_retry(session: requests.Session, url: str, max_retries: int = 3, timeout: int = 15, referer: str | None = None, upstream: str = "article"):
+    # 重試間隔由 rate_limit 控制：限流（429/403/503、逾時、連線錯誤）時該網站速率減半，並遵守 Retry-After
+    host = urlparse(url).netloc.lower()
+    limiter = get_limiter()
+    metrics = get_metrics()
+    headers = {}
+    if referer:
+        headers["Referer"] = _sanitize_header_value(referer)
     for attempt in range(1, max_retries + 1):
+        # 逾時不超過目前股票 / 階段的剩餘預算；預算用完時拋出 DeadlineExceeded 不再重試
+        request_to = request_timeout(timeout)
+
+        def _get():
+            return session.get(url, timeout=request_to, headers=headers)
+
+        start = time.perf_counter()
         try:
-            headers = {}
-            if referer:
-                headers["Referer"] = _sanitize_header_value(referer)
-            resp = session.get(url, timeout=timeout, headers=headers)
-            resp.raise_for_status()
-            return resp
-        except Exception as e:
+            resp = get_hedger().call(host, _get, slot=lambda: request_slot(host, upstream))
+        except (requests.Timeout, requests.ConnectionError) as e:
+            metrics.record_request(upstream, time.perf_counter() - start, error=True, retry=attempt > 1)
+            limiter.throttled(host)
             if attempt >= max_retries:
                 raise
             logging.warning(f"請求失敗，第 {attempt} 次重試：{url}，原因：{e}")
-            _sleep_backoff(attempt)
-
-def get_full_article_content(url, session: requests.Session, timeout=15, search_referer: str | None = None):
+            continue
+        metrics.record_request(upstream, time.perf_counter() - start, nbytes=len(resp.content),
+                               error=resp.status_code >= 400, retry=attempt > 1)
+        limiter.report(host, resp.status_code, resp)
+        if resp.status_code < 400:
+            return resp
+        # 非限流的 4xx 重試也不會成功
+        if attempt >= max_retries or (resp.status_code < 500 and resp.status_code not in THROTTLE_STATUS):
+            resp.raise_for_status()
+        logging.warning(f"請求失敗，第 {attempt} 次重試：{url}，原因：HTTP {resp.status_code}")
+
+def _download_article(url, session: requests.Session, timeout=15, search_referer: str | None = None):
+    resp = _fetch_with_retry(session, url, max_retries=3, timeout=timeout, referer=search_referer)
+    return resp.text, resp.url, resp.status_code
+
+def extract_article_text(url, html):
+    """
+    由文章 HTML 擷取內文（純 CPU 運算，可於子行程執行）
+    """
+    return extract_article(url, html)[0]
+
+def get_full_article_content(url, session: requests.Session, timeout=15, search_referer: str | None = None, cache: ArticleCache | None = None):
+    if cache is not None:
+        hit = cache.get(url)
+        if hit is not None:
+            return hit["content"]
     try:
-        resp = _fetch_with_retry(session, url, max_retries=3, timeout=timeout, referer=search_referer)
-        html = resp.text
+        html, final_url, status = _download_article(url, session, timeout=timeout, search_referer=search_referer)
     except Exception as e:
         logging.error(f"無法下載: {url} ({e})")
         return ""
-    soup = BeautifulSoup(html, 'lxml')
-    domain = urlparse(url).netloc.lower()
-    content: list[str] = []
-
-    # 站點特化選擇器
-    selector_nodes = []
-    if 'stock.yahoo' in domain or 'tw.stock.yahoo' in domain:
-        tag = soup.find('article')
-        selector_nodes = tag.find_all('p') if tag else []
-    elif 'money.udn.com' in domain or 'udn.com' in domain:
-        body = soup.find('div', id='story_body_content') or soup.find('section', id='article-body')
-        selector_nodes = body.find_all('p') if body else []
-    elif 'ctee.com.tw' in domain:
-        body = soup.select_one('#newsContent') or soup.select_one('.article-main') or soup.select_one('.article_content')
-        selector_nodes = body.find_all('p') if body else []
-    elif 'chinatimes.com' in domain:
-        body = soup.select_one('div.article-body') or soup.select_one('#article-body')
-        selector_nodes = body.find_all('p') if body else []
-    elif 'moneydj.com' in domain:
-        body = soup.select_one('#divMain') or soup.select_one('.article') or soup.select_one('#news')
-        selector_nodes = body.find_all('p') if body else []
-    elif 'ltn.com.tw' in domain:
-        body = soup.select_one('div.text') or soup.select_one('#newstext')
-        selector_nodes = body.find_all('p') if body else []
-    elif 'cnyes.com' in domain:
-        body = soup.select_one('article') or soup.select_one('div._2E8yJ9') or soup.select_one('div.article')
-        selector_nodes = body.find_all('p') if body else []
-    else:
-        body = (
-            soup.find('article') or
-            soup.select_one('div.article') or
-            soup.select_one('div.article-content') or
-            soup.select_one('div.story')
-        )
-        selector_nodes = body.find_all('p') if body else []
-
-    for p in selector_nodes:
-        text = p.get_text(strip=True)
-        if text:
-            content.append(text)
-    if not content:
-        try:
-            article = Article(url, language='zh')
-            article.download(input_html=html)
-            article.parse()
-            content = [line.strip() for line in article.text.split('\n') if line.strip()]
-        except Exception as e:
-            logging.error(f"newspaper3k 解析失敗: {url} ({e})")
-    filtered = [line for line in content if len(line) > 10]
-    return '\n'.join(filtered).strip()
-
-def parse_bing_date(date_text):
-    import re
-    from datetime import datetime, timedelta
-    date_text = date_text.strip()
-    now = datetime.now()
-    # 「x 小時前」
-    m = re.match(r"(\d+)\s*小時前", date_text)
-    if m:
-        dt = now - timedelta(hours=int(m.group(1)))
-        return dt.strftime("%Y-%m-%d")
-    # 「x 分鐘前」
-    m = re.match(r"(\d+)\s*分鐘前", date_text)
-    if m:
-        dt = now - timedelta(minutes=int(m.group(1)))
-        return dt.strftime("%Y-%m-%d")
-    # 「x 天前」
-    m = re.match(r"(\d+)\s*天前", date_text)
-    if m:
-        dt = now - timedelta(days=int(m.group(1)))
-        return dt.strftime("%Y-%m-%d")
-    # 2025年5月21日 形式
-    m = re.match(r"(\d{4})年(\d{1,2})月(\d{1,2})日", date_text)
-    if m:
-        dt = datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)))
-        return dt.strftime("%Y-%m-%d")
-    # 其他格式直接回傳原始
-    return date_text
-
-def bing_scrape_stock_news(keyword, output_dir, max_pages=2, sleep_sec=2):
-    results = []
+    text = extract_article_text(url, html)
+    if cache is not None:
+        cache.put(url, text, final_url=final_url, http_status=status)
+    return text
+
+def parse_bing_results(html) -> list[dict]:
+    """
+    解析 Bing 新聞搜尋結果頁
+    :return: 每則新聞的 publish_date / date / title / link
+    """
+    soup = BeautifulSoup(html, "lxml")
+    items = []
+    for a in soup.find_all("a", {"class": "title"}):
+        title = a.get_text(strip=True)
+        link = a.get("href")
+        if not link:
+            continue
+        publish_date = ""
+        parent_div = a.find_parent("div")
+        date = ""
+        if parent_div:
+            span = parent_div.find("span", attrs={"aria-label": True})
+            if span:
+                date = span["aria-label"]
+                publish_date = parse_news_date(date)
+
+        items.append({
+            'publish_date': publish_date,
+            'date': date,
+            "title": title,
+            "link": link,
+        })
+    return items
+
+def new_bing_session() -> requests.Session:
     session = requests.Session()
     session.headers.update(DEFAULT_HEADERS)
-    search_base = FALLBACK_REFERER
-    session.headers.setdefault("Referer", search_base)
-
+    session.headers.setdefault("Referer", FALLBACK_REFERER)
+    return session
+
+def bing_search_pages(keyword, session: requests.Session, max_pages=2, sleep_sec=2, known: set | None = None, newest: str | None = None):
+    """
+    逐頁取得 Bing 新聞搜尋結果
+    :param sleep_sec: Bing 的起始請求間隔，之後依回應自適應調整
+    :param known: 已看過的正規化連結；某頁結果全部已看過（或早於 newest）時停止翻頁
+    :param newest: 上次爬取到的最新 publish_date
+    :return: 產生 (頁次, 該頁新聞) 的 generator
+    """
+    if sleep_sec:
+        get_limiter().seed(urlparse(BING_NEWS_URL).netloc, 1.0 / sleep_sec)
     for page in range(max_pages):
         offset = page * 10
-        url = f"https://www.bing.com/news/search?q={keyword}&qft=interval%3d%228%22&first={offset+1}"
+        url = f"{BING_NEWS_URL}?q={keyword}&qft=interval%3d%228%22&first={offset+1}"
         try:
-            resp = _fetch_with_retry(session, url, max_retries=3, timeout=15, referer=search_base)
+            resp = _fetch_with_retry(session, url, max_retries=3, timeout=15, referer=FALLBACK_REFERER, upstream="bing")
+        except DeadlineExceeded:
+            logging.warning(f"{keyword} 時間預算已用完，停止翻頁")
+            return
         except Exception as e:
             logging.error(f"Bing 第 {page+1} 頁下載失敗: {e}")
-            time.sleep(sleep_sec)
             continue
-        soup = BeautifulSoup(resp.text, "lxml")
-        news_cards = soup.find_all("a", {"class": "title"})
-        for a in news_cards:
-            title = a.get_text(strip=True)
-            link = a.get("href")
-            if not link:
-                continue
-            content = get_full_article_content(link, session=session, timeout=15, search_referer=search_base)
-            time.sleep(0.4)
-            publish_date = ""
-            parent_div = a.find_parent("div")
-            date = ""
-            if parent_div:
-                span = parent_div.find("span", attrs={"aria-label": True})
-                if span:
-                    date = span["aria-label"]
-                    publish_date = parse_bing_date(date)
-
-            results.append({
-                'publish_date': publish_date,
-                'date': date,
-                "title": title,
-                "link": link,
-                'content': content
-            })
-        time.sleep(sleep_sec)
-
-    df = pd.DataFrame(results)
-
-    safe = keyword.replace(' ', '_')
-    output_file = f"{safe}_news.csv"
-    os.makedirs(output_dir, exist_ok=True)
-    df.to_csv(os.path.join(output_dir, output_file), index=False, encoding='utf-8-sig')
-    logging.info(f"共 {len(df)} 筆")
-    # print(df)
+        items = parse_bing_results(resp.text)
+        if is_known_page(items, known or set(), newest):
+            logging.info(f"{keyword} Bing 第 {page+1} 頁皆為已抓取過的新聞，停止翻頁")
+            return
+        yield page, items
+
+def bing_scrape_stock_news(keyword, output_dir, max_pages=2, sleep_sec=2, output_format="csv", cache: ArticleCache | None = None, article_workers=8, parse_pool=None, extract_stats: ExtractionStats | None = None,
+                          state: NewsCrawlState | None = None):
+    """
+    只搜尋 Bing 的 news_providers.scrape_news，參數意義相同
+    """
+    # news_providers 匯入本模組，於此處匯入避免循環匯入
+    from news_providers import scrape_news
+
+    scrape_news(keyword, output_dir, sources=("bing",), max_pages=max_pages, sleep_sec=sleep_sec, output_format=output_format, cache=cache,
+                article_workers=article_workers, parse_pool=parse_pool, extract_stats=extract_stats, state=state)
 
 
 if __name__ == "__main__":
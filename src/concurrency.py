@@ -0,0 +1,116 @@
+import threading
+from contextlib import contextmanager
+
+from rate_limit import get_limiter
+
+# --------------------------------------------------
+# 上游服務併發上限
+#    - yahoo: yfinance 價格資料
+#    - finmind: FinMind API
+#    - bing: Bing 新聞搜尋頁
+#    - google: Google 新聞搜尋頁
+#    - article: 各新聞網站文章內文
+# --------------------------------------------------
+DEFAULT_UPSTREAM_LIMITS = {
+    "yahoo": 4,
+    "finmind": 4,
+    "bing": 2,
+    "google": 1,
+    "article": 8,
+}
+
+_lock = threading.Lock()
+_limits: dict[str, int] = dict(DEFAULT_UPSTREAM_LIMITS)
+_semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+
+def configure_upstream_limits(limits: dict[str, int] | None = None):
+    """
+    設定各上游服務的同時請求上限，未指定者沿用預設值
+    :param limits: 例如 {"yahoo": 2, "article": 16}，值為 None 或小於 1 者忽略
+    """
+    with _lock:
+        for name, value in (limits or {}).items():
+            if value is None or value < 1:
+                continue
+            _limits[name] = int(value)
+            # 重新建立 semaphore，讓新的上限生效
+            _semaphores.pop(name, None)
+
+
+def get_upstream_limit(name: str) -> int:
+    with _lock:
+        return _limits.get(name, 1)
+
+
+def _get_semaphore(name: str) -> threading.BoundedSemaphore:
+    with _lock:
+        sem = _semaphores.get(name)
+        if sem is None:
+            sem = threading.BoundedSemaphore(_limits.get(name, 1))
+            _semaphores[name] = sem
+        return sem
+
+
+@contextmanager
+def upstream_slot(name: str):
+    """
+    取得指定上游的請求名額，離開 with 區塊時釋放
+    :param name: 上游名稱（yahoo / finmind / bing / article）
+    """
+    sem = _get_semaphore(name)
+    sem.acquire()
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+# --------------------------------------------------
+# 單一網站（host）的併發上限
+#    - 新聞文章分散在不同網站，可同時下載；同一網站則限制同時請求數
+#    - 請求間隔由 rate_limit 依各網站回應自適應調整
+# --------------------------------------------------
+DEFAULT_HOST_LIMIT = 2
+
+_host_config = {"limit": DEFAULT_HOST_LIMIT}
+_host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+
+
+def configure_host_limits(limit: int | None = None):
+    """
+    :param limit: 每個網站的同時請求上限
+    """
+    with _lock:
+        if limit is not None and limit >= 1:
+            _host_config["limit"] = int(limit)
+            _host_semaphores.clear()
+
+
+@contextmanager
+def host_slot(host: str):
+    """
+    取得指定網站的請求名額，並等待至該網站允許下一個請求
+    應在 upstream_slot 之外取得，避免等待期間佔用上游名額
+    :param host: 網站主機名稱，例如 money.udn.com
+    """
+    host = host.lower()
+    with _lock:
+        sem = _host_semaphores.get(host)
+        if sem is None:
+            sem = _host_semaphores[host] = threading.BoundedSemaphore(_host_config["limit"])
+    sem.acquire()
+    try:
+        get_limiter().acquire(host)
+        yield
+    finally:
+        sem.release()
+
+
+@contextmanager
+def request_slot(host: str, upstream: str):
+    """
+    依序取得網站與上游的請求名額（host_slot 在外）
+    """
+    with host_slot(host), upstream_slot(upstream):
+        yield
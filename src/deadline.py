@@ -0,0 +1,115 @@
+import contextvars
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# --------------------------------------------------
+# 時間預算
+#    - 每檔股票、每個階段各有時間預算；巢狀範圍取較早的期限
+#    - 對外請求以 request_timeout() 取得「不超過剩餘預算」的逾時秒數
+#    - 預算用完後的請求直接拋出 DeadlineExceeded，階段改為輸出部分結果並標記
+#    - 以 contextvars 傳遞，送入執行緒池時需以 contextvars.copy_context().run 包裝
+# --------------------------------------------------
+
+
+class DeadlineExceeded(TimeoutError):
+    """時間預算已用完"""
+
+
+class Deadline:
+    def __init__(self, seconds: float | None, label: str = "", parent: "Deadline | None" = None):
+        """
+        :param seconds: 預算秒數，None 表示不限（沿用上層期限）
+        :param label: 名稱，例如股票代號或階段名稱
+        :param parent: 上層期限
+        """
+        self.label = label
+        self.parent = parent
+        own = time.monotonic() + seconds if seconds is not None else None
+        inherited = parent.expires_at if parent is not None else None
+        candidates = [t for t in (own, inherited) if t is not None]
+        self.expires_at = min(candidates) if candidates else None
+        self.tripped = False
+
+    def remaining(self) -> float | None:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def trip(self):
+        # 記錄此範圍（及上層）曾因預算不足而放棄工作
+        d = self
+        while d is not None:
+            d.tripped = True
+            d = d.parent
+
+
+_current: contextvars.ContextVar[Deadline | None] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Deadline | None:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float | None, label: str = ""):
+    """
+    在 with 區塊內套用時間預算
+    :return: Deadline
+    """
+    d = Deadline(seconds, label, parent=_current.get())
+    token = _current.set(d)
+    try:
+        yield d
+    finally:
+        _current.reset(token)
+
+
+def request_timeout(default: float) -> float:
+    """
+    取得請求逾時秒數：預設值與剩餘預算取小者；預算已用完時拋出 DeadlineExceeded
+    """
+    d = _current.get()
+    if d is None:
+        return default
+    remaining = d.remaining()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        d.trip()
+        raise DeadlineExceeded(f"{d.label} 時間預算已用完")
+    return min(default, remaining)
+
+
+def check_deadline():
+    """
+    預算已用完時拋出 DeadlineExceeded
+    """
+    request_timeout(float("inf"))
+
+
+# --------------------------------------------------
+# 部分輸出標記
+# --------------------------------------------------
+def partial_marker_path(output_dir, stage: str) -> str:
+    return os.path.join(output_dir, f"_PARTIAL_{stage}.json")
+
+
+def mark_partial(output_dir, stage: str, reason: str):
+    """
+    於輸出資料夾寫入 _PARTIAL_<stage>.json，表示該階段的輸出不完整
+    """
+    with open(partial_marker_path(output_dir, stage), "w", encoding="utf-8") as f:
+        json.dump({"stage": stage, "reason": reason, "marked_at": time.strftime("%Y-%m-%d %H:%M:%S")}, f, ensure_ascii=False)
+
+
+def clear_partial(output_dir, stage: str):
+    try:
+        os.remove(partial_marker_path(output_dir, stage))
+    except FileNotFoundError:
+        pass
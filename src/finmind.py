@@ -1,44 +1,376 @@
 import logging
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
 
 import pandas as pd  # 資料處理套件
 import requests  # HTTP 請求套件，用於呼叫 API
+from requests.adapters import HTTPAdapter
+
+from concurrency import get_upstream_limit, upstream_slot
+from deadline import request_timeout
+from finmind_store import FinMindStore
+from manifest import note_failure
+from metrics import get_metrics
+from rate_limit import get_limiter, retry_after_seconds
+from output_io import write_frame
 # --------------------------------------------------
 # 一、FinMind API 抓取函式
 # --------------------------------------------------
-def get_finmind_data(dataset, data_id=None, start_date=None, token=None):
+# 可用環境變數 FINMIND_API_URL 改指向其他位址（例如 loadtest 的本機替身伺服器）
+FINMIND_API_URL = os.environ.get("FINMIND_API_URL", "https://api.finmindtrade.com/api/v4/data")
+FINMIND_HOST = urlparse(FINMIND_API_URL).netloc.lower()
+# FinMind 免費方案每小時請求上限：有 token 600 次、無 token 300 次
+DEFAULT_REQUESTS_PER_HOUR = {True: 600, False: 300}
+
+
+class FinMindError(RuntimeError):
+    """FinMind 請求失敗（與「查無資料」區分）"""
+
+
+class FinMindRateLimited(FinMindError):
+    """FinMind 回應額度用盡（HTTP 429 / 402）"""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_hour: float, capacity: int | None = None):
+        """
+        :param rate_per_hour: 每小時補充的權杖數
+        :param capacity: 可累積的權杖上限（允許的瞬間請求數），預設為 5 分鐘份
+        """
+        self.rate = rate_per_hour / 3600.0
+        self.capacity = capacity or max(1, int(rate_per_hour // 12))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # 取得一個權杖，不足時等待補充
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        # 上游回報額度用盡時清空權杖，讓其他執行緒一併放慢
+        with self._lock:
+            self._tokens = 0.0
+            self._last = time.monotonic()
+
+
+class FinMindClient:
+    def __init__(self, token=None, requests_per_hour: int | None = None, max_retries: int = 4, timeout: float = 20):
+        """
+        共用連線池、限速與重試的 FinMind 用戶端，可多執行緒共用
+        :param token: API Token
+        :param requests_per_hour: 每小時請求上限，預設依是否有 token 採用免費方案額度
+        :param max_retries: 429/402、5xx 與連線錯誤的最大重試次數
+        :param timeout: 單次請求逾時秒數
+        重試間隔由 rate_limit 控制：失敗時 FinMind 的請求速率減半，並遵守 Retry-After
+        """
+        self.token = token
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.bucket = TokenBucket(requests_per_hour or DEFAULT_REQUESTS_PER_HOUR[bool(token)])
+        pool = max(4, get_upstream_limit("finmind"))
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool))
+        self._stats: dict[str, dict] = {}
+        self._stats_lock = threading.Lock()
+
+    def _record(self, dataset, **inc):
+        with self._stats_lock:
+            st = self._stats.setdefault(dataset, {"requests": 0, "errors": 0, "retries": 0, "rate_limited": 0,
+                                                  "latency_total": 0.0, "latency_max": 0.0})
+            for k, v in inc.items():
+                if k == "latency":
+                    st["latency_total"] += v
+                    st["latency_max"] = max(st["latency_max"], v)
+                else:
+                    st[k] += v
+
+    def stats(self) -> dict:
+        """
+        各資料集的請求數、錯誤數、重試數、額度限制次數與平均/最大延遲（秒）
+        """
+        with self._stats_lock:
+            out = {}
+            for dataset, st in self._stats.items():
+                out[dataset] = dict(st, latency_avg=st["latency_total"] / st["requests"] if st["requests"] else 0.0)
+            return out
+
+    def log_stats(self):
+        for dataset, st in sorted(self.stats().items()):
+            logging.info(
+                f"FinMind {dataset}: 請求 {st['requests']} 次，錯誤 {st['errors']}，重試 {st['retries']}，"
+                f"額度限制 {st['rate_limited']}，平均延遲 {st['latency_avg']:.2f}s，最大 {st['latency_max']:.2f}s"
+            )
+
+    def get(self, dataset, data_id=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        擷取指定資料集；查無資料回傳空 DataFrame，請求失敗拋出 FinMindError
+        :return: 若含 date 欄位，自動轉為時間索引
+        """
+        params = {"dataset": dataset}
+        if data_id is not None:
+            params["data_id"] = data_id
+        if start_date is not None:
+            params["start_date"] = start_date
+        if end_date is not None:
+            params["end_date"] = end_date
+        if self.token:
+            params["token"] = self.token
+
+        limiter = get_limiter()
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            self.bucket.acquire()
+            limiter.acquire(FINMIND_HOST)
+            request_to = request_timeout(self.timeout)
+            start = time.monotonic()
+            resp = None
+            try:
+                with upstream_slot("finmind"):
+                    resp = self.session.get(FINMIND_API_URL, params=params, timeout=request_to)
+                payload = resp.json() if resp.status_code == 200 else {}
+            except (requests.RequestException, ValueError) as e:
+                get_metrics().record_request("finmind", time.monotonic() - start, nbytes=len(resp.content) if resp is not None else 0,
+                                             error=True, retry=attempt > 0)
+                self._record(dataset, requests=1, latency=time.monotonic() - start)
+                if last:
+                    self._record(dataset, errors=1)
+                    raise FinMindError(f"{dataset} {data_id} 請求失敗: {e}") from e
+                limiter.throttled(FINMIND_HOST)
+                self._record(dataset, retries=1)
+                continue
+            self._record(dataset, requests=1, latency=time.monotonic() - start)
+            get_metrics().record_request("finmind", time.monotonic() - start, nbytes=len(resp.content),
+                                         error=resp.status_code != 200, retry=attempt > 0)
+
+            # FinMind 額度用盡時回 402（部分情況 HTTP 200 但 payload status 為 402）
+            status = payload.get("status", resp.status_code) if resp.status_code == 200 else resp.status_code
+            if status in (429, 402):
+                self.bucket.drain()
+                limiter.throttled(FINMIND_HOST, retry_after_seconds(resp))
+                self._record(dataset, rate_limited=1)
+                if last:
+                    self._record(dataset, errors=1)
+                    raise FinMindRateLimited(f"{dataset} {data_id} 額度用盡: {payload.get('msg') or resp.status_code}")
+                self._record(dataset, retries=1)
+                continue
+            if resp.status_code >= 500:
+                limiter.throttled(FINMIND_HOST, retry_after_seconds(resp))
+                if last:
+                    self._record(dataset, errors=1)
+                    raise FinMindError(f"{dataset} {data_id} 伺服器錯誤 HTTP {resp.status_code}")
+                self._record(dataset, retries=1)
+                continue
+            if status != 200:
+                self._record(dataset, errors=1)
+                raise FinMindError(f"{dataset} {data_id} 請求失敗: HTTP {status} {payload.get('msg', '')}".rstrip())
+
+            limiter.success(FINMIND_HOST)
+            df = pd.DataFrame(payload.get("data", []))
+            if not df.empty and 'date' in df.columns:
+                df['date'] = pd.to_datetime(df['date'])
+                df.set_index('date', inplace=True)
+            return df
+
+
+_default_clients: dict = {}
+_default_clients_lock = threading.Lock()
+
+
+def get_finmind_data(dataset, data_id=None, start_date=None, token=None, end_date=None):
     """
-    使用 FinMind API 擷取指定資料集
+    使用 FinMind API 擷取指定資料集（同一 token 共用一個 FinMindClient）
     :param dataset: 資料集名稱
     :param data_id: 資料 ID（如股票代碼）
     :param start_date: 起始日期，格式 'YYYY-MM-DD'
     :param token: API Token
+    :param end_date: 結束日期，格式 'YYYY-MM-DD'，省略時至最新
     :return: pandas DataFrame，
-            若含 date 欄位，自動轉為時間索引
+            若含 date 欄位，自動轉為時間索引；查無資料時為空 DataFrame
+    :raises FinMindError: 請求失敗或額度用盡
+    """
+    with _default_clients_lock:
+        client = _default_clients.get(token)
+        if client is None:
+            client = _default_clients[token] = FinMindClient(token)
+    return client.get(dataset, data_id=data_id, start_date=start_date, end_date=end_date)
+
+
+class FinMindFetcher:
+    """
+    單次執行共用的 FinMind 抓取層：相同 (dataset, data_id, start_date) 的請求只發出一次，
+    同時進行中的相同請求會等待並共用同一份結果
+    只有 keep=True 的結果（如各股票共用的 TAIEX 報酬指數）保留到執行結束，其餘完成後即釋放；
+    prime 放入的結果在取用一次後釋放，記憶體不隨股票數累積
+    回傳的 DataFrame 為共用物件，呼叫端不可就地修改
+    """
+
+    def __init__(self, token=None, client: FinMindClient | None = None):
+        self.client = client or FinMindClient(token)
+        self.token = self.client.token
+        self.requests = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._results: dict[tuple, Future] = {}
+        # prime 放入的結果：{key: (DataFrame, 資料涵蓋的起始日)}
+        self._primed: dict[tuple, tuple[pd.DataFrame, str]] = {}
+
+    def fetch(self, dataset, data_id=None, start_date=None, keep=False):
+        """
+        :param keep: 保留結果供之後相同請求共用；False 時只與同時進行中的相同請求共用
+        """
+        key = (dataset, data_id, start_date)
+        with self._lock:
+            primed = self._take(key, start_date)
+            fut = self._results.get(key)
+            owner = fut is None and primed is None
+            if owner:
+                fut = Future()
+                self._results[key] = fut
+                self.requests += 1
+            else:
+                self.shared += 1
+        if primed is not None:
+            return primed
+        if owner:
+            try:
+                fut.set_result(self.client.get(dataset, data_id=data_id, start_date=start_date))
+            except BaseException as e:
+                # 失敗的結果不保留，之後的呼叫會重新請求
+                with self._lock:
+                    self._results.pop(key, None)
+                fut.set_exception(e)
+            else:
+                if not keep:
+                    # 等待中的呼叫端已持有 fut，移除後不影響它們取得結果
+                    with self._lock:
+                        self._results.pop(key, None)
+        return fut.result()
+
+    def _take(self, key, since):
+        entry = self._primed.get(key)
+        if entry is None or since is None or since < entry[1]:
+            return None
+        del self._primed[key]
+        return entry[0]
+
+    def take(self, dataset, data_id=None, start_date=None, since=None):
+        """
+        取出 prime 放入的結果並釋放
+        :param since: 需要的資料起始日，預設同 start_date；prime 的資料未涵蓋時不取出
+        :return: DataFrame，尚未放入或未涵蓋所需區間時回傳 None
+        """
+        with self._lock:
+            return self._take((dataset, data_id, start_date), since or start_date)
+
+    def prime(self, dataset, data_id, start_date, df, covered_from=None):
+        """
+        預先放入已取得的結果，之後相同請求（或 take）取用一次
+        :param covered_from: df 涵蓋的起始日，預設同 start_date（全市場模式可能只下載水位之後的部分）
+        """
+        with self._lock:
+            self._primed[(dataset, data_id, start_date)] = (df, covered_from or start_date)
+
+
+# 可不指定 data_id 一次取得全市場的日資料集
+BULK_DATASETS = (
+    "TaiwanStockPER",
+    "TaiwanStockInstitutionalInvestorsBuySell",
+    "TaiwanStockMarginPurchaseShortSale",
+)
+
+
+def get_finmind_market_data(dataset, start_date, end_date=None, token=None, client: FinMindClient | None = None):
+    """
+    全市場模式：不指定 data_id，逐個交易日取得所有股票的資料後合併
+    （FinMind 未指定 data_id 時一次只回傳單日資料）
+    :return: 以 (stock_id, date) 為索引並排序的 DataFrame；任一日失敗即拋出例外
     """
-    # 組成參數字典
-    params = {"dataset": dataset}
-    if data_id is not None:
-        params["data_id"] = data_id
-    if start_date is not None:
-        params["start_date"] = start_date
-    if token:
-        params["token"] = token
-    try:
-        resp = requests.get("https://api.finmindtrade.com/api/v4/data", params=params, timeout=20)
-        resp.raise_for_status()
-        data = resp.json().get("data", [])
-        df = pd.DataFrame(data)
-        if not df.empty and 'date' in df.columns:
-            df['date'] = pd.to_datetime(df['date'])
-            df.set_index('date', inplace=True)
-        return df
-    except Exception as e:
-        logging.error(f"FinMind API 錯誤: dataset={dataset}, id={data_id}, err={e}")
+    days = pd.bdate_range(start=start_date, end=end_date or pd.Timestamp.today().normalize())
+
+    def _one_day(day):
+        d = day.strftime('%Y-%m-%d')
+        if client is not None:
+            return client.get(dataset, start_date=d, end_date=d)
+        return get_finmind_data(dataset, start_date=d, end_date=d, token=token)
+
+    with ThreadPoolExecutor(max_workers=get_upstream_limit("finmind"), thread_name_prefix="finmind-bulk") as pool:
+        frames = [df for df in pool.map(_one_day, days) if not df.empty]
+    if not frames:
         return pd.DataFrame()
+    df = pd.concat(frames)
+    return df.set_index('stock_id', append=True).swaplevel().sort_index()
+
+
+def bulk_start_date(store: FinMindStore | None, dataset, stock_ids, default_start) -> str:
+    """
+    全市場下載的起始日：各股票本地歷史水位中最早者；任一檔沒有歷史（或未使用本地歷史）時為 default_start
+    """
+    if store is None:
+        return default_start
+    marks = []
+    for stock_id in stock_ids:
+        mark = store.watermark(store.load(dataset, stock_id))
+        if mark is None:
+            return default_start
+        marks.append(mark)
+    return min(marks).strftime('%Y-%m-%d') if marks else default_start
+
+
+def bulk_prefetch(fetcher: FinMindFetcher, stock_ids, start_date, datasets=BULK_DATASETS, store: FinMindStore | None = None):
+    """
+    以全市場資料預先填入 fetcher：每個資料集數百次請求取代「股票數 × 資料集」次請求
+    拆回各股票後的結果與逐檔請求相同（date 索引、含 stock_id 欄位）；
+    某資料集下載失敗時不填入，該資料集退回逐檔請求
+    :param store: 本地歷史；提供時只下載各股票水位之後的部分（見 bulk_start_date）
+    """
+    wanted = set(stock_ids)
+    for dataset in datasets:
+        since = bulk_start_date(store, dataset, wanted, start_date)
+        try:
+            market = get_finmind_market_data(dataset, since, client=fetcher.client)
+        except Exception as e:
+            logging.warning(f"FinMind 全市場下載失敗，{dataset} 改為逐檔請求: {e}")
+            continue
+        found = set()
+        if not market.empty:
+            for stock_id, part in market.groupby(level='stock_id', sort=False):
+                if stock_id not in wanted:
+                    continue
+                part = part.reset_index('stock_id')
+                fetcher.prime(dataset, stock_id, start_date, part, covered_from=since)
+                found.add(stock_id)
+        # 市場資料中沒有的股票即為（該區間）無資料，不必再逐檔請求
+        for stock_id in wanted - found:
+            fetcher.prime(dataset, stock_id, start_date, pd.DataFrame(), covered_from=since)
+        logging.info(f"FinMind 全市場 {dataset}（{since} 起）：{len(found)}/{len(wanted)} 檔有資料")
 
 
-def finmind_data(stock_id, one_year_ago, finmind_token, output_dir):
+def _fetch_since(fetcher, finmind_token, dataset, data_id, default_start, since, shared=False):
+    # 全市場模式已預先取得整年資料時直接切出所需區段，不再另發請求
+    # shared：各股票共用的資料（如 TAIEX），結果保留整個執行期間
+    if fetcher is not None:
+        primed = fetcher.take(dataset, data_id, default_start, since=since)
+        if primed is not None:
+            return primed[primed.index >= pd.Timestamp(since)] if not primed.empty else primed
+        return fetcher.fetch(dataset, data_id=data_id, start_date=since, keep=shared)
+    return get_finmind_data(dataset, data_id=data_id, start_date=since, token=finmind_token)
+
+
+def finmind_data(stock_id, one_year_ago, finmind_token, output_dir, output_format="csv", fetcher: FinMindFetcher | None = None,
+                 store: FinMindStore | None = None):
 # --------------------------------------------------
 # 二、取得 FinMind API 資料(法人、財務、新聞資料)
 # --------------------------------------------------  
@@ -49,25 +381,29 @@ def finmind_data(stock_id, one_year_ago, finmind_token, output_dir):
         {"dataset": "TaiwanStockMarginPurchaseShortSale", "data_id": stock_id, "start_date": one_year_ago},
         {"dataset": "TaiwanStockMonthRevenue", "data_id": stock_id, "start_date": one_year_ago},
         {"dataset": "TaiwanStockFinancialStatements", "data_id": stock_id, "start_date": one_year_ago},
-        {"dataset": "TaiwanStockTotalReturnIndex", "data_id": "TAIEX", "start_date": one_year_ago}
+        {"dataset": "TaiwanStockTotalReturnIndex", "data_id": "TAIEX", "start_date": one_year_ago, "shared": True}
     ]
     for item in finmind_datasets:
         try:
-            df_fm = get_finmind_data(
-                item['dataset'],
-                data_id=item.get('data_id'),
-                start_date=item.get('start_date'),
-                token=finmind_token
-            )
+            dataset, data_id, start, shared = item['dataset'], item.get('data_id'), item.get('start_date'), item.get('shared', False)
+            if store is not None:
+                # 增量同步：只請求水位之後的資料，輸出仍為近一年
+                history = store.sync(dataset, data_id, start,
+                                     lambda since: _fetch_since(fetcher, finmind_token, dataset, data_id, start, since, shared))
+                df_fm = history[history.index >= pd.Timestamp(start)] if not history.empty else history
+            else:
+                df_fm = _fetch_since(fetcher, finmind_token, dataset, data_id, start, start, shared)
             if df_fm.empty:
                 logging.info(f"{stock_id} {item['dataset']} 無資料，跳過輸出")
                 continue
-            file_name = f"FinMind_{item['dataset']}_{item.get('data_id', '')}.csv"
-            os.makedirs(output_dir, exist_ok=True)
-            df_fm.to_csv(os.path.join(output_dir, file_name), encoding='utf-8-sig')
+            file_name = write_frame(df_fm, output_dir, f"FinMind_{item['dataset']}_{item.get('data_id', '')}", fmt=output_format)
             logging.info(f"已輸出 {file_name} 共 {len(df_fm)} 筆資料")
+        except FinMindRateLimited as e:
+            logging.error(f"FinMind 額度用盡，{stock_id} {item['dataset']} 未取得: {e}")
+            note_failure()
         except Exception as e:
             logging.error(f"FinMind 資料處理/輸出失敗 {stock_id} {item}: {e}")
+            note_failure()
 
 
 
@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+import pandas as pd
+
+# --------------------------------------------------
+# FinMind 本地歷史與水位
+#    - 每個 (dataset, data_id) 一個檔案，以 pickle 保存完整歷史
+#    - 水位 = 歷史中最後一個日期；下次只從水位當天起請求（含當天，以涵蓋當日修正）
+#    - 公布頻率固定的資料集在新資料可能出現前直接沿用本地歷史
+# --------------------------------------------------
+
+# 下一筆資料最早可能出現的日期 = 水位 + 位移
+#    - 月營收：date 為公布月份的第一天，下一筆至少一個月後
+#    - 財報：date 為季末日，下一季至少要到下一個季末之後
+_PUBLISH_SCHEDULE = {
+    "TaiwanStockMonthRevenue": pd.DateOffset(months=1),
+    "TaiwanStockFinancialStatements": pd.offsets.QuarterEnd(1),
+}
+
+
+def next_possible_date(dataset: str, watermark):
+    """
+    :return: 新資料最早可能出現的日期；無固定公布週期的資料集回傳 None
+    """
+    offset = _PUBLISH_SCHEDULE.get(dataset)
+    if offset is None or watermark is None:
+        return None
+    return pd.Timestamp(watermark).normalize() + offset
+
+
+class FinMindStore:
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: 快取資料夾，不存在時自動建立
+        同一實例在單次執行中對相同 (dataset, data_id) 只同步一次，結果由各股票共用
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._synced: dict[tuple, Future] = {}
+
+    def _path(self, dataset: str, data_id) -> Path:
+        return self.cache_dir / f"{dataset}_{data_id}.pkl"
+
+    def load(self, dataset: str, data_id) -> pd.DataFrame:
+        """
+        讀取本地歷史，無快取或檔案損毀時回傳空 DataFrame
+        """
+        path = self._path(dataset, data_id)
+        if not path.exists():
+            return pd.DataFrame()
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            logging.warning(f"FinMind 快取讀取失敗，將重新下載 {path.name}: {e}")
+            return pd.DataFrame()
+
+    def save(self, dataset: str, data_id, df: pd.DataFrame):
+        path = self._path(dataset, data_id)
+        tmp = path.with_suffix(".pkl.tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def watermark(df: pd.DataFrame):
+        return df.index.max() if not df.empty else None
+
+    def sync(self, dataset: str, data_id, start_date: str, fetch) -> pd.DataFrame:
+        """
+        同步單一資料集並回傳完整歷史
+        :param start_date: 無本地歷史時的起始日期
+        :param fetch: fetch(start_date) -> DataFrame，實際向 FinMind 請求
+        :return: 合併後的歷史（date 索引）；回傳物件為共用，呼叫端不可就地修改
+        """
+        key = (dataset, data_id)
+        with self._lock:
+            fut = self._synced.get(key)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._synced[key] = fut
+        if owner:
+            try:
+                fut.set_result(self._sync(dataset, data_id, start_date, fetch))
+            except BaseException as e:
+                with self._lock:
+                    self._synced.pop(key, None)
+                fut.set_exception(e)
+        return fut.result()
+
+    def _sync(self, dataset, data_id, start_date, fetch):
+        history = self.load(dataset, data_id)
+        mark = self.watermark(history)
+        next_date = next_possible_date(dataset, mark)
+        if next_date is not None and pd.Timestamp.today().normalize() < next_date:
+            with self._lock:
+                self.skipped += 1
+            logging.info(f"{dataset} {data_id} 最新資料為 {mark:%Y-%m-%d}，{next_date:%Y-%m-%d} 前不會有新資料，沿用本地歷史")
+            return history
+
+        since = mark.strftime('%Y-%m-%d') if mark is not None else start_date
+        fresh = fetch(since)
+        if history.empty:
+            merged = fresh
+        elif fresh.empty:
+            merged = history
+        else:
+            # 同一日期可能有多筆（如各法人、各財報科目），以日期為單位整段替換
+            merged = pd.concat([history[history.index < pd.Timestamp(since)], fresh]).sort_index(kind="stable")
+        if not merged.empty:
+            self.save(dataset, data_id, merged)
+        return merged
@@ -6,157 +6,163 @@ from urllib.parse import urlparse
 import pandas as pd
 import requests
 from GoogleNews import GoogleNews
-from bs4 import BeautifulSoup
-from newspaper import Article
 
+from concurrency import host_slot, upstream_slot
+from deadline import check_deadline, request_timeout
+from metrics import get_metrics
+from rate_limit import get_limiter
+from news_extractors import extract_article
+from news_pipeline import is_known_page, parse_news_date
 
-def get_full_article_content(url, timeout=10):
+
+def get_full_article_content(url, timeout=10, cache=None):
     """
-    下載並解析文章完整內文。根據網域選擇解析策略，並以 newspaper3k 作為備援。
+    下載並解析文章完整內文。依網域選用 news_extractors 的站點擷取器，並以 newspaper3k 作為備援。
 
     參數:
       url: 文章連結
       timeout: HTTP 請求超時秒數
+      cache: ArticleCache，命中時不重新下載
     回傳:
       文章文字內容 (字串)
     """
+    if cache is not None:
+        hit = cache.get(url)
+        if hit is not None:
+            return hit["content"]
     try:
-        resp = requests.get(url, timeout=timeout)
+        host = urlparse(url).netloc.lower()
+        request_to = request_timeout(timeout)
+        start = time.perf_counter()
+        try:
+            with host_slot(host), upstream_slot("article"):
+                resp = requests.get(url, timeout=request_to)
+        except requests.RequestException:
+            get_metrics().record_request("article", time.perf_counter() - start, error=True)
+            raise
+        get_metrics().record_request("article", time.perf_counter() - start, nbytes=len(resp.content), error=resp.status_code >= 400)
+        get_limiter().report(host, resp.status_code, resp)
         resp.raise_for_status()
         html = resp.text
     except Exception as e:
         logging.error(f"無法下載: {url} ({e})")
         return ""
 
-    soup = BeautifulSoup(html, 'lxml')
-    domain = urlparse(url).netloc.lower()
-    content = []
-
-    # 不同新聞站的 DOM 結構
-    if 'stock.yahoo' in domain:
-        tag = soup.find('article')
-        selector = tag.find_all('p') if tag else []
-    elif 'money.udn.com' in domain:
-        body = soup.find('div', id='story_body_content')
-        selector = body.find_all('p') if body else []
-    else:
-        selector = []
-
-    # 優先使用 BeautifulSoup 擷取段落
-    for p in selector:
-        text = p.get_text(strip=True)
-        if text:
-            content.append(text)
-
-    # 若未透過 BS4 擷取到，轉由 newspaper3k
-    if not content:
-        try:
-            article = Article(url, language='zh')
-            article.download(input_html=html)
-            article.parse()
-            content = article.text.split('\n')
-        except Exception as e:
-            logging.error(f"newspaper3k 解析失敗: {url} ({e})")
-
-    # 回傳純文字，並去除過短段落
-    filtered = [line for line in content if len(line) > 10]
-    return '\n'.join(filtered).strip()
-
-
-import re
-from datetime import datetime, timedelta
-
-def parse_news_date(date_str):
-    date_str = date_str.strip()
-    now = datetime.now()
-    # 處理「x 天前」
-    m = re.match(r'(\d+)\s*天前', date_str)
-    if m:
-        days = int(m.group(1))
-        dt = now - timedelta(days=days)
-        return dt.strftime('%Y-%m-%d')
-    # 處理「x 小時前」
-    m = re.match(r'(\d+)\s*小時前', date_str)
-    if m:
-        hours = int(m.group(1))
-        dt = now - timedelta(hours=hours)
-        return dt.strftime('%Y-%m-%d')
-    # 處理「x 分鐘前」
-    m = re.match(r'(\d+)\s*分鐘前', date_str)
-    if m:
-        mins = int(m.group(1))
-        dt = now - timedelta(minutes=mins)
-        return dt.strftime('%Y-%m-%d')
-    # 處理 YYYY/MM/DD 或 YYYY-MM-DD 格式
-    m = re.match(r'(\d{4})[/-](\d{1,2})[/-](\d{1,2})', date_str)
-    if m:
-        try:
-            dt = datetime.strptime(date_str, '%Y/%m/%d')
-        except ValueError:
-            dt = datetime.strptime(date_str, '%Y-%m-%d')
-        return dt.strftime('%Y-%m-%d')
-    # 其他未能判讀的格式，直接傳回原值
-    return date_str
+    text = extract_article(url, html)[0]
+    if cache is not None:
+        cache.put(url, text, final_url=resp.url, http_status=resp.status_code)
+    return text
 
 
-def google_scrape_stock_news(
-    keyword,
-    period='7d',
-    start_page=1,
-    end_page=2,
-    output_dir='output',
-    output_file=None,
-    sleep_interval=5
-):
+GOOGLE_HOST = "www.google.com"
+
+
+def _clean_google_link(link):
+    # GoogleNews 回傳的連結常帶有 &ved=、&usg= 等追蹤尾巴
+    for marker in ('&ved=', '&usg='):
+        link = link.split(marker)[0]
+    return link
+
+
+def google_search(keyword, period='7d', start_page=1, end_page=2, sleep_interval=5, known=None, newest=None):
     """
-    擷取指定股票新聞並輸出 CSV。
+    取得 Google 新聞搜尋結果（不含內文）
 
     參數:
-      keyword: 搜尋關鍵字 (e.g. '2354 鴻準')
+      keyword: 搜尋關鍵字
       period: 時間範圍 ('7d','1m')
       start_page: 起始頁數
       end_page: 結束頁數
-      output_dir: 輸出資料夾
-      output_file: 輸出檔名 (不含路徑)
-      sleep_interval: 分頁請求間隔 (秒)
+      sleep_interval: 起始分頁請求間隔 (秒)，之後由 rate_limit 調整
+      known: 已看過的正規化連結；某頁結果全部已看過（或早於 newest）時停止翻頁
+      newest: 上次爬取到的最新 publish_date
+    回傳:
+      每則新聞的 publish_date / date / title / link
     """
-    # 建立輸出資料夾
-    os.makedirs(output_dir, exist_ok=True)
-
     news_api = GoogleNews(lang='zh-TW', region='TW')
     news_api.set_period(period)
-    news_api.search(keyword)
-
-    records = []
     logging.info(f"搜尋: '{keyword}' | 範圍: {period} | 頁 {start_page}~{end_page}")
 
+    # GoogleNews 自行發出請求，無法取得狀態碼；以 sleep_interval 為起始間隔、成功取得結果即回報成功
+    limiter = get_limiter()
+    if sleep_interval:
+        limiter.seed(GOOGLE_HOST, 1.0 / sleep_interval)
+    records = []
     for page in range(start_page, end_page + 1):
         logging.info(f"擷取第 {page} 頁...")
-        news_api.get_page(page)
+        # results() 會累積先前各頁，逐頁清空
+        news_api.clear()
+        check_deadline()
+        limiter.acquire(GOOGLE_HOST)
+        # GoogleNews 不提供回應內容大小，僅記錄耗時
+        start = time.perf_counter()
+        with upstream_slot("google"):
+            if page == start_page:
+                # search() 設定關鍵字並取得第 1 頁
+                news_api.search(keyword)
+                if page != 1:
+                    news_api.clear()
+                    news_api.get_page(page)
+            else:
+                news_api.get_page(page)
         items = news_api.results()
+        get_metrics().record_request("google", time.perf_counter() - start)
+        if items:
+            limiter.success(GOOGLE_HOST)
         if not items:
             logging.info(f"第 {page} 頁無結果，提前結束。")
             break
 
+        page_records = []
         for item in items:
-            title = item.get('title', '').strip()
-            date = item.get('date', '').strip()
-            link = item.get('link', '').strip()
+            title = (item.get('title') or '').strip()
+            date = (item.get('date') or '').strip()
+            link = _clean_google_link((item.get('link') or '').strip())
             if not link:
                 continue
-            logging.info(f"下載內文: {title}")
-            content = get_full_article_content(link)
-            publish_date = parse_news_date(date)  # ← 這行是關鍵！
-            records.append({
-                'publish_date': publish_date,  # 新增標準化日期欄位
+            page_records.append({
+                'publish_date': parse_news_date(date),  # 標準化日期欄位
                 'date': date,
                 'title': title,
                 'link': link,
-                'content': content
             })
+        if is_known_page(page_records, known or set(), newest):
+            logging.info(f"{keyword} Google 第 {page} 頁皆為已抓取過的新聞，停止翻頁")
+            break
+        records.extend(page_records)
+    return records
+
+
+def google_scrape_stock_news(
+    keyword,
+    period='7d',
+    start_page=1,
+    end_page=2,
+    output_dir='output',
+    output_file=None,
+    sleep_interval=5,
+    cache=None
+):
+    """
+    擷取指定股票新聞並輸出 CSV。
 
+    參數:
+      keyword: 搜尋關鍵字 (e.g. '2354 鴻準')
+      period: 時間範圍 ('7d','1m')
+      start_page: 起始頁數
+      end_page: 結束頁數
+      output_dir: 輸出資料夾
+      output_file: 輸出檔名 (不含路徑)
+      sleep_interval: 分頁請求間隔 (秒)
+      cache: ArticleCache，已擷取過的文章不重新下載
+    """
+    # 建立輸出資料夾
+    os.makedirs(output_dir, exist_ok=True)
 
-    time.sleep(sleep_interval)
+    records = google_search(keyword, period=period, start_page=start_page, end_page=end_page, sleep_interval=sleep_interval)
+    for record in records:
+        logging.info(f"下載內文: {record['title']}")
+        record['content'] = get_full_article_content(record['link'], cache=cache)
 
     df = pd.DataFrame(records)
 
@@ -166,4 +172,4 @@ def google_scrape_stock_news(
         output_file = f"{safe}_news.csv"
     os.makedirs(output_dir, exist_ok=True)
     df.to_csv(os.path.join(output_dir, output_file), index=False, encoding='utf-8-sig')
-    logging.info(f"共 {len(df)} 筆")
\ No newline at end of file
+    logging.info(f"共 {len(df)} 筆")
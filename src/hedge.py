@@ -0,0 +1,127 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+
+from rate_limit import get_limiter
+
+# --------------------------------------------------
+# 對沖請求（hedged request）
+#    - 記錄各網站最近的請求延遲
+#    - 請求超過該網站延遲的指定百分位仍未完成時，再送出一個相同請求，取先成功者
+#    - 延遲只計網路請求本身，不含等待網站 / 上游名額與速率限制的時間；對沖門檻也自取得名額後起算
+#    - 僅用於可重複的 GET；延遲樣本不足或該網站正在限流時不對沖
+# --------------------------------------------------
+
+
+class Hedger:
+    def __init__(self, percentile: float = 95, min_samples: int = 20, window: int = 200, max_workers: int = 16):
+        """
+        :param percentile: 超過此百分位延遲即送出對沖請求
+        :param min_samples: 樣本數達此數量才開始對沖
+        :param window: 每個網站保留的最近樣本數
+        :param max_workers: 執行請求的執行緒數
+        """
+        self.enabled = False
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._window = window
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._latency: dict[str, deque] = {}
+        self._pool: ThreadPoolExecutor | None = None
+
+    def configure(self, enabled: bool, percentile: float | None = None):
+        with self._lock:
+            self.enabled = enabled
+            if percentile is not None:
+                self.percentile = percentile
+
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            samples = self._latency.get(host)
+            if samples is None:
+                samples = self._latency[host] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def threshold(self, host: str) -> float | None:
+        """
+        :return: 該網站延遲的百分位數（秒），樣本不足時為 None
+        """
+        with self._lock:
+            samples = sorted(self._latency.get(host, ()))
+        if len(samples) < self.min_samples:
+            return None
+        idx = min(len(samples) - 1, int(round(self.percentile / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="hedge")
+            return self._pool
+
+    def _attempt(self, host, fn, slot, started: threading.Event | None = None):
+        try:
+            with slot():
+                if started is not None:
+                    started.set()
+                t0 = time.monotonic()
+                result = fn()
+                self.record(host, time.monotonic() - t0)
+                return result
+        finally:
+            # 取得名額失敗時也要放行等待中的呼叫端
+            if started is not None:
+                started.set()
+
+    def call(self, host: str, fn, slot=None):
+        """
+        執行請求；啟用對沖且已超過延遲門檻時送出第二個相同請求
+        :param fn: 無參數的請求函式，失敗時拋出例外
+        :param slot: 無參數、回傳 context manager 的函式，每個請求送出前於其中取得網站 / 上游名額
+        """
+        slot = slot or nullcontext
+        threshold = self.threshold(host) if self.enabled else None
+        if threshold is None or get_limiter().is_throttled(host):
+            return self._attempt(host, fn, slot)
+
+        pool = self._get_pool()
+        started = threading.Event()
+        first = pool.submit(contextvars.copy_context().run, self._attempt, host, fn, slot, started)
+        started.wait()
+        done, _ = wait([first], timeout=threshold)
+        # 等待期間網站開始限流時不再加送請求
+        if done or get_limiter().is_throttled(host):
+            return first.result()
+        with self._lock:
+            self.hedged += 1
+        second = pool.submit(contextvars.copy_context().run, self._attempt, host, fn, slot)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is second:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return fut.result()
+                error = error or fut.exception()
+        raise error
+
+    def log_summary(self):
+        if self.enabled:
+            logging.info(f"對沖請求 {self.hedged} 次，其中 {self.hedge_wins} 次由對沖請求先完成")
+
+
+_hedger = Hedger()
+
+
+def get_hedger() -> Hedger:
+    return _hedger
@@ -1,15 +1,31 @@
 from datetime import datetime, timedelta
 import logging
 import os
-import shutil
 from pathlib import Path
 import argparse
+import contextvars
+import threading
 import traceback
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
 
-from bing_new import bing_scrape_stock_news
-from finmind import finmind_data
+from archive import ARCHIVE_CODECS, Archiver, check_archive_codec
+from article_cache import ArticleCache
+from concurrency import configure_host_limits, configure_upstream_limits
+from deadline import DeadlineExceeded, clear_partial, deadline_scope, mark_partial, partial_marker_path
+from finmind import FinMindClient, FinMindFetcher, bulk_prefetch, finmind_data
+from finmind_store import FinMindStore
+from hedge import get_hedger
+from manifest import RunManifest, collect_outputs, note_failure
+from metrics import get_metrics, profile_call
+from news_extractors import ExtractionStats
+from news_providers import NEWS_SOURCES, scrape_news
+from news_state import NewsCrawlState
+from output_io import OUTPUT_FORMATS, check_output_format
+from rate_limit import configure_rate_limits, get_limiter
 from tqdm import tqdm
-from yf_client import yfinance_data
+from yf_client import apply_panel_indicators, get_yfinance_data_batch, yfinance_data
 
 
 def setup_logger(log_path: Path) -> logging.Logger:
@@ -50,35 +66,412 @@ def parse_stocks_file(path: Path) -> list[str]:
     return stocks
 
 
-def run_pipeline(stocks: list[str], data_dir: Path, finmind_token: str | None, max_pages: int, sleep_sec: int, zip_output: bool = True):
-    data_dir.mkdir(parents=True, exist_ok=True)
-    one_year_ago = (datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d')
+# 股票時間預算用完後，再等待各階段收尾的秒數
+_BUDGET_GRACE_SEC = 5
+# 每檔股票的資料來源階段；執行紀錄以 (股票, 階段) 為單位，壓縮另記為 "zip"
+STAGES = ("yfinance", "finmind", "news")
+
+
+@dataclass
+class _RunContext:
+    # 單次執行共用的設定與資源
+    data_dir: Path
+    one_year_ago: str
+    finmind_token: str | None
+    max_pages: int
+    sleep_sec: int
+    zip_output: bool
+    output_format: str = "csv"
+    yf_kwargs: dict = field(default_factory=dict)
+    prefetched_prices: dict | None = None
+    # prefetched_prices 是否已以 panel 方式算好技術指標
+    panel_indicators: bool = False
+    article_cache: ArticleCache | None = None
+    finmind: FinMindFetcher | None = None
+    finmind_store: FinMindStore | None = None
+    parse_pool: ProcessPoolExecutor | None = None
+    news_sources: tuple = ("bing",)
+    news_state: NewsCrawlState | None = None
+    extract_stats: ExtractionStats = field(default_factory=ExtractionStats)
+    # 同一檔股票的各階段是否平行執行（併發模式）
+    parallel_stages: bool = False
+    stock_budget: float | None = None
+    stage_budget: float | None = None
+    manifest: RunManifest | None = None
+    archiver: Archiver | None = None
+    resume: bool = False
+    resume_max_age: float | None = None
+
+
+def _yf_stage(ctx: _RunContext, stock_id: str, sub_dir: Path):
+    # yfinance；批次模式已預抓（或已以 panel 算好指標）時直接使用
+    prefetched = ctx.prefetched_prices or {}
+    yfinance_data(
+        stock_id=stock_id,
+        output_dir=str(sub_dir),
+        price_data=prefetched.get(stock_id),
+        output_format=ctx.output_format,
+        indicators_computed=ctx.panel_indicators and stock_id in prefetched,
+        **ctx.yf_kwargs,
+    )
+
+
+def _finmind_stage(ctx: _RunContext, stock_id: str, sub_dir: Path):
+    finmind_data(
+        stock_id=stock_id,
+        output_dir=str(sub_dir),
+        one_year_ago=ctx.one_year_ago,
+        finmind_token=ctx.finmind_token,
+        output_format=ctx.output_format,
+        fetcher=ctx.finmind,
+        store=ctx.finmind_store,
+    )
+
+
+def _news_stage(ctx: _RunContext, stock_id: str, stock_name: str, sub_dir: Path):
+    # 新聞（Bing / Google 同時搜尋、去重後合併輸出）
+    scrape_news(
+        keyword=f"{stock_id} {stock_name}",
+        sources=ctx.news_sources,
+        max_pages=ctx.max_pages,
+        sleep_sec=ctx.sleep_sec,
+        output_dir=str(sub_dir),
+        output_format=ctx.output_format,
+        cache=ctx.article_cache,
+        parse_pool=ctx.parse_pool,
+        extract_stats=ctx.extract_stats,
+        state=ctx.news_state,
+    )
+
+
+def _process_stock(stock_str: str, ctx: _RunContext):
+    try:
+        if "_" not in stock_str:
+            logging.info(f"跳過不合法的股票格式: {stock_str}")
+            return
+        stock_id, stock_name = stock_str.split("_", 1)
+        tqdm.write(f"正在處理：{stock_id} {stock_name}")
+        sub_dir = ctx.data_dir / f"{stock_id}_{stock_name}"
+        sub_dir.mkdir(parents=True, exist_ok=True)
 
-    for stock_str in tqdm(stocks, desc="股票處理進度"):
+        stages = [
+            ("yfinance", lambda: _yf_stage(ctx, stock_id, sub_dir)),
+            ("finmind", lambda: _finmind_stage(ctx, stock_id, sub_dir)),
+            ("news", lambda: _news_stage(ctx, stock_id, stock_name, sub_dir)),
+        ]
+        unfinished = []
+        with get_metrics().stage("stock"), deadline_scope(ctx.stock_budget, label=stock_id) as stock_deadline:
+            if not ctx.parallel_stages:
+                for name, fn in stages:
+                    _run_stage(name, fn, stock_str, sub_dir, ctx)
+            else:
+                # 同一檔股票內各資料來源彼此獨立，平行執行；任一階段失敗視為該股票失敗
+                futures = [(name, _start_stage(f"stage-{stock_id}-{name}", _run_stage, name, fn, stock_str, sub_dir, ctx))
+                           for name, fn in stages]
+                remaining = stock_deadline.remaining()
+                wait([f for _, f in futures], timeout=None if remaining is None else max(0.0, remaining) + _BUDGET_GRACE_SEC)
+                for name, f in futures:
+                    if not f.done():
+                        # 卡住的階段不再等待，已寫出的檔案視為部分輸出
+                        unfinished.append(name)
+                        get_metrics().add("partial_stages")
+                        mark_partial(sub_dir, name, "超過時間預算仍未結束")
+                        logging.warning(f"{stock_id} {name} 超過時間預算仍未結束，不再等待")
+                        continue
+                    exc = f.exception()
+                    if exc is not None:
+                        raise RuntimeError(f"{name} 階段失敗: {exc}") from exc
+
+        if unfinished:
+            # 仍在執行的階段可能繼續寫入資料夾，不壓縮也不記錄壓縮檔，續跑時整檔重做
+            logging.warning(f"{stock_id} 尚有未結束的階段（{', '.join(unfinished)}），略過壓縮")
+        elif ctx.archiver is not None:
+            # 壓縮交給背景執行緒池，此執行緒直接處理下一檔股票；內容未變更時由 Archiver 略過
+            future = ctx.archiver.submit(sub_dir, ctx.data_dir, sub_dir.name)
+            future.add_done_callback(lambda f: _archive_done(f, stock_str, ctx))
+    except Exception as e:
+        logging.error(f"處理 {stock_str} 失敗: {e}")
+        logging.error(traceback.format_exc())
+
+
+def _start_stage(thread_name: str, fn, *args) -> Future:
+    """
+    於 daemon 執行緒執行階段並回傳 Future
+    超過預算仍卡住的呼叫不佔用執行緒池，也不會讓整批執行或行程結束時等待它
+    """
+    future = Future()
+    run = contextvars.copy_context().run
+
+    def _target():
+        if not future.set_running_or_notify_cancel():
+            return
         try:
-            if "_" not in stock_str:
-                logging.info(f"跳過不合法的股票格式: {stock_str}")
-                continue
-            stock_id, stock_name = stock_str.split("_", 1)
-            tqdm.write(f"正在處理：{stock_id} {stock_name}")
-            sub_dir = data_dir / f"{stock_id}_{stock_name}"
-            sub_dir.mkdir(parents=True, exist_ok=True)
-
-            # yfinance
-            yfinance_data(stock_id=stock_id, output_dir=str(sub_dir))
-            # FinMind
-            finmind_data(stock_id=stock_id, output_dir=str(sub_dir), one_year_ago=one_year_ago, finmind_token=finmind_token)
-            # Bing 新聞
-            bing_scrape_stock_news(keyword=f"{stock_id} {stock_name}", max_pages=max_pages, sleep_sec=sleep_sec, output_dir=str(sub_dir))
-
-            if zip_output:
-                zip_name = f"{stock_id}_{stock_name}"
-                zip_path = data_dir / zip_name
-                shutil.make_archive(str(zip_path), 'zip', str(sub_dir))
-                logging.info(f"[Info] 完成壓縮：{zip_path}.zip")
+            future.set_result(run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_target, name=thread_name, daemon=True).start()
+    return future
+
+
+def _archive_done(future, stock_str: str, ctx: _RunContext):
+    # 背景壓縮完成：記錄到執行紀錄（壓縮的格式欄位存壓縮格式）；失敗時記錄錯誤
+    exc = future.exception()
+    if exc is not None:
+        logging.error(f"壓縮 {stock_str} 失敗: {exc}")
+        return
+    dest, _ = future.result()
+    if ctx.manifest is not None:
+        ctx.manifest.record(stock_str, "zip", [dest.name], ctx.archiver.codec)
+
+
+def _stage_complete(ctx: _RunContext, stock_str: str, stage: str, output_dir: Path, fmt: str | None = None) -> bool:
+    return ctx.resume and ctx.manifest is not None and \
+        ctx.manifest.is_complete(stock_str, stage, output_dir, fmt or ctx.output_format, ctx.resume_max_age)
+
+
+def _run_stage(name: str, fn, stock_str: str, sub_dir: Path, ctx: _RunContext):
+    """
+    在階段時間預算內執行；預算用完時保留已完成的部分並寫入 _PARTIAL_<stage>.json 標記
+    完成（或失敗）後將輸出檔、失敗數與是否為部分輸出寫入執行紀錄
+    """
+    if _stage_complete(ctx, stock_str, name, sub_dir):
+        logging.info(f"{stock_str} {name} 已於先前執行完成，略過")
+        get_metrics().add("resumed_stages")
+        return
+    clear_partial(sub_dir, name)
+    try:
+        with get_metrics().stage(name), deadline_scope(ctx.stage_budget, label=name) as stage_deadline, collect_outputs() as outputs:
+            try:
+                fn()
+            except DeadlineExceeded as e:
+                stage_deadline.trip()
+                logging.warning(f"{sub_dir.name} {name} 中止: {e}")
+            except Exception:
+                # 階段本身失敗：記錄為錯誤（續跑時重做）後交由呼叫端處理
+                note_failure()
+                raise
+            if stage_deadline.tripped:
+                get_metrics().add("partial_stages")
+                mark_partial(sub_dir, name, "時間預算用完，部分資料未取得")
+                logging.warning(f"{sub_dir.name} {name} 超過時間預算，輸出不完整")
+    finally:
+        if ctx.manifest is not None:
+            # 超過等待時間而被主流程標記為部分輸出的階段，即使之後跑完也不視為完成
+            partial = stage_deadline.tripped or os.path.exists(partial_marker_path(sub_dir, name))
+            ctx.manifest.record(stock_str, name, outputs.files, ctx.output_format, errors=outputs.errors, partial=partial)
+
+
+def _prefetch_prices(stocks: list[str], batch_size: int, yf_kwargs: dict, panel_indicators: bool = False) -> dict:
+    # 批次模式：先以 yf.download 分批抓齊所有股票的價格；批次中失敗的股票不放入結果，之後逐檔重抓
+    # panel_indicators 時每批下載完即對整批股票一次計算技術指標
+    stock_ids = [s.split("_", 1)[0] for s in stocks if "_" in s]
+    prefetched: dict = {}
+    for i in range(0, len(stock_ids), batch_size):
+        chunk = stock_ids[i:i + batch_size]
+        try:
+            data, failures = get_yfinance_data_batch(
+                chunk, cache_dir=yf_kwargs['cache_dir'], derive_intraday=yf_kwargs['derive_intraday'],
+                verify_resample=yf_kwargs['verify_resample'],
+                trim=not (yf_kwargs['incremental_indicators'] and yf_kwargs['cache_dir'] is not None))
         except Exception as e:
-            logging.error(f"處理 {stock_str} 失敗: {e}")
-            logging.error(traceback.format_exc())
+            logging.error(f"yfinance 批次下載失敗，改為逐檔下載 {chunk}: {e}")
+            continue
+        for sid in failures:
+            logging.warning(f"{sid} 批次下載部分失敗，改為逐檔下載: {'; '.join(failures[sid])}")
+        data = {sid: frames for sid, frames in data.items() if sid not in failures}
+        prefetched.update(apply_panel_indicators(data) if panel_indicators else data)
+    return prefetched
+
+
+def run_pipeline(
+    stocks: list[str],
+    data_dir: Path,
+    finmind_token: str | None,
+    max_pages: int,
+    sleep_sec: int,
+    zip_output: bool = True,
+    workers: int = 1,
+    # 併發與速率
+    upstream_limits: dict[str, int] | None = None,
+    host_limit: int | None = None,
+    host_delay: float | None = None,
+    hedge: bool = False,
+    hedge_percentile: float = 95,
+    # 價格
+    price_cache_dir: Path | None = None,
+    yf_batch_size: int = 0,
+    derive_intraday: bool = True,
+    verify_resample: bool = False,
+    incremental_indicators: bool = False,
+    panel_indicators: bool = True,
+    # FinMind
+    finmind_bulk: bool = False,
+    finmind_requests_per_hour: int | None = None,
+    finmind_cache_dir: Path | None = None,
+    # 新聞
+    news_sources: tuple = ("bing",),
+    news_state_dir: Path | None = None,
+    parse_workers: int = 0,
+    article_cache_path: Path | None = None,
+    article_cache_ttl_days: float = 30,
+    article_cache_max_mb: int = 512,
+    # 輸出與壓縮
+    output_format: str = "csv",
+    archive_codec: str = "deflate",
+    archive_workers: int = 2,
+    # 時間預算、續跑與觀測
+    stock_budget: float | None = None,
+    stage_budget: float | None = None,
+    resume: bool = False,
+    resume_max_age_hours: float | None = 12,
+    metrics_dir: Path | None = None,
+    profile_stock: str | None = None,
+):
+    check_output_format(output_format)
+    if zip_output:
+        check_archive_codec(archive_codec)
+    unknown = [name for name in news_sources if name not in NEWS_SOURCES]
+    if unknown:
+        raise ValueError(f"不支援的新聞來源: {', '.join(unknown)}（可用：{', '.join(NEWS_SOURCES)}）")
+    data_dir.mkdir(parents=True, exist_ok=True)
+    metrics = get_metrics()
+    metrics.reset()
+    configure_upstream_limits(upstream_limits)
+    configure_host_limits(host_limit)
+    get_hedger().configure(hedge, hedge_percentile)
+    configure_rate_limits(initial_rate=1.0 / host_delay if host_delay else None)
+    ctx = _RunContext(
+        data_dir=data_dir,
+        one_year_ago=(datetime.today() - timedelta(days=365)).strftime('%Y-%m-%d'),
+        finmind_token=finmind_token,
+        max_pages=max_pages,
+        sleep_sec=sleep_sec,
+        zip_output=zip_output,
+        output_format=output_format,
+        finmind=FinMindFetcher(client=FinMindClient(finmind_token, requests_per_hour=finmind_requests_per_hour)),
+        finmind_store=FinMindStore(finmind_cache_dir) if finmind_cache_dir else None,
+        news_state=NewsCrawlState(news_state_dir) if news_state_dir else None,
+        news_sources=tuple(news_sources),
+        stock_budget=stock_budget,
+        stage_budget=stage_budget,
+        manifest=RunManifest(data_dir / ".cache" / "run_manifest.jsonl", resume=resume),
+        resume=resume,
+        resume_max_age=resume_max_age_hours * 3600 if resume_max_age_hours is not None else None,
+        yf_kwargs=dict(cache_dir=price_cache_dir, derive_intraday=derive_intraday, verify_resample=verify_resample,
+                       incremental_indicators=incremental_indicators),
+    )
+    if parse_workers > 0:
+        # 解析行程池需明確指定才啟用（預設在下載執行緒中解析，不另開行程）；以 spawn 建立子行程，避免在多執行緒環境下 fork；Windows 亦相同行為
+        ctx.parse_pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context("spawn"))
+    if zip_output:
+        ctx.archiver = Archiver(data_dir / ".cache" / "archives", codec=archive_codec, workers=archive_workers)
+    if article_cache_path:
+        ctx.article_cache = ArticleCache(article_cache_path, ttl_days=article_cache_ttl_days, max_bytes=article_cache_max_mb * 1024 * 1024)
+    try:
+        if resume:
+            stocks = _pending_stocks(stocks, ctx)
+        if yf_batch_size > 0:
+            with metrics.stage("yfinance_prefetch"):
+                pending = [s for s in stocks if not _stage_complete(ctx, s, "yfinance", _stock_dir(ctx, s))]
+                # 增量指標依各股票快取的狀態計算，不適用 panel
+                ctx.panel_indicators = panel_indicators and not (incremental_indicators and price_cache_dir is not None)
+                ctx.prefetched_prices = _prefetch_prices(pending, yf_batch_size, ctx.yf_kwargs, ctx.panel_indicators)
+        if finmind_bulk:
+            with metrics.stage("finmind_bulk"):
+                pending = [s for s in stocks if not _stage_complete(ctx, s, "finmind", _stock_dir(ctx, s))]
+                # 有本地歷史時只下載各資料集水位之後的部分
+                bulk_prefetch(ctx.finmind, [s.split("_", 1)[0] for s in pending if "_" in s], ctx.one_year_ago,
+                              store=ctx.finmind_store)
+        if profile_stock:
+            stocks = _profile_stock(profile_stock, stocks, ctx, metrics_dir or data_dir)
+        _run_stocks(stocks, ctx, workers)
+        logging.info(f"FinMind 共發出 {ctx.finmind.requests} 次請求，{ctx.finmind.shared} 次共用既有結果")
+        if ctx.finmind_store is not None:
+            logging.info(f"FinMind 依公布週期略過 {ctx.finmind_store.skipped} 個資料集的請求")
+        ctx.finmind.client.log_stats()
+    finally:
+        if ctx.article_cache is not None:
+            logging.info(f"新聞快取命中 {ctx.article_cache.hits} 筆，未命中 {ctx.article_cache.misses} 筆")
+            ctx.article_cache.close()
+        if ctx.parse_pool is not None:
+            ctx.parse_pool.shutdown()
+        ctx.extract_stats.log_summary()
+        get_limiter().log_rates()
+        get_hedger().log_summary()
+        if ctx.archiver is not None:
+            ctx.archiver.shutdown()
+        ctx.manifest.close()
+        _finish_metrics(ctx, metrics_dir)
+
+
+def _stock_dir(ctx: _RunContext, stock_str: str) -> Path:
+    return ctx.data_dir / stock_str
+
+
+def _pending_stocks(stocks: list[str], ctx: _RunContext) -> list[str]:
+    # 續跑：所有階段（與壓縮檔）皆已完成且未過期的股票整檔略過，不進入批次預抓
+    pending = []
+    for stock_str in stocks:
+        done = "_" in stock_str and all(_stage_complete(ctx, stock_str, name, _stock_dir(ctx, stock_str)) for name in STAGES) \
+            and (ctx.archiver is None or _stage_complete(ctx, stock_str, "zip", ctx.data_dir, ctx.archiver.codec))
+        if not done:
+            pending.append(stock_str)
+    logging.info(f"續跑：{len(stocks) - len(pending)} 檔股票已完成，剩餘 {len(pending)} 檔")
+    get_metrics().add("resumed_stocks", len(stocks) - len(pending))
+    return pending
+
+
+def _finish_metrics(ctx: _RunContext, metrics_dir: Path | None):
+    # 將各模組自行累計的快取與共用次數併入指標，記錄摘要並輸出報告
+    metrics = get_metrics()
+    if ctx.article_cache is not None:
+        metrics.add("article_cache_hits", ctx.article_cache.hits)
+        metrics.add("article_cache_misses", ctx.article_cache.misses)
+    metrics.add("finmind_shared", ctx.finmind.shared)
+    if ctx.finmind_store is not None:
+        metrics.add("finmind_store_skipped", ctx.finmind_store.skipped)
+    metrics.add("hedged_requests", get_hedger().hedged)
+    metrics.log_summary()
+    if metrics_dir is not None:
+        try:
+            json_path, prom_path = metrics.write_report(metrics_dir)
+            logging.info(f"執行指標已輸出：{json_path}、{prom_path}")
+        except OSError as e:
+            logging.error(f"執行指標輸出失敗: {e}")
+
+
+def _profile_stock(target: str, stocks: list[str], ctx: _RunContext, out_dir: Path) -> list[str]:
+    """
+    以剖析器單獨執行一檔股票（各階段於同一執行緒逐一執行），回傳其餘待處理的股票
+    :param target: 股票代號或「代號_名稱」
+    """
+    matched = [s for s in stocks if s == target or s.split("_", 1)[0] == target]
+    if not matched:
+        logging.warning(f"剖析目標 {target} 不在股票清單中，略過剖析")
+        return stocks
+    stock_str = matched[0]
+    out_base = out_dir / f"profile_{stock_str}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    profile_call(lambda: _process_stock(stock_str, ctx), out_base)
+    return [s for s in stocks if s != stock_str]
+
+
+def _run_stocks(stocks: list[str], ctx: _RunContext, workers: int):
+    if workers <= 1:
+        for stock_str in tqdm(stocks, desc="股票處理進度"):
+            _process_stock(stock_str, ctx)
+        return
+
+    # 併發模式：多檔股票同時處理，各股票內的資料來源階段另以 daemon 執行緒平行執行（見 _start_stage）
+    ctx.parallel_stages = True
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stock") as stock_pool:
+            futures = [stock_pool.submit(_process_stock, stock_str, ctx) for stock_str in stocks]
+            with tqdm(total=len(futures), desc="股票處理進度") as pbar:
+                for _ in as_completed(futures):
+                    pbar.update(1)
+    finally:
+        ctx.parallel_stages = False
 
 
 if __name__ == '__main__':
@@ -95,11 +488,88 @@ if __name__ == '__main__':
     parser.add_argument("--stocks", type=str, default=None, help="以逗號分隔的清單，如 2317_鴻海,00922_國泰台灣領袖50")
     parser.add_argument("--stocks-file", type=str, default=str(PARENT_DIR / "stocks.txt"), help="stocks.txt 路徑")
     parser.add_argument("--finmind-token", type=str, default=None, help="FinMind API Token")
-    parser.add_argument("--max-pages", type=int, default=2, help="Bing 新聞最大頁數")
-    parser.add_argument("--sleep-sec", type=int, default=2, help="抓取間隔秒數")
+    parser.add_argument("--max-pages", type=int, default=2, help="新聞搜尋最大頁數（每個來源）")
+    parser.add_argument("--sleep-sec", type=int, default=2, help="新聞搜尋頁的起始請求間隔秒數，之後依回應自適應調整")
     parser.add_argument("--no-zip", action="store_true", help="不要壓縮輸出資料夾")
+    parser.add_argument("--workers", type=int, default=1, help="同時處理的股票數（1 為逐檔執行）")
+    parser.add_argument("--yahoo-concurrency", type=int, default=None, help="yfinance 同時請求上限")
+    parser.add_argument("--finmind-concurrency", type=int, default=None, help="FinMind 同時請求上限")
+    parser.add_argument("--bing-concurrency", type=int, default=None, help="Bing 搜尋頁同時請求上限")
+    parser.add_argument("--article-concurrency", type=int, default=None, help="新聞內文同時請求上限")
+    parser.add_argument("--host-concurrency", type=int, default=None, help="同一新聞網站同時請求上限（預設 2）")
+    parser.add_argument("--host-delay", type=float, default=None, help="各網站的起始請求間隔秒數（預設 0.4），之後依回應自適應調整")
+    parser.add_argument("--parse-workers", type=int, default=0, help="新聞內文解析行程數（預設 0，在下載執行緒中解析；大量股票時可設為 CPU 核心數）")
+    parser.add_argument("--no-price-cache", action="store_true", help="不使用本地價格快取，每次完整下載 yfinance 歷史")
+    parser.add_argument("--yf-batch-size", type=int, default=0, help="yfinance 批次下載每批股票數（0 為逐檔下載）")
+    parser.add_argument("--no-derive-intraday", action="store_true", help="15m/30m/60m 直接向 Yahoo 下載，而非由 5m 合成")
+    parser.add_argument("--no-panel-indicators", action="store_true", help="批次模式下改為逐檔計算技術指標（預設整批股票一次計算）")
+    parser.add_argument("--verify-resample", action="store_true", help="測試模式：另抓 Yahoo 原生 15m/30m/60m 與合成結果比對並記錄差異")
+    parser.add_argument("--incremental-indicators", action="store_true", help="以快取的指標狀態增量計算技術指標（需啟用價格快取）")
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="csv", help="輸出檔案格式（parquet/feather 需安裝 pyarrow）")
+    parser.add_argument("--news-sources", type=str, default="bing", help=f"新聞來源，以逗號分隔（可用：{','.join(NEWS_SOURCES)}），多個來源同時搜尋並合併去重")
+    parser.add_argument("--incremental-news", action="store_true", help="新聞增量爬取：只抓未看過的文章並附加到既有新聞檔，整頁皆已看過即停止翻頁")
+    parser.add_argument("--stock-budget", type=float, default=None, help="每檔股票的時間預算（秒），超過時各階段輸出已取得的部分並標記 _PARTIAL_<stage>.json")
+    parser.add_argument("--stage-budget", type=float, default=None, help="每個階段（yfinance／finmind／news）的時間預算（秒）")
+    parser.add_argument("--hedge", action="store_true", help="對沖請求：GET 超過該網站延遲百分位仍未完成時再送出一次，取先完成者")
+    parser.add_argument("--hedge-percentile", type=float, default=95, help="對沖請求的延遲百分位門檻")
+    parser.add_argument("--metrics-dir", type=str, default=str(LOG_DIR / "metrics"), help="執行指標報告（JSON 與 Prometheus 文字格式）輸出資料夾")
+    parser.add_argument("--no-metrics", action="store_true", help="不輸出執行指標報告（結束時仍記錄摘要）")
+    parser.add_argument("--profile-stock", type=str, default=None, help="以 pyinstrument（未安裝時用 cProfile）剖析指定股票（代號或 代號_名稱），報告寫入指標資料夾")
+    parser.add_argument("--archive-codec", choices=ARCHIVE_CODECS, default="deflate", help="壓縮格式：deflate（一般 zip）、store（zip 不壓縮，最快）、zstd（.tar.zst，需安裝 zstandard）")
+    parser.add_argument("--archive-workers", type=int, default=2, help="背景壓縮執行緒數")
+    parser.add_argument("--resume", action="store_true", help="續跑：依 data/.cache/run_manifest.jsonl 略過先前已完成且未過期的（股票, 階段）")
+    parser.add_argument("--resume-max-age-hours", type=float, default=12, help="續跑時已完成階段的有效時數，超過則重新執行")
+    parser.add_argument("--no-article-cache", action="store_true", help="不使用新聞內文快取")
+    parser.add_argument("--article-cache-ttl-days", type=float, default=30, help="新聞內文快取有效天數")
+    parser.add_argument("--article-cache-max-mb", type=int, default=512, help="新聞內文快取容量上限（MB），超過時淘汰最久未使用者")
+    parser.add_argument("--finmind-bulk", action="store_true", help="法人、融資融券、本益比改以全市場逐日下載後拆分（需 FinMind 贊助方案，適合大量股票）")
+    parser.add_argument("--finmind-rph", type=int, default=None, help="FinMind 每小時請求上限（預設有 token 600、無 token 300，依方案調整）")
+    parser.add_argument("--no-finmind-cache", action="store_true", help="不使用 FinMind 本地歷史，每次重新下載近一年資料")
     args = parser.parse_args()
 
+    pipeline_kwargs = dict(
+        data_dir=DATA_DIR,
+        finmind_token=args.finmind_token,
+        max_pages=args.max_pages,
+        sleep_sec=args.sleep_sec,
+        zip_output=not args.no_zip,
+        workers=args.workers,
+        yf_batch_size=args.yf_batch_size,
+        derive_intraday=not args.no_derive_intraday,
+        verify_resample=args.verify_resample,
+        panel_indicators=not args.no_panel_indicators,
+        incremental_indicators=args.incremental_indicators,
+        output_format=args.output_format,
+        article_cache_path=None if args.no_article_cache else DATA_DIR / ".cache" / "articles.sqlite",
+        article_cache_ttl_days=args.article_cache_ttl_days,
+        article_cache_max_mb=args.article_cache_max_mb,
+        finmind_bulk=args.finmind_bulk,
+        finmind_requests_per_hour=args.finmind_rph,
+        host_limit=args.host_concurrency,
+        host_delay=args.host_delay,
+        parse_workers=args.parse_workers,
+        news_sources=[x.strip() for x in args.news_sources.split(",") if x.strip()],
+        stock_budget=args.stock_budget,
+        stage_budget=args.stage_budget,
+        hedge=args.hedge,
+        hedge_percentile=args.hedge_percentile,
+        metrics_dir=None if args.no_metrics else Path(args.metrics_dir),
+        profile_stock=args.profile_stock,
+        resume=args.resume,
+        archive_codec=args.archive_codec,
+        archive_workers=args.archive_workers,
+        resume_max_age_hours=args.resume_max_age_hours,
+        news_state_dir=DATA_DIR / ".cache" / "news" if args.incremental_news else None,
+        finmind_cache_dir=None if args.no_finmind_cache else DATA_DIR / ".cache" / "finmind",
+        price_cache_dir=None if args.no_price_cache else DATA_DIR / ".cache" / "prices",
+        upstream_limits={
+            "yahoo": args.yahoo_concurrency,
+            "finmind": args.finmind_concurrency,
+            "bing": args.bing_concurrency,
+            "article": args.article_concurrency,
+        },
+    )
+
     # 預設 GUI；除非明確指定 --headless
     if not args.headless:
         import tkinter as tk
@@ -151,7 +621,7 @@ if __name__ == '__main__':
                 stocks.extend(normalized)
             STOCKS_PATH.write_text("\n".join(stocks), encoding="utf-8")
             root.destroy()
-            run_pipeline(stocks=stocks, data_dir=DATA_DIR, finmind_token=args.finmind_token, max_pages=args.max_pages, sleep_sec=args.sleep_sec, zip_output=not args.no_zip)
+            run_pipeline(stocks=stocks, **pipeline_kwargs)
             logging.info("全部股票處理完成")
 
         ttk.Button(root, text="確定", command=on_ok).pack()
@@ -167,5 +637,5 @@ if __name__ == '__main__':
         if not stocks:
             logging.info("未找到任何股票，請使用 --stocks 或提供 stocks.txt")
         else:
-            run_pipeline(stocks=stocks, data_dir=DATA_DIR, finmind_token=args.finmind_token, max_pages=args.max_pages, sleep_sec=args.sleep_sec, zip_output=not args.no_zip)
+            run_pipeline(stocks=stocks, **pipeline_kwargs)
             logging.info("全部股票處理完成")
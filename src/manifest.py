@@ -0,0 +1,121 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# --------------------------------------------------
+# 執行紀錄（run manifest）與斷點續跑
+#    - 每個 (股票, 階段) 完成時附加一行 JSON：完成時間、輸出檔、輸出格式、錯誤數、是否為部分輸出
+#    - 每行寫入後立即 fsync；程式中斷時最後一行若不完整，讀取時略過
+#    - --resume 時，最近一次紀錄無錯誤、非部分輸出、未過期且輸出檔仍在的階段直接略過
+#    - 階段內寫出的檔案與失敗以 contextvars 歸屬到該階段（送入執行緒池時需以 copy_context 包裝）
+#    - 只有階段拋出例外或 note_failure()（某資料集 / interval 未能取得或寫出）才算錯誤；
+#      個別新聞下載、解析失敗等項目層級的錯誤不影響續跑
+# --------------------------------------------------
+
+
+class StageOutputs:
+    def __init__(self):
+        self.files: list[str] = []
+        self.errors = 0
+
+
+_current: contextvars.ContextVar[StageOutputs | None] = contextvars.ContextVar("stage_outputs", default=None)
+
+
+@contextmanager
+def collect_outputs():
+    """
+    收集 with 區塊內（含以 copy_context 帶入的執行緒）寫出的檔案與失敗數
+    :return: StageOutputs
+    """
+    outputs = StageOutputs()
+    token = _current.set(outputs)
+    try:
+        yield outputs
+    finally:
+        _current.reset(token)
+
+
+def note_output(file_name: str):
+    """
+    由 write_frame 等輸出函式呼叫，將檔案歸屬到目前的階段
+    """
+    outputs = _current.get()
+    if outputs is not None and file_name not in outputs.files:
+        outputs.files.append(file_name)
+
+
+def note_failure():
+    """
+    記錄目前階段有資料集 / interval 未能取得或寫出；該階段在執行紀錄中不視為完成，續跑時重做
+    """
+    outputs = _current.get()
+    if outputs is not None:
+        outputs.errors += 1
+
+
+class RunManifest:
+    def __init__(self, path, resume: bool = False):
+        """
+        :param path: 紀錄檔路徑（JSON Lines）
+        :param resume: True 時沿用既有紀錄，否則清空重新開始
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], dict] = {}
+        if resume:
+            self._load()
+        elif self.path.exists():
+            self.path.unlink()
+        self._file = self.path.open("a", encoding="utf-8")
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 中斷時寫到一半的最後一行
+                    continue
+                self._entries[(entry["stock"], entry["stage"])] = entry
+        logging.info(f"讀取執行紀錄 {self.path.name}：{len(self._entries)} 個已完成的階段")
+
+    def record(self, stock: str, stage: str, files: list[str], output_format: str, errors: int = 0, partial: bool = False):
+        entry = {
+            "stock": stock, "stage": stage, "finished_at": time.time(), "files": sorted(files),
+            "format": output_format, "errors": errors, "partial": partial,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            # 超過時間預算而未等待的階段可能在執行結束後才完成；此時輸出已標記為部分，不再記錄
+            if self._file.closed:
+                return
+            self._entries[(stock, stage)] = entry
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def is_complete(self, stock: str, stage: str, output_dir, output_format: str, max_age: float | None = None) -> bool:
+        """
+        :param output_dir: 該股票的輸出資料夾，用來確認輸出檔仍在
+        :param max_age: 紀錄有效秒數，None 表示不限
+        """
+        with self._lock:
+            entry = self._entries.get((stock, stage))
+        if entry is None or entry["partial"] or entry["errors"] or entry["format"] != output_format:
+            return False
+        if max_age is not None and time.time() - entry["finished_at"] > max_age:
+            return False
+        return all(os.path.exists(os.path.join(output_dir, name)) for name in entry["files"])
+
+    def close(self):
+        with self._lock:
+            self._file.close()
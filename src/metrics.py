@@ -0,0 +1,269 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+# --------------------------------------------------
+# 執行指標
+#    - 階段：各階段（yfinance、finmind、news、indicators、parse、zip …）的次數、總耗時、最長耗時、延遲分位數與失敗次數
+#    - 請求：各上游（yahoo、finmind、bing、google、article）的請求數、錯誤、重試、位元組與延遲分位數
+#    - 計數：輸出筆數、檔案數、快取命中等
+#    - 每次執行輸出 JSON 與 Prometheus 文字格式報告，並於結束時記錄摘要
+#    - 所有模組共用同一個實例
+# --------------------------------------------------
+_LATENCY_WINDOW = 5000
+_PROM_PREFIX = "stock_scraper"
+
+
+def _quantile(values, q: float) -> float:
+    # 線性內插的分位數；values 需已排序
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def _quantiles(samples) -> dict:
+    values = sorted(samples)
+    return {f"p{int(q * 100)}": round(_quantile(values, q), 4) for q in (0.5, 0.95, 0.99)}
+
+
+class _StageStats:
+    __slots__ = ("count", "seconds", "max_seconds", "errors", "latency")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.errors = 0
+        self.latency: deque = deque(maxlen=_LATENCY_WINDOW)
+
+
+class _RequestStats:
+    __slots__ = ("count", "errors", "retries", "bytes", "seconds", "latency")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.latency: deque = deque(maxlen=_LATENCY_WINDOW)
+
+
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        清除所有指標，重新開始計時
+        """
+        with self._lock:
+            self.started_at = time.time()
+            self._start = time.perf_counter()
+            self._stages: dict[str, _StageStats] = {}
+            self._requests: dict[str, _RequestStats] = {}
+            self._counters: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        計時 with 區塊；區塊拋出例外時計為該階段失敗
+        """
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.record_stage(name, time.perf_counter() - start, error=failed)
+
+    def record_stage(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            st = self._stages.get(name)
+            if st is None:
+                st = self._stages[name] = _StageStats()
+            st.count += 1
+            st.seconds += seconds
+            st.max_seconds = max(st.max_seconds, seconds)
+            st.errors += int(error)
+            st.latency.append(seconds)
+
+    def record_request(self, upstream: str, seconds: float, nbytes: int = 0, error: bool = False, retry: bool = False):
+        """
+        :param upstream: 上游名稱，與 concurrency.upstream_slot 相同
+        :param seconds: 請求耗時
+        :param nbytes: 回應大小
+        :param error: 請求失敗（連線錯誤、逾時或 HTTP 4xx/5xx）
+        :param retry: 此請求為重試
+        """
+        with self._lock:
+            st = self._requests.get(upstream)
+            if st is None:
+                st = self._requests[upstream] = _RequestStats()
+            st.count += 1
+            st.errors += int(error)
+            st.retries += int(retry)
+            st.bytes += nbytes
+            st.seconds += seconds
+            st.latency.append(seconds)
+
+    def add(self, name: str, value: float = 1):
+        """
+        累加計數，例如 rows_written、article_cache_hits
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        with self._lock:
+            requests = {
+                name: {"count": st.count, "errors": st.errors, "retries": st.retries, "bytes": st.bytes,
+                       "seconds": round(st.seconds, 4), **_quantiles(st.latency)}
+                for name, st in self._requests.items()
+            }
+            return {
+                "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+                "wall_seconds": round(time.perf_counter() - self._start, 4),
+                "stages": {name: {"count": st.count, "seconds": round(st.seconds, 4), "max_seconds": round(st.max_seconds, 4),
+                                  "errors": st.errors, **_quantiles(st.latency)}
+                           for name, st in self._stages.items()},
+                "requests": requests,
+                "counters": dict(self._counters),
+            }
+
+    def to_prometheus(self, summary: dict | None = None) -> str:
+        """
+        Prometheus 文字格式（可交給 node_exporter textfile collector）
+        """
+        s = summary or self.summary()
+        lines = []
+
+        def _metric(name, kind, help_text, samples):
+            full = f"{_PROM_PREFIX}_{name}"
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f"{full}{{{label_text}}} {value}" if label_text else f"{full} {value}")
+
+        _metric("run_wall_seconds", "gauge", "Wall time of the run", [({}, s["wall_seconds"])])
+        stages = s["stages"].items()
+        _metric("stage_seconds_total", "counter", "Total wall time per stage", [({"stage": n}, v["seconds"]) for n, v in stages])
+        _metric("stage_max_seconds", "gauge", "Longest single run per stage", [({"stage": n}, v["max_seconds"]) for n, v in stages])
+        _metric("stage_runs_total", "counter", "Stage runs", [({"stage": n}, v["count"]) for n, v in stages])
+        _metric("stage_errors_total", "counter", "Stage runs that raised", [({"stage": n}, v["errors"]) for n, v in stages])
+        reqs = s["requests"].items()
+        _metric("requests_total", "counter", "Outbound requests", [({"upstream": n}, v["count"]) for n, v in reqs])
+        _metric("request_errors_total", "counter", "Failed outbound requests", [({"upstream": n}, v["errors"]) for n, v in reqs])
+        _metric("request_retries_total", "counter", "Retried outbound requests", [({"upstream": n}, v["retries"]) for n, v in reqs])
+        _metric("response_bytes_total", "counter", "Response body bytes", [({"upstream": n}, v["bytes"]) for n, v in reqs])
+        latency = []
+        for n, v in reqs:
+            latency += [({"upstream": n, "quantile": q}, v[key]) for q, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))]
+        _metric("request_seconds", "summary", "Outbound request latency", latency)
+        lines += [f"{_PROM_PREFIX}_request_seconds_sum{{upstream=\"{_escape_label(n)}\"}} {v['seconds']}" for n, v in reqs]
+        lines += [f"{_PROM_PREFIX}_request_seconds_count{{upstream=\"{_escape_label(n)}\"}} {v['count']}" for n, v in reqs]
+        _metric("events_total", "counter", "Rows, files and cache events", [({"event": n}, v) for n, v in sorted(s["counters"].items())])
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, report_dir, run_id: str | None = None) -> tuple[Path, Path]:
+        """
+        輸出 run_<run_id>.json 與 run_<run_id>.prom；另覆寫 latest.prom 供 textfile collector 讀取
+        :return: (JSON 路徑, Prometheus 路徑)
+        """
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        run_id = run_id or time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))
+        summary = self.summary()
+        prom = self.to_prometheus(summary)
+        json_path = report_dir / f"run_{run_id}.json"
+        prom_path = report_dir / f"run_{run_id}.prom"
+        _write_text(json_path, json.dumps(summary, ensure_ascii=False, indent=2))
+        _write_text(prom_path, prom)
+        _write_text(report_dir / "latest.prom", prom)
+        return json_path, prom_path
+
+    def log_summary(self):
+        s = self.summary()
+        logging.info(f"執行總耗時 {s['wall_seconds']:.1f} 秒")
+        for name, st in sorted(s["stages"].items(), key=lambda kv: -kv[1]["seconds"]):
+            errors = f"，失敗 {st['errors']}" if st["errors"] else ""
+            logging.info(f"階段 {name}：{st['count']} 次，共 {st['seconds']:.1f} 秒，最長 {st['max_seconds']:.1f} 秒{errors}")
+        for name, st in sorted(s["requests"].items()):
+            logging.info(f"請求 {name}：{st['count']} 次，錯誤 {st['errors']}，重試 {st['retries']}，"
+                         f"{st['bytes'] / 1024 / 1024:.1f} MB，p50 {st['p50']:.2f} 秒，p99 {st['p99']:.2f} 秒")
+        if s["counters"]:
+            logging.info("計數：" + "，".join(f"{k} {v:g}" for k, v in sorted(s["counters"].items())))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_text(path: Path, text: str):
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics() -> RunMetrics:
+    return _metrics
+
+
+# --------------------------------------------------
+# 單檔股票剖析
+#    - 已安裝 pyinstrument 時輸出 HTML 火焰圖，否則以 cProfile 輸出 .prof 與耗時前幾名的文字報表
+#    - 僅剖析呼叫端執行緒，呼叫前應讓各階段在同一執行緒逐一執行
+# --------------------------------------------------
+def profile_call(fn, out_base, top: int = 40):
+    """
+    剖析 fn() 並寫出報告
+    :param out_base: 報告路徑（不含副檔名）
+    :param top: cProfile 文字報表列出的函式數
+    :return: fn() 的回傳值
+    """
+    out_base = Path(out_base)
+    out_base.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return fn()
+        finally:
+            profiler.stop()
+            html_path = out_base.with_suffix(".html")
+            html_path.write_text(profiler.output_html(), encoding="utf-8")
+            logging.info(f"剖析報告（pyinstrument）：{html_path}")
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn)
+    finally:
+        prof_path = out_base.with_suffix(".prof")
+        profiler.dump_stats(str(prof_path))
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(top)
+        out_base.with_suffix(".txt").write_text(buf.getvalue(), encoding="utf-8")
+        logging.info(f"剖析報告（cProfile）：{prof_path}")
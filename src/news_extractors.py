@@ -0,0 +1,162 @@
+import logging
+import threading
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+from lxml.etree import ParserError
+from newspaper import Article
+
+# --------------------------------------------------
+# 新聞內文擷取器
+#    - 各站點的內文容器以 CSS 選擇器登記，於載入時預先編譯
+#    - 每篇文章只建立一次 lxml 解析樹；選擇器皆未命中才交給 newspaper3k
+#    - extract_article 回傳使用的擷取方式，供統計各網域的命中 / 備援次數
+# --------------------------------------------------
+
+# 不計入內文的元素
+_SKIP_TAGS = {"script", "style", "template", "noscript"}
+_PARAGRAPH = CSSSelector("p")
+MIN_LINE_LENGTH = 10
+
+
+@dataclass(frozen=True)
+class SiteExtractor:
+    name: str
+    domains: tuple
+    containers: tuple  # 依序嘗試，取第一個命中的容器
+
+    def find_body(self, tree):
+        for selector in self.containers:
+            found = selector(tree)
+            if found:
+                return found[0]
+        return None
+
+
+_REGISTRY: dict[str, SiteExtractor] = {}
+_GENERIC: SiteExtractor | None = None
+
+
+def register_extractor(name: str, domains, containers):
+    """
+    登記站點擷取器
+    :param name: 擷取器名稱（統計用）
+    :param domains: 適用網域，包含其子網域，例如 udn.com 也適用 money.udn.com；空值表示通用擷取器
+    :param containers: 內文容器的 CSS 選擇器，依序嘗試
+    """
+    global _GENERIC
+    extractor = SiteExtractor(name, tuple(domains), tuple(CSSSelector(css) for css in containers))
+    if not domains:
+        _GENERIC = extractor
+    for domain in domains:
+        _REGISTRY[domain.lower()] = extractor
+    return extractor
+
+
+register_extractor("yahoo", ["stock.yahoo.com"], ["article"])
+register_extractor("udn", ["udn.com"], ["div#story_body_content", "section#article-body"])
+register_extractor("ctee", ["ctee.com.tw"], ["#newsContent", ".article-main", ".article_content"])
+register_extractor("chinatimes", ["chinatimes.com"], ["div.article-body", "#article-body"])
+register_extractor("moneydj", ["moneydj.com"], ["#divMain", ".article", "#news"])
+register_extractor("ltn", ["ltn.com.tw"], ["div.text", "#newstext"])
+register_extractor("cnyes", ["cnyes.com"], ["article", "div._2E8yJ9", "div.article"])
+register_extractor("generic", [], ["article", "div.article", "div.article-content", "div.story"])
+
+
+def find_extractor(domain: str) -> SiteExtractor:
+    """
+    依網域尋找擷取器：由完整網域逐層往上比對（tw.stock.yahoo.com → stock.yahoo.com → yahoo.com）
+    """
+    labels = domain.lower().split(":")[0].split(".")
+    for i in range(len(labels) - 1):
+        extractor = _REGISTRY.get(".".join(labels[i:]))
+        if extractor is not None:
+            return extractor
+    return _GENERIC
+
+
+def _node_text(node) -> str:
+    # 等同 BeautifulSoup get_text(strip=True)：各文字片段去空白後相接，略過註解與 script/style
+    parts = []
+
+    def _walk(el):
+        if isinstance(el.tag, str) and el.tag not in _SKIP_TAGS:
+            if el.text:
+                parts.append(el.text.strip())
+            for child in el:
+                _walk(child)
+                if child.tail:
+                    parts.append(child.tail.strip())
+
+    _walk(node)
+    return "".join(parts)
+
+
+def _parse_tree(html: str):
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # 含 XML 編碼宣告的字串須以位元組解析
+        return lxml.html.document_fromstring(html.encode("utf-8"), parser=lxml.html.HTMLParser(encoding="utf-8"))
+    except ParserError:
+        return None
+
+
+def _newspaper_text(url: str, html: str) -> list[str]:
+    try:
+        article = Article(url, language='zh')
+        article.download(input_html=html)
+        article.parse()
+        return [line.strip() for line in article.text.split('\n') if line.strip()]
+    except Exception as e:
+        logging.error(f"newspaper3k 解析失敗: {url} ({e})")
+        return []
+
+
+def extract_article(url: str, html: str):
+    """
+    由文章 HTML 擷取內文（純 CPU 運算，可於子行程執行）
+    :return: (內文, 擷取器名稱, 方式)；方式為 selector / fallback / empty
+    """
+    extractor = find_extractor(urlparse(url).netloc)
+    content: list[str] = []
+    tree = _parse_tree(html) if html else None
+    if tree is not None:
+        body = extractor.find_body(tree)
+        if body is not None:
+            content = [text for text in (_node_text(p) for p in _PARAGRAPH(body)) if text]
+    method = "selector"
+    if not content:
+        content = _newspaper_text(url, html)
+        method = "fallback" if content else "empty"
+    filtered = [line for line in content if len(line) > MIN_LINE_LENGTH]
+    return '\n'.join(filtered).strip(), extractor.name, method
+
+
+class ExtractionStats:
+    """
+    各網域的擷取統計：選擇器命中（selector）、改用 newspaper3k（fallback）、皆無內文（empty）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: dict[str, dict] = {}
+
+    def record(self, url: str, extractor: str, method: str):
+        domain = urlparse(url).netloc.lower()
+        with self._lock:
+            st = self._counts.setdefault(domain, {"extractor": extractor, "selector": 0, "fallback": 0, "empty": 0})
+            st[method] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {domain: dict(st) for domain, st in self._counts.items()}
+
+    def log_summary(self):
+        for domain, st in sorted(self.summary().items(), key=lambda kv: -(kv[1]["fallback"] + kv[1]["empty"])):
+            logging.info(
+                f"內文擷取 {domain}（{st['extractor']}）：選擇器 {st['selector']}，"
+                f"newspaper3k {st['fallback']}，無內文 {st['empty']}"
+            )
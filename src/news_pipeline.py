@@ -0,0 +1,213 @@
+import contextvars
+import logging
+import os
+import queue
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from article_cache import ArticleCache, link_key
+from deadline import current_deadline
+from metrics import get_metrics
+from news_extractors import ExtractionStats
+from news_state import ISO_DATE, NewsCrawlState
+from output_io import output_file_name, read_frame, write_frame
+
+# 搜尋結果的日期文字：「x 分鐘前」等相對時間，或 2025年5月21日、2025/05/21、2025-05-21
+_RELATIVE_DATES = (
+    (re.compile(r"(\d+)\s*分鐘前"), "minutes"),
+    (re.compile(r"(\d+)\s*小時前"), "hours"),
+    (re.compile(r"(\d+)\s*天前"), "days"),
+)
+_ABSOLUTE_DATE = re.compile(r"(\d{4})(?:年|[/-])(\d{1,2})(?:月|[/-])(\d{1,2})")
+
+
+def parse_news_date(date_text: str) -> str:
+    """
+    將 Bing / Google 搜尋結果的日期文字轉為 YYYY-MM-DD，無法判讀時回傳原文
+    """
+    date_text = date_text.strip()
+    for pattern, unit in _RELATIVE_DATES:
+        m = pattern.match(date_text)
+        if m:
+            return (datetime.now() - timedelta(**{unit: int(m.group(1))})).strftime("%Y-%m-%d")
+    m = _ABSOLUTE_DATE.match(date_text)
+    if m:
+        try:
+            return datetime(int(m.group(1)), int(m.group(2)), int(m.group(3))).strftime("%Y-%m-%d")
+        except ValueError:
+            return date_text
+    return date_text
+
+# --------------------------------------------------
+# 新聞內文「下載 → 解析」兩段式處理
+#    - 下載：I/O 為主，由執行緒池平行進行
+#    - 解析：CPU 為主（lxml / newspaper3k），交給行程池，避免與下載爭用 GIL
+#    - 兩段之間以有界佇列相接，解析跟不上時下載端自動等待，控制記憶體用量
+# --------------------------------------------------
+
+
+def _timed_parse(parse, url, html):
+    # 於解析行程內計時，回傳 (耗時, 解析結果)
+    start = time.perf_counter()
+    parsed = parse(url, html)
+    return time.perf_counter() - start, parsed
+
+
+def fetch_articles(urls, download, parse, fetch_pool, parse_pool=None, cache: ArticleCache | None = None, max_pending: int = 32,
+                   stats: ExtractionStats | None = None) -> list[str]:
+    """
+    下載並解析多篇文章，回傳順序與 urls 相同
+    :param urls: 文章連結
+    :param download: download(url) -> (html, final_url, http_status)，失敗回傳 None
+    :param parse: parse(url, html) -> (內文, 擷取器名稱, 方式)，如 news_extractors.extract_article；使用行程池時須為模組層級函式
+    :param fetch_pool: 下載用的執行緒池
+    :param parse_pool: 解析用的行程池，None 時在目前執行緒解析
+    :param cache: 新聞內文快取，命中者不下載也不解析
+    :param max_pending: 佇列與解析中文章數的上限
+    :param stats: 擷取統計，於主行程彙整各網域的命中 / 備援次數
+    :return: 各文章內文，失敗者為空字串
+    """
+    results = [""] * len(urls)
+    downloaded: queue.Queue = queue.Queue(maxsize=max_pending)
+    todo = []
+    for i, url in enumerate(urls):
+        hit = cache.get(url) if cache is not None else None
+        if hit is not None:
+            results[i] = hit["content"]
+        else:
+            todo.append((i, url))
+
+    def _download(i, url):
+        try:
+            page = download(url)
+        except Exception as e:
+            logging.error(f"無法下載: {url} ({e})")
+            page = None
+        downloaded.put((i, url, page))
+
+    def _store(i, url, page, timed):
+        elapsed, (text, extractor, method) = timed
+        get_metrics().record_stage("parse", elapsed)
+        if stats is not None:
+            stats.record(url, extractor, method)
+        results[i] = text
+        if cache is not None:
+            cache.put(url, text, final_url=page[1], http_status=page[2])
+
+    for i, url in todo:
+        # 帶入目前的時間預算
+        fetch_pool.submit(contextvars.copy_context().run, _download, i, url)
+
+    pending = {}
+
+    def _collect(futures):
+        for fut in futures:
+            i, url, page = pending.pop(fut)
+            try:
+                _store(i, url, page, fut.result())
+            except Exception as e:
+                logging.error(f"文章解析失敗: {url} ({e})")
+
+    for _ in range(len(todo)):
+        i, url, page = downloaded.get()
+        if page is None:
+            continue
+        if parse_pool is None:
+            try:
+                _store(i, url, page, _timed_parse(parse, url, page[0]))
+            except Exception as e:
+                logging.error(f"文章解析失敗: {url} ({e})")
+            continue
+        while len(pending) >= max_pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            _collect(done)
+        pending[parse_pool.submit(_timed_parse, parse, url, page[0])] = (i, url, page)
+    if pending:
+        deadline = current_deadline()
+        remaining = deadline.remaining() if deadline is not None else None
+        done, not_done = wait(list(pending), timeout=max(0.0, remaining) if remaining is not None else None)
+        _collect(done)
+        if not_done:
+            # 超過時間預算仍未解析完的文章留空，由呼叫端標記為部分輸出
+            deadline.trip()
+            logging.warning(f"時間預算已用完，{len(not_done)} 篇文章未解析完成")
+    return results
+
+
+# --------------------------------------------------
+# 新聞檔輸出與增量狀態
+# --------------------------------------------------
+def load_known(keyword, output_dir, output_format, state: NewsCrawlState | None = None):
+    """
+    讀取增量爬取狀態
+    :return: (crawl_state, 已看過的正規化連結)；未啟用增量模式時為 (None, 空集合)
+    """
+    if state is None:
+        return None, set()
+    crawl_state = state.load(keyword)
+    # 既有新聞檔不在時狀態已無意義，重新完整爬取
+    if not os.path.exists(news_path(keyword, output_dir, output_format)):
+        return {"links": [], "newest": None}, set()
+    return crawl_state, set(crawl_state.get("links", []))
+
+
+def is_known_page(items, known: set, newest: str | None = None) -> bool:
+    """
+    整頁皆為已看過、或發布日期早於上次最新日期的新聞（空頁不算）
+    :param newest: 爬取狀態中的最新 publish_date（YYYY-MM-DD）；無法解析日期的新聞不視為舊新聞
+    """
+    if not items or not (known or newest):
+        return False
+
+    def _old(item):
+        date = item.get("publish_date") or ""
+        return bool(newest) and bool(ISO_DATE.match(date)) and date < newest
+
+    return all(link_key(item["link"]) in known or _old(item) for item in items)
+
+
+def drop_known(items, known: set) -> list:
+    """
+    移除已看過的新聞，並將留下者加入 known
+    """
+    fresh = []
+    for item in items:
+        key = link_key(item["link"])
+        if key not in known:
+            known.add(key)
+            fresh.append(item)
+    return fresh
+
+
+def news_path(keyword, output_dir, output_format) -> str:
+    return os.path.join(output_dir, output_file_name(news_stem(keyword), output_format))
+
+
+def news_stem(keyword) -> str:
+    return f"{keyword.replace(' ', '_')}_news"
+
+
+def write_news(keyword, results, output_dir, output_format="csv", state: NewsCrawlState | None = None, crawl_state=None):
+    """
+    輸出 <關鍵字>_news 檔；增量模式下更新狀態並附加到既有檔案
+    """
+    df = pd.DataFrame(results)
+    existing_path = news_path(keyword, output_dir, output_format)
+    if state is not None and crawl_state is not None:
+        # 內文為空者（下載失敗、擷取不到、時間預算用完未解析）不記錄為已看過也不附加，下次重新抓取
+        results = [item for item in results if item.get("content")]
+        df = pd.DataFrame(results)
+        state.update(keyword, crawl_state, results)
+        if os.path.exists(existing_path):
+            if df.empty:
+                logging.info(f"{keyword} 無新新聞")
+                return
+            df = pd.concat([read_frame(existing_path), df], ignore_index=True)
+        logging.info(f"{keyword} 新增 {len(results)} 筆新聞")
+    # search_link 僅供增量狀態比對，不輸出
+    write_frame(df.drop(columns=["search_link"], errors="ignore"), output_dir, news_stem(keyword), fmt=output_format, index=False)
+    logging.info(f"共 {len(df)} 筆")
@@ -0,0 +1,179 @@
+import contextvars
+import logging
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from article_cache import ArticleCache, host_matches, link_key, unwrap_link
+from bing_new import FALLBACK_REFERER, _download_article, bing_search_pages, new_bing_session
+from concurrency import host_slot, upstream_slot
+from google_new import google_search
+from metrics import get_metrics
+from news_extractors import ExtractionStats, extract_article
+from news_pipeline import drop_known, fetch_articles, load_known, write_news
+from news_state import NewsCrawlState
+from rate_limit import get_limiter
+
+# --------------------------------------------------
+# 多來源新聞搜尋
+#    - 各來源同時搜尋同一關鍵字，只取候選連結（不含內文）
+#    - 以標準網址（解開轉址、去除追蹤參數）去重後才下載內文，同一篇新聞只下載一次；需請求的轉址於文章執行緒池解開
+#    - 合併輸出為單一 <關鍵字>_news 檔，source 欄位記錄出現的來源
+# --------------------------------------------------
+
+
+class NewsProvider(ABC):
+    """
+    新聞來源介面：search() 回傳候選新聞（publish_date / date / title / link）
+    """
+    name = ""
+
+    @abstractmethod
+    def search(self, keyword, max_pages, known: set | None = None, newest: str | None = None) -> list[dict]:
+        """
+        :param known: 已看過的連結（link_key）；某頁結果全部已看過（或早於 newest）時停止翻頁
+        :param newest: 上次爬取到的最新 publish_date
+        """
+
+
+class BingNewsProvider(NewsProvider):
+    name = "bing"
+
+    def __init__(self, session: requests.Session, sleep_sec=2):
+        self.session = session
+        self.sleep_sec = sleep_sec
+
+    def search(self, keyword, max_pages, known=None, newest=None):
+        items = []
+        for _, page_items in bing_search_pages(keyword, self.session, max_pages=max_pages, sleep_sec=self.sleep_sec, known=known, newest=newest):
+            items.extend(page_items)
+        return items
+
+
+class GoogleNewsProvider(NewsProvider):
+    name = "google"
+
+    def __init__(self, period='7d', sleep_sec=5):
+        self.period = period
+        self.sleep_sec = sleep_sec
+
+    def search(self, keyword, max_pages, known=None, newest=None):
+        return google_search(keyword, period=self.period, start_page=1, end_page=max_pages, sleep_interval=self.sleep_sec, known=known, newest=newest)
+
+
+NEWS_SOURCES = ("bing", "google")
+
+
+def build_providers(sources, session: requests.Session, sleep_sec=2) -> list[NewsProvider]:
+    providers = []
+    for name in sources:
+        if name == "bing":
+            providers.append(BingNewsProvider(session, sleep_sec=sleep_sec))
+        elif name == "google":
+            providers.append(GoogleNewsProvider(sleep_sec=max(sleep_sec, 1)))
+        else:
+            raise ValueError(f"不支援的新聞來源: {name}（可用：{', '.join(NEWS_SOURCES)}）")
+    return providers
+
+
+# 需實際請求才能得知目標的轉址網域
+_HTTP_REDIRECT_HOSTS = ("news.google.com",)
+
+
+def resolve_link(link: str, session: requests.Session | None = None, timeout=10) -> str:
+    """
+    解開搜尋引擎的轉址連結，回傳原始新聞網址；無法解開時回傳原連結
+    查詢參數中的轉址直接解開（見 article_cache.unwrap_link），其餘轉址網域需提供 session 才發出請求
+    """
+    target = unwrap_link(link)
+    if target != link:
+        return target
+    host = (urlparse(link).hostname or "").lower()
+    if session is not None and any(host_matches(host, d) for d in _HTTP_REDIRECT_HOSTS):
+        start = time.perf_counter()
+        try:
+            with host_slot(host), upstream_slot("article"):
+                resp = session.head(link, allow_redirects=True, timeout=timeout)
+            get_metrics().record_request("redirect", time.perf_counter() - start, error=resp.status_code >= 400)
+            get_limiter().report(host, resp.status_code, resp)
+            if resp.url and (urlparse(resp.url).hostname or "").lower() != host:
+                return resp.url
+        except Exception as e:
+            get_metrics().record_request("redirect", time.perf_counter() - start, error=True)
+            logging.warning(f"轉址解析失敗，沿用原連結 {link}: {e}")
+    return link
+
+
+def merge_candidates(results: dict[str, list[dict]], session: requests.Session | None = None, pool=None) -> list[dict]:
+    """
+    合併各來源的候選新聞，依標準網址去重；保留第一個來源的標題與日期，source 列出所有來源
+    :param results: {來源名稱: 候選新聞}，依來源優先順序排列
+    :param pool: 解開轉址用的執行緒池（通常為文章下載池），None 時在目前執行緒逐一解開
+    """
+    flat = [(source, item) for source, items in results.items() for item in items]
+    if pool is None:
+        links = [resolve_link(item["link"], session) for _, item in flat]
+    else:
+        futures = [pool.submit(contextvars.copy_context().run, resolve_link, item["link"], session) for _, item in flat]
+        links = [f.result() for f in futures]
+    merged: dict[str, dict] = {}
+    for (source, item), link in zip(flat, links):
+        key = link_key(link)
+        if key in merged:
+            if source not in merged[key]["source"].split(","):
+                merged[key]["source"] += f",{source}"
+            continue
+        merged[key] = dict(item, link=link, source=source)
+        if link_key(item["link"]) != key:
+            # 需請求才解得開的轉址：保留搜尋結果的連結，讓增量狀態在翻頁時比對得到
+            merged[key]["search_link"] = item["link"]
+    return list(merged.values())
+
+
+def scrape_news(keyword, output_dir, sources=("bing",), max_pages=2, sleep_sec=2, output_format="csv", cache: ArticleCache | None = None,
+                article_workers=8, parse_pool=None, extract_stats: ExtractionStats | None = None, state: NewsCrawlState | None = None):
+    """
+    同時向多個來源搜尋關鍵字，去重後下載內文並輸出單一新聞檔
+    :param sources: 新聞來源，例如 ("bing", "google")
+    :param article_workers: 文章下載（與轉址解析）執行緒數
+    :param parse_pool: 解析用的行程池，None 時在下載執行緒中解析
+    :param state: 增量模式的爬取狀態；提供時各來源遇到整頁皆已看過（或早於上次最新日期）即停止翻頁，
+                  只下載未看過的文章，取得內文者才記錄為已看過並附加到既有新聞檔
+    """
+    crawl_state, known = load_known(keyword, output_dir, output_format, state)
+    newest = crawl_state.get("newest") if crawl_state is not None else None
+    session = new_bing_session()
+    providers = build_providers(sources, session, sleep_sec=sleep_sec)
+
+    def _search(provider):
+        try:
+            return provider.search(keyword, max_pages, known=known, newest=newest)
+        except Exception as e:
+            logging.error(f"{provider.name} 新聞搜尋失敗 {keyword}: {e}")
+            return []
+
+    with ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix="news-search") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _search, p) for p in providers]
+        found = {p.name: f.result() for p, f in zip(providers, futures)}
+
+    with ThreadPoolExecutor(max_workers=max(1, article_workers), thread_name_prefix="article") as article_pool:
+        candidates = merge_candidates(found, session, pool=article_pool)
+        total = sum(len(items) for items in found.values())
+        if crawl_state is not None:
+            candidates = drop_known(candidates, known)
+        logging.info(f"{keyword} 各來源共 {total} 則，去重後 {len(candidates)} 則待下載")
+        contents = fetch_articles(
+            [item["link"] for item in candidates],
+            download=lambda link: _download_article(link, session, timeout=15, search_referer=FALLBACK_REFERER),
+            parse=extract_article,
+            fetch_pool=article_pool,
+            parse_pool=parse_pool,
+            cache=cache,
+            stats=extract_stats,
+        )
+    for item, content in zip(candidates, contents):
+        item['content'] = content
+    write_news(keyword, candidates, output_dir, output_format, state=state, crawl_state=crawl_state)
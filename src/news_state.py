@@ -0,0 +1,57 @@
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+from article_cache import link_key
+
+# --------------------------------------------------
+# 新聞增量爬取狀態
+#    - 每個關鍵字一個 JSON：已看過的連結（link_key）與最新的 publish_date
+#    - 需實際請求才解得開的轉址連結，轉址前的搜尋結果連結（search_link）也一併記錄，翻頁時才比對得到
+#    - 連結依加入順序保存，超過上限時捨棄最舊者
+# --------------------------------------------------
+MAX_LINKS = 5000
+# publish_date 正規化後的格式（YYYY-MM-DD）
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class NewsCrawlState:
+    def __init__(self, state_dir):
+        """
+        :param state_dir: 狀態資料夾，不存在時自動建立
+        """
+        self.state_dir = Path(state_dir)
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, keyword: str) -> Path:
+        return self.state_dir / f"{keyword.replace(' ', '_')}.json"
+
+    def load(self, keyword: str) -> dict:
+        """
+        :return: {"links": [...], "newest": "YYYY-MM-DD" 或 None}
+        """
+        path = self._path(keyword)
+        if not path.exists():
+            return {"links": [], "newest": None}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logging.warning(f"新聞爬取狀態讀取失敗，將完整爬取 {path.name}: {e}")
+            return {"links": [], "newest": None}
+
+    def update(self, keyword: str, state: dict, new_items: list[dict]) -> dict:
+        """
+        將新文章加入狀態並寫回
+        :param new_items: 新文章，需含 link 與 publish_date，可含 search_link
+        """
+        links = state.get("links", []) + [link_key(link) for item in new_items
+                                          for link in (item["link"], item.get("search_link")) if link]
+        dates = [d for d in [state.get("newest")] + [item.get("publish_date") for item in new_items] if d and ISO_DATE.match(d)]
+        updated = {"links": links[-MAX_LINKS:], "newest": max(dates) if dates else None}
+        path = self._path(keyword)
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(updated, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        return updated
@@ -0,0 +1,98 @@
+import os
+
+import pandas as pd
+
+from manifest import note_output
+from metrics import get_metrics
+
+# --------------------------------------------------
+# 輸出格式
+#    - csv: UTF-8-BOM（預設，與既有檔案相容）
+#    - parquet / feather: 欄位型別完整保留（時間索引、布林欄位），需安裝 pyarrow
+# --------------------------------------------------
+OUTPUT_FORMATS = ("csv", "parquet", "feather")
+_EXTENSIONS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+_COMPRESSION = "zstd"
+
+
+def check_output_format(fmt: str):
+    """
+    檢查輸出格式是否可用；parquet/feather 缺少 pyarrow 時提早報錯
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"不支援的輸出格式: {fmt}（可用：{', '.join(OUTPUT_FORMATS)}）")
+    if fmt != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(f"輸出格式 {fmt} 需要安裝 pyarrow") from e
+
+
+def output_file_name(stem: str, fmt: str = "csv") -> str:
+    return f"{stem}{_EXTENSIONS[fmt]}"
+
+
+def _arrow_schema(df: pd.DataFrame) -> pd.DataFrame:
+    # object 欄位統一為字串型別，避免混合型別導致 schema 推斷失敗
+    out = df.copy()
+    for col in out.columns:
+        if out[col].dtype == object:
+            out[col] = out[col].astype("string")
+    out.columns = [str(c) for c in out.columns]
+    return out
+
+
+def write_frame(df: pd.DataFrame, output_dir: str, stem: str, fmt: str = "csv", index: bool = True) -> str:
+    """
+    依指定格式寫出 DataFrame
+    :param df: 要輸出的資料
+    :param output_dir: 輸出資料夾
+    :param stem: 不含副檔名的檔名
+    :param fmt: csv / parquet / feather
+    :param index: 是否輸出索引
+    :return: 輸出檔名（不含路徑）
+    """
+    file_name = output_file_name(stem, fmt)
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, file_name)
+    # 先寫暫存檔再 rename，中斷時不會留下與完整檔案同名的半份檔案
+    tmp = f"{path}.tmp"
+    try:
+        if fmt == "csv":
+            df.to_csv(tmp, index=index, encoding='utf-8-sig')
+        elif fmt == "parquet":
+            # parquet 可直接保存索引與其型別
+            _arrow_schema(df).to_parquet(tmp, index=index, compression=_COMPRESSION)
+        elif fmt == "feather":
+            # feather 不支援非預設索引，索引轉為一般欄位
+            out = df.reset_index() if index else df.reset_index(drop=True)
+            _arrow_schema(out).to_feather(tmp, compression=_COMPRESSION)
+        else:
+            raise ValueError(f"不支援的輸出格式: {fmt}")
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    note_output(file_name)
+    metrics = get_metrics()
+    metrics.add("files_written")
+    metrics.add("rows_written", len(df))
+    metrics.add("bytes_written", os.path.getsize(path))
+    return file_name
+
+
+def read_frame(path: str, index_col=None) -> pd.DataFrame:
+    """
+    依副檔名讀回 write_frame 的輸出
+    :param index_col: 僅 csv/feather 使用，指定還原為索引的欄位
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path, encoding='utf-8-sig', index_col=index_col)
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    if ext == ".feather":
+        df = pd.read_feather(path)
+        return df.set_index(index_col) if index_col is not None else df
+    raise ValueError(f"無法辨識的檔案格式: {path}")
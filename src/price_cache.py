@@ -0,0 +1,89 @@
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+
+# --------------------------------------------------
+# 本地價格 K 棒快取
+#    - 每檔 ticker、每個 interval 一個檔案
+#    - 以 pickle 保存，保留時區與欄位型別
+# --------------------------------------------------
+
+
+class BarStore:
+    def __init__(self, cache_dir):
+        """
+        :param cache_dir: 快取資料夾，不存在時自動建立
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, ticker: str, interval: str) -> Path:
+        return self.cache_dir / f"{ticker}_{interval}.pkl"
+
+    def load(self, ticker: str, interval: str) -> pd.DataFrame:
+        """
+        讀取快取的 K 棒，無快取或檔案損毀時回傳空 DataFrame
+        """
+        path = self._path(ticker, interval)
+        if not path.exists():
+            return pd.DataFrame()
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            logging.warning(f"價格快取讀取失敗，將重新下載 {path.name}: {e}")
+            return pd.DataFrame()
+
+    def save(self, ticker: str, interval: str, df: pd.DataFrame):
+        """
+        寫入快取；先寫暫存檔再 rename，避免中斷時留下半份檔案
+        """
+        path = self._path(ticker, interval)
+        tmp = path.with_suffix(".pkl.tmp")
+        df.to_pickle(tmp)
+        os.replace(tmp, path)
+
+    def merge(self, ticker: str, interval: str, new_df: pd.DataFrame, cached: pd.DataFrame | None = None) -> pd.DataFrame:
+        """
+        將新抓到的 K 棒併入快取：依時間排序、相同時間戳以新資料為準
+        :param new_df: 新下載的 K 棒
+        :param cached: 已讀取的快取內容，省略時自動讀取
+        :return: 合併後的完整歷史
+        """
+        if cached is None:
+            cached = self.load(ticker, interval)
+        if cached.empty:
+            merged = new_df
+        elif new_df.empty:
+            merged = cached
+        else:
+            merged = pd.concat([cached, new_df])
+        if not merged.empty:
+            merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        self.save(ticker, interval, merged)
+        return merged
+
+    def _indicator_path(self, ticker: str, key: str) -> Path:
+        return self.cache_dir / f"{ticker}_{key}.ind.pkl"
+
+    def load_indicators(self, ticker: str, key: str):
+        """
+        讀取上次計算的指標結果與增量狀態
+        :return: (含指標的 DataFrame, state)，無快取時為 (None, None)
+        """
+        path = self._indicator_path(ticker, key)
+        if not path.exists():
+            return None, None
+        try:
+            saved = pd.read_pickle(path)
+            return saved['frame'], saved['state']
+        except Exception as e:
+            logging.warning(f"指標快取讀取失敗，將完整重算 {path.name}: {e}")
+            return None, None
+
+    def save_indicators(self, ticker: str, key: str, frame: pd.DataFrame, state: dict | None):
+        path = self._indicator_path(ticker, key)
+        tmp = path.with_suffix(".pkl.tmp")
+        pd.to_pickle({'frame': frame, 'state': state}, tmp)
+        os.replace(tmp, path)
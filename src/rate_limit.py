@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# --------------------------------------------------
+# 各網站（host）自適應請求速率（AIMD）
+#    - 每個 host 維持目前的請求速率（次/秒），相鄰請求開始時間至少相隔 1/速率
+#    - 請求成功：速率加法遞增；遭限流（429/403/503、逾時）：速率乘法遞減
+#    - 回應帶 Retry-After 時，該 host 在指定時間內不再發出請求
+#    - 所有爬蟲與 API 用戶端共用同一個實例
+# --------------------------------------------------
+THROTTLE_STATUS = (429, 403, 503)
+
+
+def retry_after_seconds(resp) -> float | None:
+    """
+    解析 Retry-After（秒數或 HTTP 日期），無或無法解析時回傳 None
+    """
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+class _HostRate:
+    __slots__ = ("rate", "next_start", "blocked_until", "last_throttle", "successes", "throttles")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.next_start = 0.0
+        self.blocked_until = 0.0
+        self.last_throttle = None
+        self.successes = 0
+        self.throttles = 0
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, initial_rate: float = 2.5, min_rate: float = 0.05, max_rate: float = 20.0,
+                 increase: float = 0.1, decrease: float = 0.5, max_block: float = 300.0,
+                 throttle_window: float = 60.0):
+        """
+        :param initial_rate: 新 host 的起始速率（次/秒）
+        :param min_rate: 速率下限
+        :param max_rate: 速率上限
+        :param increase: 每次成功增加的速率
+        :param decrease: 遭限流時速率乘上的倍數
+        :param max_block: Retry-After 採用的最長等待秒數
+        :param throttle_window: 最近一次限流後多少秒內仍視為限流中
+        """
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.max_block = max_block
+        self.throttle_window = throttle_window
+        self._lock = threading.Lock()
+        self._hosts: dict[str, _HostRate] = {}
+
+    def _state(self, host: str) -> _HostRate:
+        st = self._hosts.get(host)
+        if st is None:
+            st = self._hosts[host] = _HostRate(self.initial_rate)
+        return st
+
+    def seed(self, host: str, rate: float):
+        """
+        指定 host 的起始速率；已有紀錄的 host 不受影響
+        """
+        host = host.lower()
+        with self._lock:
+            if host not in self._hosts:
+                self._hosts[host] = _HostRate(min(self.max_rate, max(self.min_rate, rate)))
+
+    def acquire(self, host: str):
+        """
+        等待至可對 host 發出下一個請求
+        """
+        host = host.lower()
+        with self._lock:
+            st = self._state(host)
+            now = time.monotonic()
+            start = max(now, st.next_start, st.blocked_until)
+            st.next_start = start + 1.0 / st.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def success(self, host: str):
+        with self._lock:
+            st = self._state(host.lower())
+            st.successes += 1
+            st.rate = min(self.max_rate, st.rate + self.increase)
+
+    def throttled(self, host: str, retry_after: float | None = None):
+        """
+        回報 host 限流：速率減半，並依 Retry-After 暫停
+        """
+        host = host.lower()
+        with self._lock:
+            st = self._state(host)
+            now = time.monotonic()
+            st.throttles += 1
+            st.last_throttle = now
+            st.rate = max(self.min_rate, st.rate * self.decrease)
+            st.next_start = max(st.next_start, now + 1.0 / st.rate)
+            if retry_after is not None:
+                st.blocked_until = max(st.blocked_until, now + min(retry_after, self.max_block))
+            rate = st.rate
+        wait = f"，暫停 {min(retry_after, self.max_block):.1f} 秒" if retry_after is not None else ""
+        logging.warning(f"{host} 限流，速率降為 {rate:.2f} 次/秒{wait}")
+
+    def is_throttled(self, host: str) -> bool:
+        """
+        host 是否正在限流中：Retry-After 暫停期間，或最近 throttle_window 秒內曾遭限流
+        """
+        with self._lock:
+            st = self._hosts.get(host.lower())
+            if st is None:
+                return False
+            now = time.monotonic()
+            return now < st.blocked_until or (st.last_throttle is not None and now - st.last_throttle < self.throttle_window)
+
+    def report(self, host: str, status_code: int, resp=None):
+        """
+        依 HTTP 狀態碼回報結果：限流狀態碼視為限流，其餘 2xx/3xx 視為成功
+        """
+        if status_code in THROTTLE_STATUS:
+            self.throttled(host, retry_after_seconds(resp))
+        elif status_code < 400:
+            self.success(host)
+
+    def snapshot(self) -> dict:
+        """
+        各 host 目前速率（次/秒）與成功 / 限流次數
+        """
+        with self._lock:
+            return {host: {"rate": st.rate, "successes": st.successes, "throttles": st.throttles}
+                    for host, st in self._hosts.items()}
+
+    def log_rates(self):
+        for host, st in sorted(self.snapshot().items()):
+            logging.info(f"{host}: 目前速率 {st['rate']:.2f} 次/秒，成功 {st['successes']}，限流 {st['throttles']}")
+
+
+_limiter = AdaptiveRateLimiter()
+
+
+def get_limiter() -> AdaptiveRateLimiter:
+    return _limiter
+
+
+def configure_rate_limits(initial_rate: float | None = None, max_rate: float | None = None):
+    """
+    :param initial_rate: 新 host 的起始速率（次/秒）
+    :param max_rate: 速率上限
+    """
+    if initial_rate is not None and initial_rate > 0:
+        _limiter.initial_rate = initial_rate
+    if max_rate is not None and max_rate > 0:
+        _limiter.max_rate = max_rate
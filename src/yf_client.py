@@ -1,50 +1,424 @@
 import logging
-import os
+import time
 
+import numpy as np
 import pandas as pd
 import yfinance as yf
+from yfinance import shared as yf_shared
+from yfinance.exceptions import YFRateLimitError
 
-from Indicator import apply_technical_indicators
+from Indicator import apply_technical_indicators, apply_technical_indicators_incremental, apply_technical_indicators_panel, resolve_columns
+from bar_resample import compare_bars, log_comparison, resample_bars
+from concurrency import upstream_slot
+from deadline import request_timeout
+from manifest import note_failure
+from metrics import get_metrics
+from output_io import write_frame
+from price_cache import BarStore
+from rate_limit import get_limiter
 
 # 保留原 yfinance_data 實作，僅搬移並確保不與外部套件命名衝突
 
-def get_yfinance_data(stock_id):
+# 各 interval 預設下載區間與 Yahoo 可回溯上限（天）
+_PERIODS = {"1d": "1y", "1m": "7d", "5m": "60d", "15m": "60d", "30m": "60d", "60m": "60d"}
+_MAX_LOOKBACK_DAYS = {"1d": None, "1m": 7, "5m": 60, "15m": 60, "30m": 60, "60m": 60}
+_YAHOO_HOST = "query2.finance.yahoo.com"
+_YAHOO_TIMEOUT = 10  # yfinance 預設逾時
+_RATE_LIMIT_MARKERS = ("Too Many Requests", "Rate limited")
+
+
+def _yahoo_call(fn, *args, **kwargs):
+    """
+    經由上游名額與自適應速率呼叫 yfinance；YFRateLimitError 時回報限流
+    """
+    limiter = get_limiter()
+    limiter.acquire(_YAHOO_HOST)
+    kwargs["timeout"] = request_timeout(kwargs.get("timeout", _YAHOO_TIMEOUT))
+    # yfinance 不提供回應大小，以回傳的 K 棒數記錄於 yahoo_rows
+    start = time.perf_counter()
+    try:
+        with upstream_slot("yahoo"):
+            result = fn(*args, **kwargs)
+    except YFRateLimitError:
+        get_metrics().record_request("yahoo", time.perf_counter() - start, error=True)
+        limiter.throttled(_YAHOO_HOST)
+        raise
+    except Exception:
+        get_metrics().record_request("yahoo", time.perf_counter() - start, error=True)
+        raise
+    get_metrics().record_request("yahoo", time.perf_counter() - start)
+    get_metrics().add("yahoo_rows", len(result))
+    limiter.success(_YAHOO_HOST)
+    return result
+
+
+def _has_corporate_action(df):
+    # 除權息或分割會讓 auto_adjust 的歷史價格整段重算，此時快取失效
+    for col in ("Dividends", "Stock Splits"):
+        if col in df.columns and (df[col].fillna(0) != 0).any():
+            return True
+    return False
+
+
+def _incremental_start(cached, interval, force_full=False):
+    # 回傳增量下載的起點；快取為空或已超出 Yahoo 可回溯區間時回傳 None（完整下載）
+    if cached.empty or force_full:
+        return None
+    last = cached.index[-1]
+    lookback = _MAX_LOOKBACK_DAYS[interval]
+    now = pd.Timestamp.now(tz=last.tz)
+    if lookback is None or last > now - pd.Timedelta(days=lookback - 1):
+        # 最後一根可能尚未收盤，從該根開始重抓
+        return last
+    return None
+
+
+def _store_fetched(store, ticker_str, interval, cached, fresh, start, force_full=False):
+    """
+    將下載結果併入快取
+    :return: (合併後 K 棒, 是否需要因除權息/分割重新完整下載)
+    """
+    if start is None:
+        logging.info(f"{ticker_str} {interval} 完整下載 {len(fresh)} 根")
+    else:
+        logging.info(f"{ticker_str} {interval} 增量下載 {len(fresh)} 根（自 {start}）")
+    if start is not None and _has_corporate_action(fresh):
+        logging.info(f"{ticker_str} {interval} 偵測到除權息/分割，需重新下載完整歷史")
+        return fresh, True
+    if force_full and not cached.empty:
+        # 調整後價格基準改變，舊快取整段作廢；1m 超出 Yahoo 區間的歷史無法重算，只能捨棄
+        cached = pd.DataFrame()
+    return store.merge(ticker_str, interval, fresh, cached=cached), False
+
+
+def _fetch_history(tkr, ticker_str, interval, store=None, force_full=False):
+    """
+    抓取單一 interval 的 K 棒；有快取時僅向 Yahoo 要求最後一根之後的資料
+    :param tkr: yf.Ticker
+    :param ticker_str: 例如 2330.TW
+    :param interval: 1d / 1m / 5m ...
+    :param store: BarStore，None 表示不使用快取
+    :param force_full: 忽略快取尾端，重新下載完整區間
+    :return: (完整 K 棒, 是否出現除權息/分割)
+    """
+    period = _PERIODS[interval]
+    if store is None:
+        return _yahoo_call(tkr.history, period=period, interval=interval, auto_adjust=True), False
+
+    cached = store.load(ticker_str, interval)
+    start = _incremental_start(cached, interval, force_full)
+    if start is None:
+        fresh = _yahoo_call(tkr.history, period=period, interval=interval, auto_adjust=True)
+    else:
+        fresh = _yahoo_call(tkr.history, start=start, interval=interval, auto_adjust=True)
+    merged, corporate_action = _store_fetched(store, ticker_str, interval, cached, fresh, start, force_full)
+    if corporate_action:
+        merged, _ = _fetch_history(tkr, ticker_str, interval, store, force_full=True)
+    return merged, corporate_action
+
+
+def _trim_to_period(df, interval):
+    # 輸出維持原本的區間；1m 保留快取中超過 7 日的歷史
+    if df.empty or interval == "1m":
+        return df
+    days = 365 if interval == "1d" else _MAX_LOOKBACK_DAYS[interval]
+    cutoff = pd.Timestamp.now(tz=df.index.tz) - pd.Timedelta(days=days)
+    return df[df.index >= cutoff]
+
+
+_INTRADAY_INTERVALS = ["5m", "15m", "30m", "60m"]
+# 可由 5m 精確合成、不需另外下載的 interval
+_DERIVED_INTERVALS = ["15m", "30m", "60m"]
+
+
+def _fetch_intervals(derive_intraday):
+    # 需要向 Yahoo 下載的分鐘線 interval
+    return ["5m"] if derive_intraday else _INTRADAY_INTERVALS
+
+
+def _assemble_intraday(ticker_str, fetched, derive_intraday, reference=None, trim=True):
+    """
+    組出 intraday 輸出：各 interval 裁切至 60 日並加上 Interval 欄位
+    :param fetched: {interval: 已下載的 K 棒}
+    :param derive_intraday: True 時 15m/30m/60m 由 5m 合成
+    :param reference: {interval: Yahoo 原生 K 棒}，提供時與合成結果比對
+    :param trim: False 時保留快取中的完整歷史（增量指標計算後才裁切）
+    """
+    frames = dict(fetched)
+    if derive_intraday:
+        base = frames.get("5m", pd.DataFrame())
+        base = _trim_to_period(base, "5m") if trim else base
+        for iv in _DERIVED_INTERVALS:
+            frames[iv] = resample_bars(base, iv) if not base.empty else pd.DataFrame()
+            ref = (reference or {}).get(iv)
+            if ref is not None and not ref.empty:
+                log_comparison(ticker_str, iv, compare_bars(frames[iv], _trim_to_period(ref, iv)))
+    intraday = []
+    for iv in _INTRADAY_INTERVALS:
+        df_iv = frames.get(iv, pd.DataFrame())
+        df_iv = _trim_to_period(df_iv, iv) if trim else df_iv
+        if not df_iv.empty:
+            df_iv = df_iv.copy()
+            df_iv['Interval'] = iv
+            intraday.append(df_iv)
+    return pd.concat(intraday) if intraday else pd.DataFrame()
+
+
+def get_yfinance_data(stock_id, cache_dir=None, derive_intraday=True, verify_resample=False, trim=True):
     ticker_str = f"{stock_id}.TW"
     tkr = yf.Ticker(ticker_str)
+    store = BarStore(cache_dir) if cache_dir else None
     result = {}
+    force_full = False
     try:
-        result['daily'] = tkr.history(period="1y", interval="1d", auto_adjust=True)
+        # 日線出現除權息/分割時，其餘 interval 的快取也一併重新下載
+        daily, force_full = _fetch_history(tkr, ticker_str, "1d", store)
+        result['daily'] = _trim_to_period(daily, "1d") if trim else daily
     except Exception as e:
         logging.error(f"yfinance daily 抓取失敗 {ticker_str}: {e}")
+        note_failure()
         result['daily'] = pd.DataFrame()
     try:
-        result['1m_7d'] = tkr.history(period="7d", interval="1m", auto_adjust=True)
+        result['1m_7d'], _ = _fetch_history(tkr, ticker_str, "1m", store, force_full=force_full)
     except Exception as e:
         logging.error(f"yfinance 1m_7d 抓取失敗 {ticker_str}: {e}")
+        note_failure()
         result['1m_7d'] = pd.DataFrame()
 
-    intervals = ["5m", "15m", "30m", "60m"]
-    intraday = []
-    for iv in intervals:
+    fetched = {}
+    for iv in _fetch_intervals(derive_intraday):
         try:
-            df_iv = tkr.history(period="60d", interval=iv, auto_adjust=True)
-            if not df_iv.empty:
-                df_iv['Interval'] = iv
-                intraday.append(df_iv)
+            fetched[iv], _ = _fetch_history(tkr, ticker_str, iv, store, force_full=force_full)
         except Exception as e:
             logging.error(f"yfinance {iv} 抓取失敗 {ticker_str}: {e}")
-    result['intraday'] = pd.concat(intraday) if intraday else pd.DataFrame()
+            note_failure()
+    reference = {}
+    if derive_intraday and verify_resample:
+        # 測試模式：另外向 Yahoo 取原生 K 棒比對，不寫入快取
+        for iv in _DERIVED_INTERVALS:
+            try:
+                reference[iv], _ = _fetch_history(tkr, ticker_str, iv)
+            except Exception as e:
+                logging.error(f"yfinance {iv} 比對用資料抓取失敗 {ticker_str}: {e}")
+    result['intraday'] = _assemble_intraday(ticker_str, fetched, derive_intraday, reference, trim=trim)
     return result
 
 
-def yfinance_data(stock_id, output_dir):
+# --------------------------------------------------
+# 批次模式：同一 interval 一次下載多檔股票
+# --------------------------------------------------
+_BATCH_COLUMNS = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+_EXCHANGE_TZ = "Asia/Taipei"
+
+
+def _split_batch_frame(data, ticker_str):
+    # 從 yf.download 的 (Ticker, Price) 多層欄位中取出單一 ticker，還原成 Ticker.history 的格式
+    if data is None or data.empty or ticker_str not in data.columns.get_level_values(0):
+        return pd.DataFrame()
+    df = data[ticker_str].dropna(how='all')
+    if df.empty:
+        return df
+    df = df[[c for c in _BATCH_COLUMNS if c in df.columns]].copy()
+    df.columns.name = None
+    if df.index.tz is not None:
+        df.index = df.index.tz_convert(_EXCHANGE_TZ)
+    if 'Volume' in df.columns and not df['Volume'].isna().any():
+        df['Volume'] = df['Volume'].astype('int64')
+    return df
+
+
+def download_interval_batch(stock_ids, interval, start=None):
+    """
+    以單次 yf.download 抓取多檔股票同一 interval 的 K 棒
+    :param stock_ids: 股票代碼清單（不含 .TW）
+    :param interval: 1d / 1m / 5m ...
+    :param start: 起始時間；None 時使用該 interval 的預設區間
+    :return: ({stock_id: DataFrame}, {stock_id: 錯誤訊息})
+    """
+    tickers = [f"{sid}.TW" for sid in stock_ids]
+    frames, failures = {}, {}
+    try:
+        limiter = get_limiter()
+        limiter.acquire(_YAHOO_HOST)
+        t0 = time.perf_counter()
+        with upstream_slot("yahoo"):
+            kwargs = {"start": start} if start is not None else {"period": _PERIODS[interval]}
+            data = yf.download(tickers, interval=interval, group_by='ticker', auto_adjust=True,
+                               actions=True, ignore_tz=False, progress=False, **kwargs)
+        elapsed = time.perf_counter() - t0
+    except Exception as e:
+        logging.error(f"yfinance 批次 {interval} 抓取失敗（{len(tickers)} 檔）: {e}")
+        return {sid: pd.DataFrame() for sid in stock_ids}, {sid: str(e) for sid in stock_ids}
+    # yf.download 不拋出例外：由回傳資料判斷各檔是否失敗（缺少該 ticker 的欄位或整組皆為 NaN）
+    # yfinance 私有的 shared._ERRORS 僅用來補充錯誤訊息與辨識限流，不同版本可能沒有
+    hints = getattr(yf_shared, "_ERRORS", None)
+    hints = dict(hints) if isinstance(hints, dict) else {}
+    for sid, ticker_str in zip(stock_ids, tickers):
+        frames[sid] = _split_batch_frame(data, ticker_str)
+        if frames[sid].empty:
+            failures[sid] = hints.get(ticker_str.upper()) or "回傳資料中沒有此股票的 K 棒"
+    get_metrics().record_request("yahoo", elapsed, error=bool(failures))
+    get_metrics().add("yahoo_rows", len(data))
+    if any(marker in str(err) for err in hints.values() for marker in _RATE_LIMIT_MARKERS):
+        limiter.throttled(_YAHOO_HOST)
+    else:
+        limiter.success(_YAHOO_HOST)
+    return frames, failures
+
+
+def get_yfinance_data_batch(stock_ids, cache_dir=None, derive_intraday=True, verify_resample=False, trim=True):
+    """
+    批次版 get_yfinance_data：每個 interval 對整批股票只呼叫一次 yf.download
+    :param stock_ids: 股票代碼清單
+    :param cache_dir: 價格快取資料夾，None 表示不使用快取
+    :return: ({stock_id: {'daily', '1m_7d', 'intraday'}}, {stock_id: [失敗的 interval 說明]})
+    """
+    store = BarStore(cache_dir) if cache_dir else None
+    failures: dict[str, list[str]] = {}
+    bars: dict[str, dict[str, pd.DataFrame]] = {sid: {} for sid in stock_ids}
+    force_full: set[str] = set()
+
+    for interval in ["1d", "1m"] + _fetch_intervals(derive_intraday):
+        cached, starts = {}, {}
+        if store is not None:
+            for sid in stock_ids:
+                cached[sid] = store.load(f"{sid}.TW", interval)
+                starts[sid] = _incremental_start(cached[sid], interval, force_full=sid in force_full)
+        # 任一檔需完整下載時整批使用預設區間，否則從最早的快取尾端開始
+        if store is None or any(v is None for v in starts.values()):
+            batch_start = None
+        else:
+            batch_start = min(starts.values())
+        frames, errs = download_interval_batch(stock_ids, interval, start=batch_start)
+        for sid, err in errs.items():
+            logging.warning(f"yfinance 批次 {interval} 失敗 {sid}.TW: {err}")
+            failures.setdefault(sid, []).append(f"{interval}: {err}")
+
+        for sid in stock_ids:
+            fresh = frames.get(sid, pd.DataFrame())
+            if sid in errs or store is None:
+                bars[sid][interval] = fresh
+                continue
+            start = starts[sid]
+            if start is not None and not fresh.empty:
+                # 批次起點取最早者，只保留本檔快取尾端之後的部分
+                fresh = fresh[fresh.index >= start]
+            merged, corporate_action = _store_fetched(store, f"{sid}.TW", interval, cached[sid], fresh, start,
+                                                      force_full=sid in force_full)
+            if corporate_action:
+                # 個別重新完整下載，不拖累同批其他股票
+                merged, _ = _fetch_history(yf.Ticker(f"{sid}.TW"), f"{sid}.TW", interval, store, force_full=True)
+                if interval == "1d":
+                    force_full.add(sid)
+            bars[sid][interval] = merged
+
+    reference = {sid: {} for sid in stock_ids}
+    if derive_intraday and verify_resample:
+        for iv in _DERIVED_INTERVALS:
+            frames, _ = download_interval_batch(stock_ids, iv)
+            for sid, df in frames.items():
+                reference[sid][iv] = df
+
+    result = {}
+    for sid in stock_ids:
+        per = bars[sid]
+        fetched = {iv: per[iv] for iv in _INTRADAY_INTERVALS if iv in per}
+        result[sid] = {
+            'daily': _trim_to_period(per.get("1d", pd.DataFrame()), "1d") if trim else per.get("1d", pd.DataFrame()),
+            '1m_7d': per.get("1m", pd.DataFrame()),
+            'intraday': _assemble_intraday(f"{sid}.TW", fetched, derive_intraday, reference[sid], trim=trim),
+        }
+    return result, failures
+
+
+def apply_panel_indicators(price_data):
+    """
+    批次模式：同一種 K 棒（日線、1m、各 intraday interval）的所有股票一次計算技術指標
+    :param price_data: {stock_id: {'daily', '1m_7d', 'intraday'}}，get_yfinance_data_batch 的結果
+    :return: 相同結構、已含指標欄位；交給 yfinance_data(indicators_computed=True) 直接輸出
+    """
+    groups: dict[tuple[str, str], dict[str, pd.DataFrame]] = {}
+    for sid, frames in price_data.items():
+        for label, df in frames.items():
+            if df.empty:
+                continue
+            if label == 'intraday':
+                for interval_value, group_df in df.groupby('Interval'):
+                    groups.setdefault((label, interval_value), {})[sid] = group_df
+            else:
+                groups.setdefault((label, ""), {})[sid] = df
+
+    computed: dict[tuple[str, str], dict[str, pd.DataFrame]] = {}
+    with get_metrics().stage("indicators"):
+        for group_key, frames in groups.items():
+            computed[group_key] = apply_technical_indicators_panel(frames)
+
+    result = {}
+    for sid, frames in price_data.items():
+        out = {}
+        for label, df in frames.items():
+            if df.empty:
+                out[label] = df
+            elif label == 'intraday':
+                parts = [computed[(label, iv)][sid] for iv in _INTRADAY_INTERVALS if sid in computed.get((label, iv), {})]
+                out[label] = pd.concat(parts) if parts else pd.DataFrame()
+            else:
+                out[label] = computed[(label, "")][sid]
+        result[sid] = out
+    return result
+
+
+def _incremental_indicators(df, store, ticker_str, key):
+    """
+    以快取的指標狀態增量計算；已納入狀態的 K 棒若被改寫（例如除權息重算）則完整重算
+    :param key: 快取鍵，例如 daily / intraday_5m
+    """
+    prev, state = store.load_indicators(ticker_str, key)
+    if prev is not None and state is not None:
+        last = pd.Timestamp(state['last_index'])
+        head = prev[prev.index <= last]
+        old = df[df.index <= last]
+        if head.index.equals(old.index):
+            old_price, _, _, old_vol = resolve_columns(old)
+            head_price, _, _, head_vol = resolve_columns(head)
+            if np.array_equal(old_price.to_numpy(dtype=float), head_price.to_numpy(dtype=float), equal_nan=True) and \
+                    np.array_equal(old_vol.to_numpy(dtype=float), head_vol.to_numpy(dtype=float), equal_nan=True):
+                new_rows = df[df.index > last]
+                ind_new, state = apply_technical_indicators_incremental(new_rows, state)
+                df_ind = pd.concat([head, ind_new])
+                store.save_indicators(ticker_str, key, df_ind, state)
+                logging.info(f"{ticker_str} {key} 指標增量更新 {len(new_rows)} 根")
+                return df_ind
+        logging.info(f"{ticker_str} {key} 歷史 K 棒有變動，指標完整重算")
+    df_ind, state = apply_technical_indicators_incremental(df)
+    store.save_indicators(ticker_str, key, df_ind, state)
+    return df_ind
+
+
+def yfinance_data(stock_id, output_dir, cache_dir=None, price_data=None, derive_intraday=True, verify_resample=False, incremental_indicators=False, output_format="csv", indicators_computed=False):
     # 調試資訊
     try:
         import yfinance as _yf_check
         logging.info(f"yfinance module file: {getattr(_yf_check, '__file__', None)}; has Ticker: {hasattr(_yf_check, 'Ticker')}")
     except Exception as _e:
         logging.warning(f"無法檢查 yfinance 模組: {_e}")
-    price_data = get_yfinance_data(stock_id)
+    # 增量指標需在完整快取歷史上計算，輸出前再裁切區間
+    incremental = incremental_indicators and cache_dir is not None
+    store = BarStore(cache_dir) if incremental else None
+    ticker_str = f"{stock_id}.TW"
+
+    def _indicators(frame, key, interval):
+        if indicators_computed:
+            # price_data 已由 apply_panel_indicators 計算過
+            return frame
+        with get_metrics().stage("indicators"):
+            if not incremental:
+                return apply_technical_indicators(frame.copy())
+            return _trim_to_period(_incremental_indicators(frame, store, ticker_str, key), interval)
+
+    if price_data is None:
+        price_data = get_yfinance_data(stock_id, cache_dir=cache_dir, derive_intraday=derive_intraday,
+                                       verify_resample=verify_resample, trim=not incremental)
     for label, df in price_data.items():
         try:
             if df.empty:
@@ -53,21 +427,19 @@ def yfinance_data(stock_id, output_dir):
             if label == 'intraday':
                 temp_processed_dfs = {}
                 for interval_value, group_df in df.groupby('Interval'):
-                    group_df_ind = apply_technical_indicators(group_df.copy())
+                    group_df_ind = _indicators(group_df, f"intraday_{interval_value}", interval_value)
                     temp_processed_dfs[interval_value] = group_df_ind
-                desired_interval_order = ["5m", "15m", "30m", "60m"]
                 processed_intraday_dfs_ordered = [
-                    temp_processed_dfs[iv] for iv in desired_interval_order if iv in temp_processed_dfs
+                    temp_processed_dfs[iv] for iv in _INTRADAY_INTERVALS if iv in temp_processed_dfs
                 ]
                 df_ind = pd.concat(processed_intraday_dfs_ordered) if processed_intraday_dfs_ordered else pd.DataFrame()
                 if df_ind.empty:
                     logging.warning(f"{stock_id} intraday 無有效 interval，跳過輸出")
                     continue
             else:
-                df_ind = apply_technical_indicators(df.copy())
-            file_name = f"yfinance_{stock_id}_{label}.csv"
-            os.makedirs(output_dir, exist_ok=True)
-            df_ind.to_csv(os.path.join(output_dir, file_name), encoding='utf-8-sig')
+                df_ind = _indicators(df, label, "1d" if label == 'daily' else "1m")
+            file_name = write_frame(df_ind, output_dir, f"yfinance_{stock_id}_{label}", fmt=output_format)
             logging.info(f"已輸出 {file_name} 共 {len(df_ind)} 筆資料")
         except Exception as e:
             logging.error(f"yfinance 資料處理/輸出失敗 {stock_id} {label}: {e}")
+            note_failure()
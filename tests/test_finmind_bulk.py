@@ -0,0 +1,79 @@
+import sys
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from finmind import BULK_DATASETS, FinMindFetcher, bulk_prefetch, finmind_data  # noqa: E402
+from finmind_store import FinMindStore  # noqa: E402
+
+STOCKS = ("2330", "2317")
+
+
+class FakeClient:
+    """
+    代替 FinMindClient：全市場請求（無 data_id）每個交易日回傳各股票一筆，並記錄請求的日期
+    """
+    token = None
+
+    def __init__(self):
+        self.market_days: dict[str, list[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, dataset, data_id=None, start_date=None, end_date=None):
+        if data_id is not None:
+            return pd.DataFrame()
+        with self._lock:
+            self.market_days.setdefault(dataset, []).append(start_date)
+        index = pd.DatetimeIndex([pd.Timestamp(start_date)] * len(STOCKS), name="date")
+        return pd.DataFrame({"stock_id": list(STOCKS), "value": 1.0}, index=index)
+
+
+def _run(store_dir: Path, out_dir: Path, start: str) -> FakeClient:
+    # 每次執行使用新的 FinMindStore（同一實例在單次執行內只同步一次）
+    store = FinMindStore(store_dir)
+    client = FakeClient()
+    fetcher = FinMindFetcher(client=client)
+    bulk_prefetch(fetcher, list(STOCKS), start, store=store)
+    for stock_id in STOCKS:
+        finmind_data(stock_id, start, None, str(out_dir / stock_id), fetcher=fetcher, store=store)
+    return client
+
+
+def test_second_run_only_fetches_the_tail(tmp_path):
+    today = pd.Timestamp.today().normalize()
+    start = (today - pd.Timedelta(days=30)).strftime('%Y-%m-%d')
+    store = FinMindStore(tmp_path / "store")
+
+    first = _run(store.cache_dir, tmp_path / "run1", start)
+    full_days = len(pd.bdate_range(start, today))
+    for dataset in BULK_DATASETS:
+        assert len(first.market_days[dataset]) == full_days
+
+    second = _run(store.cache_dir, tmp_path / "run2", start)
+    watermark = min(store.load(dataset, sid).index.max() for dataset in BULK_DATASETS for sid in STOCKS)
+    for dataset in BULK_DATASETS:
+        days = second.market_days[dataset]
+        assert len(days) == len(pd.bdate_range(watermark, today))
+        assert min(days) >= watermark.strftime('%Y-%m-%d')
+        # 本地歷史與第一次相同，沒有因只下載尾段而缺資料
+        for sid in STOCKS:
+            assert len(store.load(dataset, sid)) == full_days
+
+
+def test_stock_without_history_falls_back_to_full_range(tmp_path):
+    today = pd.Timestamp.today().normalize()
+    start = (today - pd.Timedelta(days=30)).strftime('%Y-%m-%d')
+    store = FinMindStore(tmp_path / "store")
+    _run(store.cache_dir, tmp_path / "run1", start)
+    for dataset in BULK_DATASETS:
+        store._path(dataset, STOCKS[1]).unlink()
+
+    client = _run(store.cache_dir, tmp_path / "run2", start)
+    full_days = len(pd.bdate_range(start, today))
+    for dataset in BULK_DATASETS:
+        assert len(client.market_days[dataset]) == full_days
+        for sid in STOCKS:
+            assert len(store.load(dataset, sid)) == full_days